@@ -79,6 +79,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # A file rather than the default in-memory database, so that the tests
+        # of ingesting with several worker processes can share it.
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
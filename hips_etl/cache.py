@@ -0,0 +1,112 @@
+import functools
+import hashlib
+import importlib.resources
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from .logging import logger
+from .utils import ArchiveMember, decompress, open_source
+
+# Bump this when the shape of the cached validation output changes, so that
+# entries written by older code are no longer used.
+cache_version = 4
+
+
+def roi_digest(meta_file: Path | ArchiveMember, props_file: Path | ArchiveMember) -> str:
+    """
+    Compute a hex digest of the data of a nucleiMeta/nucleiProps file pair.
+
+    Compressed files are hashed by their decompressed contents, so the digest
+    does not depend on how the files are stored.
+    """
+    hasher = hashlib.sha256()
+    for path in (meta_file, props_file):
+        with open_source(path) as raw:
+            f = decompress(raw, path.name)
+            while chunk := f.read(1 << 20):
+                hasher.update(chunk)
+        hasher.update(b"\0")
+
+    return hasher.hexdigest()
+
+
+def file_params(path: Path | ArchiveMember) -> tuple:
+    """Return the path, size and modification time of a file or archive member."""
+    if isinstance(path, ArchiveMember):
+        return (file_params(path.archive), path.name)
+
+    stat = path.stat()
+    return (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+
+def cached_roi_digest(
+    cache_dir: Path, meta_file: Path | ArchiveMember, props_file: Path | ArchiveMember
+) -> str:
+    """
+    Return the `roi_digest` of a file pair, reusing it while the files are unchanged.
+
+    The digest is stored in `cache_dir` under the path, size and modification
+    time of both files (for archive members, of the archive), so unchanged
+    files are not read at all; otherwise it is computed and stored.
+    """
+    params = ("digest", file_params(meta_file), file_params(props_file))
+    key = hashlib.sha256(repr(params).encode()).hexdigest()
+    digest = load(cache_dir, key)
+    if digest is None:
+        digest = roi_digest(meta_file, props_file)
+        store(cache_dir, key, digest)
+
+    return digest
+
+
+@functools.cache
+def schema_version() -> str:
+    """Compute a digest of the field definitions that validation depends on."""
+    hasher = hashlib.sha256()
+    fields_dir = importlib.resources.files(__package__) / "fields"
+    for path in sorted(fields_dir.iterdir(), key=lambda p: p.name):
+        if path.name.endswith(".json"):
+            hasher.update(path.name.encode())
+            hasher.update(path.read_bytes())
+
+    return hasher.hexdigest()
+
+
+def cache_key(digest: str, filename: str, image_name: str, skip_missing: bool = False) -> str:
+    """
+    Compute the cache key for validating a nucleiMeta/nucleiProps file pair.
+
+    The key covers the `roi_digest` of the files, the field definitions, and
+    the other arguments of the validation, so a change to any of them gives a
+    different key.
+    """
+    params = (cache_version, schema_version(), digest, filename, image_name, skip_missing)
+    return hashlib.sha256(repr(params).encode()).hexdigest()
+
+
+def load(cache_dir: Path, key: str):
+    """Load a cached value, returning None if there is no usable entry."""
+    try:
+        with open(cache_dir / f"{key}.pickle", "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError) as e:
+        logger.warning("Ignoring unreadable cache entry %s: %s", key, e)
+        return None
+
+
+def store(cache_dir: Path, key: str, value):
+    """
+    Store a value in the cache.
+
+    The entry is written to a temporary file first and then moved into place,
+    so that concurrent readers never see a partially written entry.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(f.name, cache_dir / f"{key}.pickle")
@@ -0,0 +1,124 @@
+from array import array
+import csv
+import io
+from itertools import chain
+import mmap
+from pathlib import Path
+from typing import Literal
+
+from .profiling import timer
+from .types import type_convert_column, types
+
+# Approximate number of bytes tokenized at a time.
+block_bytes = 8 * 1024 * 1024
+
+
+def _text(value: bytes | str | None) -> str | None:
+    """Decode a field value, if it is still a bytes object."""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _tokenize(block: bytes) -> list[list[bytes] | list[str]]:
+    """
+    Split a block of whole CSV lines into rows of fields.
+
+    Fields are split straight from the bytes, without decoding them. Blocks
+    with quoted fields are left to the `csv` module, and give str fields.
+    Blank lines are skipped, as by `read_csv`.
+    """
+    if b'"' in block:
+        with io.TextIOWrapper(io.BytesIO(block), newline="") as f:
+            return [row for row in csv.reader(f) if row]
+
+    lines = block.split(b"\n")
+    if b"\r" in block:
+        lines = [line.rstrip(b"\r") for line in lines]
+
+    return [line.split(b",") for line in lines if line]
+
+
+def _convert_column(
+    values: tuple, key: str, type: Literal["meta", "props"], first_row: int
+) -> array | list | None:
+    """
+    Convert a column of raw field values.
+
+    Numeric columns are parsed straight from the raw values into an array.
+    Other columns, and numeric columns with invalid values, are decoded and
+    converted by `type_convert_column` so that the same values are accepted
+    and the same warnings are issued.
+    """
+    conversion_type = types[type].get(key)
+    try:
+        match conversion_type:
+            case "int":
+                return array("q", map(int, values))
+            case "float":
+                return array("d", map(float, values))
+            case "intfloat":
+                floats = array("d", map(float, values))
+                if all(map(float.is_integer, floats)):
+                    return array("q", map(int, floats))
+    except (ValueError, TypeError, OverflowError):
+        pass
+
+    values = list(map(_text, values))
+    return type_convert_column(values, key, type, first_row, check_ints=False)
+
+
+def read_typed_range(
+    csv_file: Path,
+    start: int,
+    end: int,
+    header: list[str],
+    type: Literal["meta", "props"],
+    first_row: int = 0,
+) -> tuple[bool, list[tuple] | None]:
+    """
+    Read and type convert the rows of a CSV file between two byte offsets.
+
+    The file is memory-mapped and tokenized a block of lines at a time, and
+    numeric columns are parsed straight into typed arrays, so the text of the
+    file is never decoded into str objects as a whole. `start` must be at the
+    beginning of a line (see `csv_chunks`).
+
+    Returns whether the rows fit the header, and the converted rows (None if
+    the conversion failed). As with `read_csv`, short rows are padded out with
+    None. Float columns are not checked for holding only integers; see
+    `warn_integral_float_rows`.
+    """
+    width = len(header)
+    pieces = [[] for _ in header]
+    row = first_row
+
+    if end <= start:
+        return (True, [])
+
+    with open(csv_file, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = start
+            while pos < end:
+                newline = mm.find(b"\n", min(pos + block_bytes, end) - 1, end)
+                block_end = end if newline == -1 else newline + 1
+                with timer.phase("csv_read"):
+                    rows = _tokenize(mm[pos:block_end])
+                timer.count("csv_read", len(rows))
+                pos = block_end
+
+                if any(len(r) > width for r in rows):
+                    return (False, None)
+                if any(len(r) < width for r in rows):
+                    rows = [r + [None] * (width - len(r)) for r in rows]
+                if not rows:
+                    continue
+
+                with timer.phase("type_convert", len(rows)):
+                    for key, values, column in zip(header, zip(*rows), pieces):
+                        converted = _convert_column(values, key, type, row)
+                        if converted is None:
+                            return (True, None)
+                        column.append(converted)
+
+                row += len(rows)
+
+    return (True, list(zip(*map(chain.from_iterable, pieces))))
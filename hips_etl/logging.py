@@ -1,5 +1,9 @@
+from collections import Counter
+import json
 import logging
 import sys
+from typing import Literal
+
 import blessings
 
 
@@ -20,13 +24,14 @@ def _initialize() -> logging.Logger:
             self.supports_color = sys.stdout.isatty() and sys.stderr.isatty()
             super().__init__(*args, **kwargs)
 
-        def format(self, record):
-            record.levelname = record.levelname.ljust(len("CRITICAL"))
-            record.msg = " " * self.spacing + record.msg
-            color = self.__class__.Colors.get(record.levelno, term.normal)
+        def formatMessage(self, record):
+            # `record.message` is recomputed from the record for every
+            # formatting, so the record itself is left untouched.
+            record.message = " " * self.spacing + record.message
             if self.supports_color:
-                record.msg = color(record.msg)
-            return super().format(record)
+                color = self.__class__.Colors.get(record.levelno, term.normal)
+                record.message = color(record.message)
+            return super().formatMessage(record)
 
         def indent(self):
             self.spacing += 2
@@ -37,16 +42,178 @@ def _initialize() -> logging.Logger:
                 self.spacing = 0
 
     logger = logging.getLogger(__name__)
-    formatter = HipsFormatter("[%(name)s/%(levelname)s] %(message)s")
+    formatter = HipsFormatter("[%(name)s/%(levelname)-8s] %(message)s")
+    json_formatter = JsonFormatter()
     handler = logging.StreamHandler()
     handler.setFormatter(formatter)
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
 
+    def set_format(format: Literal["text", "json"]):
+        handler.setFormatter(json_formatter if format == "json" else formatter)
+
     logger.indent = formatter.indent
     logger.dedent = formatter.dedent
+    logger.set_format = set_format
 
     return logger
 
 
+class JsonFormatter(logging.Formatter):
+    """Format each log record as a single line of JSON."""
+
+    def format(self, record):
+        entry = {
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if (key := getattr(record, "key", None)) is not None:
+            entry["category"] = key
+        if (summary := getattr(record, "summary", None)) is not None:
+            entry["summary"] = summary
+        if (timings := getattr(record, "timings", None)) is not None:
+            entry["timings"] = timings
+
+        return json.dumps(entry)
+
+
+class Diagnostics(logging.Filter):
+    """
+    Count warnings and errors by category, rate limiting repeated ones.
+
+    The category of a record is its unformatted message, so call sites should
+    pass their arguments separately (`logger.warning("... %s", value)`) rather
+    than formatting the message themselves. Only the first `limit` records of
+    each category are let through; the rest are counted and reported by
+    `log_diagnostics`.
+    """
+
+    def __init__(self, limit: int = 10):
+        self.limit = limit
+        self.reset()
+        super().__init__()
+
+    def reset(self):
+        self.counts = Counter()
+        self.shown = Counter()
+        self.levels = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        # Records that were already counted (in a worker process) carry their
+        # category along with them.
+        if (key := getattr(record, "key", None)) is None:
+            key = record.key = str(record.msg)
+            self.counts[key] += 1
+            self.levels[key] = record.levelno
+
+        if self.shown[key] >= self.limit:
+            return False
+
+        self.shown[key] += 1
+        return True
+
+    def merge(self, other: "Diagnostics"):
+        """Add the counts of records seen by another `Diagnostics`."""
+        self.counts.update(other.counts)
+        self.levels.update(other.levels)
+
+    def summary(self) -> list[dict]:
+        """Return the number of records and suppressed records per category."""
+        return [
+            {
+                "category": key,
+                "level": logging.getLevelName(self.levels[key]),
+                "count": count,
+                "suppressed": count - self.shown[key],
+            }
+            for key, count in self.counts.most_common()
+        ]
+
+
+class RecordCollector(logging.Handler):
+    """
+    Collect log records instead of emitting them.
+
+    The collected records are made picklable so that they can be sent from a
+    worker process back to the parent and replayed with `logger.handle()`.
+    """
+
+    def __init__(self):
+        self.records = []
+        super().__init__()
+
+    def emit(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
 logger = _initialize()
+
+diagnostics = Diagnostics()
+logger.addFilter(diagnostics)
+
+
+def run_captured(limit: int, func, *args) -> tuple:
+    """
+    Call `func(*args)`, capturing its log output instead of emitting it.
+
+    This is meant for running work in a worker process. Returns the result of
+    the call, the captured log records, and a `Diagnostics` with the counts of
+    warnings and errors. Repeated warnings are rate limited to `limit` per
+    category already while capturing, so that they are not all sent back to
+    the parent process. Use `replay` to log the output in the parent.
+    """
+    collector = RecordCollector()
+    captured_diagnostics = Diagnostics(limit=limit)
+    saved = (logger.handlers, logger.filters, logger.propagate)
+    logger.handlers, logger.filters, logger.propagate = (
+        [collector],
+        [captured_diagnostics],
+        False,
+    )
+    try:
+        result = func(*args)
+    finally:
+        logger.handlers, logger.filters, logger.propagate = saved
+
+    return (result, collector.records, captured_diagnostics)
+
+
+def active_diagnostics() -> Diagnostics:
+    """Return the `Diagnostics` currently counting the records of the logger."""
+    for f in logger.filters:
+        if isinstance(f, Diagnostics):
+            return f
+    return diagnostics
+
+
+def replay(records: list[logging.LogRecord], counts: Diagnostics):
+    """Log the output captured by `run_captured`."""
+    active_diagnostics().merge(counts)
+    for record in records:
+        logger.handle(record)
+
+
+def log_diagnostics():
+    """Log a table of the warning and error counts collected so far."""
+    summary = diagnostics.summary()
+    if not summary:
+        return
+
+    lines = ["Diagnostics summary:", f"{'count':>10}  {'level':<8}  category"]
+    for entry in summary:
+        level = entry["level"].lower()
+        lines.append(f"{entry['count']:>10,}  {level:<8}  {entry['category']}")
+        if entry["suppressed"]:
+            lines.append(
+                f"{'':>10}  {'':<8}  ... {entry['suppressed']:,} more similar"
+                f" {level}s suppressed"
+            )
+
+    logger.info("\n".join(lines), extra={"summary": summary})
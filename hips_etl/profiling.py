@@ -0,0 +1,105 @@
+from collections import Counter
+from contextlib import contextmanager
+import time
+from typing import Iterable, Iterator
+
+from .logging import logger
+
+
+class PhaseTimer:
+    """
+    Accumulate the wall-clock time and number of rows of each processing phase.
+
+    Phases may be nested, and timings collected in worker processes are added
+    up with `merge`, so the times of different phases (or of one phase over
+    several processes) can add up to more than the elapsed time.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.rows = Counter()
+
+    @contextmanager
+    def phase(self, name: str, rows: int = 0) -> Iterator[None]:
+        """Time a block of code as (part of) a phase that processes `rows` rows."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+            self.rows[name] += rows
+
+    def count(self, name: str, rows: int):
+        """Add to the number of rows processed by a phase."""
+        self.rows[name] += rows
+
+    @contextmanager
+    def capture(self) -> Iterator["PhaseTimer"]:
+        """
+        Collect the timings of a block separately.
+
+        This is meant for work done in a worker process, whose timings are
+        sent back to the parent and added there with `merge`.
+        """
+        captured = PhaseTimer()
+        saved = (self.seconds, self.calls, self.rows)
+        self.seconds, self.calls, self.rows = captured.seconds, captured.calls, captured.rows
+        try:
+            yield captured
+        finally:
+            self.seconds, self.calls, self.rows = saved
+
+    def iterate(self, items: Iterable, name: str) -> Iterator:
+        """Iterate over `items`, timing the production of each item as a phase."""
+        items = iter(items)
+        done = object()
+        while True:
+            with self.phase(name):
+                item = next(items, done)
+            if item is done:
+                return
+            yield item
+
+    def merge(self, other: "PhaseTimer"):
+        """Add the timings collected by another `PhaseTimer`."""
+        self.seconds.update(other.seconds)
+        self.calls.update(other.calls)
+        self.rows.update(other.rows)
+
+    def report(self) -> list[dict]:
+        """Return the time, number of calls and rows/sec of each phase."""
+        return [
+            {
+                "phase": name,
+                "seconds": seconds,
+                "calls": self.calls[name],
+                "rows": self.rows[name],
+                "rows_per_second": self.rows[name] / seconds if seconds else None,
+            }
+            for name, seconds in self.seconds.most_common()
+        ]
+
+
+timer = PhaseTimer()
+
+
+def log_timings():
+    """Log a table of the phase timings collected so far."""
+    report = timer.report()
+    if not report:
+        return
+
+    lines = ["Timings:", f"{'seconds':>10}  {'calls':>8}  {'rows/s':>12}  phase"]
+    for entry in report:
+        rate = entry["rows_per_second"]
+        rate = f"{rate:>12,.0f}" if rate is not None and entry["rows"] else f"{'':>12}"
+        lines.append(
+            f"{entry['seconds']:>10.3f}  {entry['calls']:>8,}  {rate}  {entry['phase']}"
+        )
+
+    logger.info("\n".join(lines), extra={"timings": report})
@@ -2,15 +2,67 @@ import sys
 
 from generate_nucleus_fields import read_json
 
+# The fields most queries need, which are kept in the nucleus table itself.
+hot_fields = [
+    'Identifier.ObjectCode',
+    'Identifier.Xmin',
+    'Identifier.Ymin',
+    'Identifier.Xmax',
+    'Identifier.Ymax',
+    'Identifier.CentroidX',
+    'Identifier.CentroidY',
+    'Classif.StandardClass',
+    'Classif.SuperClass',
+]
+
+# The groups the other fields are split into, each in its own table joined 1:1
+# with the nucleus table: model name, related name, docstring and the prefixes
+# of the fields in the group.
+feature_groups = [
+    ('NucleusClassification', 'classification', 'Classification probabilities of a nucleus, also before constraints.', ('ClassifProbab.', 'SuperClassifProbab.', 'Unconstrained.')),
+    ('NucleusShape', 'shape', 'Size and shape features of a nucleus.', ('Identifier.', 'Orientation.', 'Size.', 'Shape.')),
+    ('NucleusIntensity', 'intensity', 'Intensity features of a nucleus and its cytoplasm.', ('Nucleus.Intensity.', 'Cytoplasm.Intensity.')),
+    ('NucleusGradient', 'gradient', 'Gradient features of a nucleus and its cytoplasm.', ('Nucleus.Gradient.', 'Cytoplasm.Gradient.')),
+    ('NucleusHaralick', 'haralick', 'Haralick texture features of a nucleus and its cytoplasm.', ('Nucleus.Haralick.', 'Cytoplasm.Haralick.')),
+]
+
 
 def choices(values: list[str]) -> list[tuple[str, str]]:
     return [(x, x) for x in values]
 
 
+def field_group(db_name: str) -> str | None:
+    """Return the model name of the feature group of a field, or None for a field of the nucleus table."""
+    if db_name in hot_fields:
+        return None
+
+    for model_name, _, _, prefixes in feature_groups:
+        if db_name.startswith(prefixes):
+            return model_name
+
+    raise ValueError(f'No feature group for field {db_name}')
+
+
+def print_field(f: dict):
+    field_name = f['django_name']
+    db_name = f['db_name']
+    field_type = f['type']
+
+    if field_type in ['int', 'intfloat']:
+        print(f'    {field_name} = models.IntegerField(db_column="{db_name}")')
+    elif field_type == 'float':
+        print(f'    {field_name} = models.FloatField(db_column="{db_name}")')
+    elif type(field_type) is list:
+        print(f'    {field_name} = models.CharField(max_length={max(len(choice) for choice in field_type)}, choices={choices(field_type)}, db_column="{db_name}")')
+    else:
+        raise ValueError(f'Unknown field type for {f}: {field_type}')
+
+
 def main():
     fields = read_json('../fields/nucleus_fields.json')
 
-    # Print a Django model using the nucleus fields.
+    # Print Django models using the nucleus fields: the nucleus itself, with
+    # the fields most queries need, and a model for each group of features.
     print('from django.db import models')
     print()
     print()
@@ -19,18 +71,21 @@ def main():
     print()
 
     for f in fields:
-        field_name = f['django_name']
-        db_name = f['db_name']
-        field_type = f['type']
-
-        if field_type in ['int', 'intfloat']:
-            print(f'    {field_name} = models.IntegerField(db_column="{db_name}")')
-        elif field_type == 'float':
-            print(f'    {field_name} = models.FloatField(db_column="{db_name}")')
-        elif type(field_type) is list:
-            print(f'    {field_name} = models.CharField(max_length={max(len(choice) for choice in field_type)}, choices={choices(field_type)}, db_column="{db_name}")')
-        else:
-            raise ValueError(f'Unknown field type for {f}: {field_type}')
+        if field_group(f['db_name']) is None:
+            print_field(f)
+
+    for model_name, related_name, docstring, _ in feature_groups:
+        print()
+        print()
+        print(f'class {model_name}(models.Model):')
+        print(f'    """{docstring}"""')
+        print()
+        print(f"    nucleus: Nucleus = models.OneToOneField(Nucleus, on_delete=models.CASCADE, primary_key=True, related_name='{related_name}')")
+        print()
+
+        for f in fields:
+            if field_group(f['db_name']) == model_name:
+                print_field(f)
 
 
 if __name__ == '__main__':
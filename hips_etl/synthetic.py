@@ -0,0 +1,456 @@
+from bisect import bisect
+import bz2
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import lzma
+import math
+from pathlib import Path
+import random
+from typing import BinaryIO, Iterable
+
+from .types import types
+from .utils import get_json_value
+
+# Kinds of defects that can be injected into generated data.
+defect_kinds = ("missing", "duplicate", "off_by_one")
+
+# Compressions the generated CSV files can be written with.
+compressions = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+# Each ROI is divided into tiles x tiles regions of different nucleus density,
+# and each region into square cells holding at most one nucleus.
+tiles = 8
+cell_size = 24
+cell_fill = 0.8
+
+# Number of precomputed nucleus shapes, and of classifications per class.
+shape_pool = 1024
+class_pool = 128
+
+# Relative frequency of each class, and the superclass it belongs to.
+class_weights = {
+    "CancerEpithelium": 0.35,
+    "StromalCellNOS": 0.2,
+    "ActiveStromalCellNOS": 0.08,
+    "TILsCell": 0.15,
+    "ActiveTILsCell": 0.05,
+    "NormalEpithelium": 0.05,
+    "OtherCell": 0.02,
+    "UnknownOrAmbiguousCell": 0.06,
+    "BACKGROUND": 0.04,
+}
+superclasses = {
+    "CancerEpithelium": "EpithelialSuperclass",
+    "NormalEpithelium": "EpithelialSuperclass",
+    "StromalCellNOS": "StromalSuperclass",
+    "ActiveStromalCellNOS": "StromalSuperclass",
+    "TILsCell": "TILsSuperclass",
+    "ActiveTILsCell": "TILsSuperclass",
+    "OtherCell": "OtherSuperclass",
+    "UnknownOrAmbiguousCell": "AmbiguousSuperclass",
+    "BACKGROUND": "BACKGROUND",
+}
+
+# Typical values of the Haralick texture features.
+haralick_means = {
+    "ASM": 0.016,
+    "Contrast": 15.0,
+    "Correlation": 0.5,
+    "SumOfSquares": 15.0,
+    "IDM": 0.28,
+    "SumAverage": 38.0,
+    "SumVariance": 50.0,
+    "SumEntropy": 4.3,
+    "Entropy": 6.2,
+    "DifferenceVariance": 0.004,
+    "DifferenceEntropy": 3.0,
+    "IMC1": -0.3,
+    "IMC2": 0.93,
+}
+
+_geometry = ("Xmin", "Ymin", "Xmax", "Ymax", "CentroidX", "CentroidY")
+
+# Columns of the generated files. The values of the leading columns are
+# computed for each nucleus; the rest come from a precomputed shape (props) or
+# classification (meta).
+_meta_only = get_json_value("meta_only.json")
+meta_class_fields = [
+    key for key in _meta_only if not key.startswith("Unconstrained.Identifier.")
+]
+meta_header = [
+    "",
+    "Identifier.ObjectCode",
+    *(f"Identifier.{key}" for key in _geometry),
+    *(f"Unconstrained.Identifier.{key}" for key in _geometry),
+    *meta_class_fields,
+]
+
+_props_leading = (
+    "slide",
+    "roiname",
+    "Identifier.WeightedCentroidX",
+    "Identifier.WeightedCentroidY",
+)
+props_shape_fields = [
+    key for key in get_json_value("props_only.json") if key not in _props_leading
+]
+props_header = [
+    "",
+    "slide",
+    "roiname",
+    "Identifier.ObjectCode",
+    *(f"Identifier.{key}" for key in _geometry),
+    "Identifier.WeightedCentroidX",
+    "Identifier.WeightedCentroidY",
+    *props_shape_fields,
+]
+
+
+def _probabilities(rng: random.Random, prefix: str, cls: str) -> dict[str, float]:
+    """Draw class and superclass probabilities in which `cls` is the most likely."""
+    probabilities = {c: rng.gammavariate(0.5, 1) for c in class_weights}
+    probabilities[cls] += rng.gammavariate(6, 1)
+    total = sum(probabilities.values())
+
+    values = {}
+    supers = Counter()
+    for c, p in probabilities.items():
+        values[f"{prefix}ClassifProbab.{c}"] = p / total
+        supers[superclasses[c]] += p / total
+    for s, p in supers.items():
+        values[f"{prefix}SuperClassifProbab.{s}"] = p
+
+    # The superclass is the most likely one among those allowed for the field.
+    allowed_supers = set(types["enum_values"]["meta"][f"{prefix}Classif.SuperClass"])
+    values[f"{prefix}Classif.StandardClass"] = cls
+    values[f"{prefix}Classif.SuperClass"] = max(
+        allowed_supers, key=lambda s: supers[s]
+    )
+    return values
+
+
+def _classification(rng: random.Random, cls: str) -> bytes:
+    """Format the classification columns (ending the line) of the meta file for a nucleus of a class."""
+    values = _probabilities(rng, "", cls)
+
+    # The unconstrained classifier has no OtherCell class.
+    unconstrained = types["enum_values"]["meta"]["Unconstrained.Classif.StandardClass"]
+    values |= _probabilities(
+        rng,
+        "Unconstrained.",
+        cls if cls in unconstrained else "UnknownOrAmbiguousCell",
+    )
+
+    formatted = ",".join(
+        value if isinstance(value, str) else repr(value)
+        for value in map(values.__getitem__, meta_class_fields)
+    )
+    return f"{formatted}\n".encode()
+
+
+def _intensity(rng: random.Random, prefix: str, mean: float, std: float) -> dict:
+    """Draw intensity statistics of a nucleus or its cytoplasm."""
+    mean = min(max(rng.gauss(mean, std), 10.0), 245.0)
+    spread = abs(rng.gauss(std / 2, std / 6)) + 1
+    median = round(2 * (mean + rng.gauss(0, spread / 4))) / 2
+    return {
+        f"{prefix}.Min": float(max(0, round(mean - rng.uniform(2, 5) * spread))),
+        f"{prefix}.Max": float(min(255, round(mean + rng.uniform(1, 3) * spread))),
+        f"{prefix}.Mean": mean,
+        f"{prefix}.Median": median,
+        f"{prefix}.MeanMedianDiff": mean - median,
+        f"{prefix}.Std": spread,
+        f"{prefix}.IQR": round(2.7 * spread) / 2,
+        f"{prefix}.MAD": 0.67 * spread,
+        f"{prefix}.Skewness": rng.gauss(-0.7, 0.5),
+        f"{prefix}.Kurtosis": rng.gauss(1.5, 1.5),
+        f"{prefix}.HistEnergy": rng.uniform(0.12, 0.3),
+        f"{prefix}.HistEntropy": rng.uniform(1.4, 2.1),
+    }
+
+
+def _gradient(rng: random.Random, prefix: str, area: int) -> dict:
+    """Draw gradient statistics of a nucleus or its cytoplasm."""
+    canny = rng.randint(0, max(1, area // 3))
+    return {
+        f"{prefix}.Mag.Mean": rng.lognormvariate(3, 0.3),
+        f"{prefix}.Mag.Std": rng.lognormvariate(2.7, 0.4),
+        f"{prefix}.Mag.Skewness": rng.gauss(1.5, 0.7),
+        f"{prefix}.Mag.Kurtosis": rng.gauss(3, 2),
+        f"{prefix}.Mag.HistEntropy": rng.uniform(1.4, 2.0),
+        f"{prefix}.Mag.HistEnergy": rng.uniform(0.15, 0.3),
+        f"{prefix}.Canny.Sum": float(canny),
+        f"{prefix}.Canny.Mean": canny / area,
+    }
+
+
+def _shape(rng: random.Random) -> tuple[int, int, tuple[float, ...], bytes]:
+    """
+    Draw the shape and appearance of a nucleus.
+
+    Returns the width and height of its bounding box, the offsets of its
+    (weighted) centroid from the top left corner of the box, and its formatted
+    shape columns (ending the line) of the props file.
+    """
+    major = min(max(rng.gauss(12, 3), 4), 20)
+    minor = major * rng.uniform(0.5, 0.95)
+    orientation = rng.uniform(-math.pi / 2, math.pi / 2)
+    a, b = major / 2, minor / 2
+    width = max(2, round(2 * math.hypot(a * math.cos(orientation), b * math.sin(orientation))))
+    height = max(2, round(2 * math.hypot(a * math.sin(orientation), b * math.cos(orientation))))
+
+    area = max(1, round(math.pi * a * b))
+    hull = area + rng.randint(0, max(1, area // 20))
+    perimeter = math.pi * (3 * (a + b) - math.sqrt((3 * a + b) * (a + 3 * b)))
+    eccentricity = math.sqrt(1 - (b / a) ** 2)
+    hu1 = (a**2 + b**2) / (4 * math.pi * a * b)
+
+    values = {
+        "Orientation.Orientation": orientation,
+        "Size.Area": float(area),
+        "Size.ConvexHullArea": float(hull),
+        "Size.MajorAxisLength": major,
+        "Size.MinorAxisLength": minor,
+        "Size.Perimeter": perimeter,
+        "Shape.Circularity": 4 * math.pi * area / perimeter**2,
+        "Shape.Eccentricity": eccentricity,
+        "Shape.EquivalentDiameter": math.sqrt(4 * area / math.pi),
+        "Shape.Extent": area / (width * height),
+        "Shape.FractalDimension": rng.gauss(0.9, 0.4),
+        "Shape.MinorMajorAxisRatio": minor / major,
+        "Shape.Solidity": area / hull,
+        "Shape.HuMoments1": hu1,
+        "Shape.WeightedHuMoments1": hu1 * rng.uniform(0.005, 0.007),
+    }
+    for k in range(2, 8):
+        values[f"Shape.HuMoments{k}"] = rng.gauss(0, 1) * (eccentricity * hu1) ** k
+        values[f"Shape.WeightedHuMoments{k}"] = rng.gauss(0, 1) * 0.001**k
+    for k in range(1, 7):
+        values[f"Shape.FSD{k}"] = abs(rng.gauss(0, 0.5 / k))
+
+    values |= _intensity(rng, "Nucleus.Intensity", 165, 25)
+    values |= _intensity(rng, "Cytoplasm.Intensity", 70, 20)
+    values |= _gradient(rng, "Nucleus.Gradient", area)
+    values |= _gradient(rng, "Cytoplasm.Gradient", area)
+    for compartment in ("Nucleus", "Cytoplasm"):
+        for feature, mean in haralick_means.items():
+            value = mean * rng.lognormvariate(0, 0.25)
+            values[f"{compartment}.Haralick.{feature}.Mean"] = value
+            values[f"{compartment}.Haralick.{feature}.Range"] = abs(value) * rng.uniform(0.05, 0.5)
+
+    centroids = (
+        rng.uniform(0.35, 0.65) * width,
+        rng.uniform(0.35, 0.65) * height,
+        rng.uniform(0.3, 0.7) * width,
+        rng.uniform(0.3, 0.7) * height,
+    )
+    formatted = ",".join(repr(float(values[key])) for key in props_shape_fields)
+    return (width, height, centroids, f"{formatted}\n".encode())
+
+
+def roi_layout(rng: random.Random, nuclei: int, roi_size: int) -> tuple[int, list[int]]:
+    """
+    Lay out the nuclei of an ROI over regions of different density.
+
+    Returns the side length of the (square) ROI and the number of nuclei in
+    each of its regions, row by row. The ROI is made larger than `roi_size` if
+    the densest region would not fit its nuclei otherwise.
+    """
+    # Some regions are nearly empty background, the others tissue of varying
+    # density.
+    weights = [
+        0.02 if rng.random() < 0.2 else rng.lognormvariate(0, 0.6)
+        for _ in range(tiles * tiles)
+    ]
+    total = sum(weights)
+    shares = [nuclei * weight / total for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[: nuclei - sum(counts)]:
+        counts[i] += 1
+
+    cells = math.ceil(math.sqrt(max(counts) / cell_fill))
+    return (max(roi_size, tiles * cells * cell_size), counts)
+
+
+def _open_csv(path: Path, compression: str | None) -> BinaryIO:
+    if compression is None:
+        return open(path, "wb")
+    return compressions[compression](path, "wb")
+
+
+def generate_roi(
+    meta_file: Path,
+    props_file: Path,
+    image_name: str,
+    side: int,
+    counts: list[int],
+    seed: str,
+    defect_rate: float = 0.0,
+    defects: Iterable[str] = defect_kinds,
+    compression: str | None = None,
+) -> Counter:
+    """
+    Write the meta and props files of a synthetic ROI.
+
+    The nuclei of each region of the ROI (see `roi_layout`) are placed in
+    randomly chosen cells of a grid over the region, so that they do not
+    overlap, and are mostly of a class that is dominant in the region. Their
+    shapes and classifications are drawn from pools formatted up front, so
+    only the position and identity of each nucleus are formatted per row.
+
+    Each nucleus is given one of the `defects` with probability
+    `defect_rate`. Returns the number of nuclei and of each kind of defect
+    written.
+    """
+    rng = random.Random(seed)
+    defects = list(defects)
+    roi_name = meta_file.name[: meta_file.name.index(".csv")]
+
+    shapes = [_shape(rng) for _ in range(shape_pool)]
+    classes = list(class_weights)
+    classifications = {
+        cls: [_classification(rng, cls) for _ in range(class_pool)] for cls in classes
+    }
+    cumulative = []
+    for weight in class_weights.values():
+        cumulative.append((cumulative[-1] if cumulative else 0) + weight)
+
+    stats = Counter()
+    row = 0
+    code = 0
+    region = side / tiles
+    with _open_csv(meta_file, compression) as meta, _open_csv(props_file, compression) as props:
+        meta.write(",".join(meta_header).encode() + b"\n")
+        props.write(",".join(props_header).encode() + b"\n")
+
+        for tile, count in enumerate(counts):
+            if not count:
+                continue
+
+            dominant = rng.choices(classes, cum_weights=cumulative)[0]
+            grid = math.ceil(math.sqrt(count / cell_fill))
+            cell = region / grid
+            tile_left = (tile % tiles) * region
+            tile_top = (tile // tiles) * region
+
+            meta_lines = []
+            props_lines = []
+            needed = count
+            for index in range(grid * grid):
+                # Choose exactly `count` cells, in order (selection sampling).
+                if rng.random() * (grid * grid - index) >= needed:
+                    continue
+                needed -= 1
+
+                width, height, (cx, cy, wcx, wcy), shape = shapes[int(rng.random() * shape_pool)]
+                left = int(tile_left + (index % grid) * cell + rng.random() * max(0, cell - width))
+                top = int(tile_top + (index // grid) * cell + rng.random() * max(0, cell - height))
+                cls = dominant if rng.random() < 0.6 else classes[bisect(cumulative, rng.random() * cumulative[-1])]
+                classification = classifications[cls][int(rng.random() * class_pool)]
+
+                right = left + width
+                bottom = top + height
+                code += 1 + (rng.random() < 0.1)
+
+                defect = rng.choice(defects) if defects and rng.random() < defect_rate else None
+                if defect == "missing":
+                    values = shape[:-1].split(b",")
+                    values[int(rng.random() * len(values))] = b""
+                    shape = b",".join(values) + b"\n"
+                elif defect == "duplicate" and row:
+                    code = previous
+                elif defect == "off_by_one":
+                    # The props bounding box should end one past the meta one.
+                    if rng.random() < 0.5:
+                        right -= 1
+                    else:
+                        bottom -= 1
+                else:
+                    defect = None
+                if defect is not None:
+                    stats[defect] += 1
+
+                geometry = f"{left}.0,{top}.0,{left + width - 1}.0,{top + height - 1}.0,{left + int(cx)}.0,{top + int(cy)}.0"
+                meta_lines += (f"{code},{code},{geometry},{geometry},".encode(), classification)
+                props_lines += (
+                    f"{row},{image_name},{roi_name},{code}.0,{left}.0,{top}.0,{right}.0,{bottom}.0,"
+                    f"{left + cx!r},{top + cy!r},{left + wcx!r},{top + wcy!r},".encode(),
+                    shape,
+                )
+                previous = code
+                row += 1
+
+            meta.write(b"".join(meta_lines))
+            props.write(b"".join(props_lines))
+
+    stats["nuclei"] = row
+    return stats
+
+
+def generate_hips_dir(
+    data_dir: Path,
+    rois: int,
+    nuclei: int,
+    seed: int = 0,
+    defect_rate: float = 0.0,
+    defects: Iterable[str] = defect_kinds,
+    roi_size: int = 2048,
+    compression: str | None = None,
+    workers: int = 1,
+) -> Counter:
+    """
+    Generate a synthetic HiPS data directory of `rois` ROIs with `nuclei` nuclei each.
+
+    The image is named after the directory. Its ROIs are laid out side by
+    side in a square grid, and the files of each ROI are generated by
+    `generate_roi`, from a seed derived from `seed` and the ROI number, so
+    the same arguments always give the same data. With `workers` > 1, the
+    ROIs are generated in parallel over that many processes.
+
+    Returns the number of ROIs, nuclei and of each kind of defect written.
+    """
+    image_name = data_dir.name
+    suffix = ".csv" if compression is None else f".csv.{compression}"
+    meta_dir = data_dir / "nucleiMeta"
+    props_dir = data_dir / "nucleiProps"
+    meta_dir.mkdir(parents=True, exist_ok=True)
+    props_dir.mkdir(parents=True, exist_ok=True)
+
+    layouts = [
+        roi_layout(random.Random(f"{seed}-{roi}-layout"), nuclei, roi_size)
+        for roi in range(1, rois + 1)
+    ]
+    stride = max(side for side, _ in layouts)
+    columns = math.ceil(math.sqrt(rois))
+
+    tasks = []
+    for roi, (side, counts) in enumerate(layouts, 1):
+        left = (roi - 1) % columns * stride
+        top = (roi - 1) // columns * stride
+        filename = f"{image_name}_roi-{roi}_left-{left}_top-{top}_right-{left + side}_bottom-{top + side}{suffix}"
+        tasks.append(
+            (
+                meta_dir / filename,
+                props_dir / filename,
+                image_name,
+                side,
+                counts,
+                f"{seed}-{roi}",
+                defect_rate,
+                tuple(defects),
+                compression,
+            )
+        )
+
+    stats = Counter(rois=rois)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for roi_stats in executor.map(generate_roi, *zip(*tasks)):
+                stats.update(roi_stats)
+    else:
+        for task in tasks:
+            stats.update(generate_roi(*task))
+
+    return stats
@@ -1,14 +1,47 @@
+import gzip
 import importlib
+import json
+import logging
 import math
+import shutil
+import tarfile
+from unittest.mock import Mock
+import zipfile
 
 from hypothesis import given, strategies as st
-from hips_etl.types import convert_float, convert_int, convert_intfloat
-from hips_etl.utils import get_object_mapping
-from hips_etl.validation import validate_hips_dir
+import pytest
+from hips_etl.logging import JsonFormatter, diagnostics, log_diagnostics
+from hips_etl.types import (
+    convert_float,
+    convert_int,
+    convert_int_column,
+    convert_intfloat,
+    type_convert_columns,
+    type_convert_rows,
+)
+from hips_etl.fastcsv import read_typed_range
+from hips_etl.synthetic import generate_hips_dir
+from hips_etl.utils import csv_chunks, get_object_mapping, read_csv
+from hips_etl import cache, fastcsv, synthetic
+from hips_etl import validation
+from hips_etl.validation import (
+    HipsValidationError,
+    find_violations,
+    preflight_hips_dir,
+    roi_digests,
+    stream_hips_dir,
+    validate_hips_dir,
+)
 
 test_data_dir = importlib.resources.files("hips_etl") / "test_data"
 
 
+@pytest.fixture(autouse=True)
+def reset_diagnostics():
+    # Keep repeated warnings from earlier tests from being rate limited.
+    diagnostics.reset()
+
+
 def test_missing_hips_dir(caplog):
     success = validate_hips_dir(test_data_dir / "nonexisting")
     assert not success
@@ -21,6 +54,30 @@ def test_good_hips_dir(caplog):
     assert "Data directory is valid" in caplog.text
 
 
+def test_stream_good_hips_dir(caplog):
+    rois = list(stream_hips_dir(test_data_dir / "good"))
+    assert [roi["name"] for roi in rois] == ["5"]
+    assert len(rois[0]["nuclei"]) == 9
+    assert "Data directory is valid" in caplog.text
+
+
+def test_stream_invalid_hips_dir(caplog):
+    with pytest.raises(HipsValidationError):
+        list(stream_hips_dir(test_data_dir / "broken_checks"))
+    assert "Data directory is invalid" in caplog.text
+
+
+def test_parallel_hips_dir(caplog):
+    assert validate_hips_dir(test_data_dir / "good", workers=2) == validate_hips_dir(
+        test_data_dir / "good"
+    )
+
+    success = validate_hips_dir(test_data_dir / "duplicate_objectcodes_props", workers=2)
+    assert not success
+    filename = "duplicate_objectcodes_props_roi-5_left-18001_top-45779_right-20049_bottom-47827.csv"
+    assert f"Duplicate ObjectCodes found in props data for {filename}" in caplog.text
+
+
 def test_missing_meta_dir(caplog):
     success = validate_hips_dir(test_data_dir / "missing_meta")
     assert not success
@@ -104,6 +161,12 @@ def test_get_object_mapping():
     assert bad_mapping is None
 
 
+def test_get_object_mapping_positional():
+    rows = [(0, "zero"), (1, "one"), (2, "two")]
+    assert get_object_mapping(rows, 0) == {i: rows[i] for i in range(len(rows))}
+    assert get_object_mapping(rows + [(1, "uno")], 0) is None
+
+
 def test_duplicate_meta_objectcodes(caplog):
     success = validate_hips_dir(test_data_dir / "duplicate_objectcodes_meta")
     assert not success
@@ -138,18 +201,72 @@ def test_broken_checks(caplog):
         in caplog.text
     )
     assert "props[1][Nucleus.Haralick.IMC1.Range] is missing" in caplog.text
-    assert "meta[1][Xmin] and props[1][Xmin] do not match" in caplog.text
-    assert "meta[1][Ymin] and props[1][Ymin] do not match" in caplog.text
-    assert "meta[1][Xmax] and props[1][Xmax] are not off by one" in caplog.text
-    assert "meta[1][Ymax] and props[1][Ymax] are not off by one" in caplog.text
     assert (
-        "meta[2][Identifier.CentroidX] is not the floor of props[2][Identifier.CentroidX]"
+        "meta[Xmin] and props[Xmin] do not match for 1 nuclei (ObjectCodes 1)"
+        in caplog.text
+    )
+    assert (
+        "meta[Ymin] and props[Ymin] do not match for 1 nuclei (ObjectCodes 1)"
         in caplog.text
     )
     assert (
-        "meta[2][Identifier.CentroidY] is not the floor of props[2][Identifier.CentroidY]"
+        "meta[Xmax] and props[Xmax] are not off by one for 1 nuclei (ObjectCodes 1)"
         in caplog.text
     )
+    assert (
+        "meta[Ymax] and props[Ymax] are not off by one for 1 nuclei (ObjectCodes 1)"
+        in caplog.text
+    )
+    assert (
+        "meta[Identifier.CentroidX] is not the floor of props[Identifier.CentroidX] for 1 nuclei (ObjectCodes 2)"
+        in caplog.text
+    )
+    assert (
+        "meta[Identifier.CentroidY] is not the floor of props[Identifier.CentroidY] for 1 nuclei (ObjectCodes 2)"
+        in caplog.text
+    )
+    assert "1 nuclei violate the Xmin rule" in caplog.text
+
+
+def test_violations_file(tmp_path):
+    violations_file = tmp_path / "violations.jsonl"
+    success = validate_hips_dir(
+        test_data_dir / "broken_checks", violations_file=violations_file
+    )
+    assert not success
+
+    with open(violations_file) as f:
+        violations = [json.loads(line) for line in f]
+
+    filename = "broken_checks_roi-5_left-18001_top-45779_right-20049_bottom-47827.csv"
+    assert {"file": filename, "rule": "Xmax", "ObjectCode": 1} in violations
+    assert {"file": filename, "rule": "CentroidY", "ObjectCode": 2} in violations
+    assert len(violations) == 6
+
+
+def test_find_violations():
+    header = [
+        "Identifier.Xmin",
+        "Identifier.Ymin",
+        "Identifier.Xmax",
+        "Identifier.Ymax",
+        "Identifier.CentroidX",
+        "Identifier.CentroidY",
+    ]
+    index = {key: i for i, key in enumerate(header)}
+
+    meta_rows = [(0, 0, 9, 9, 4, 4), (1, 1, 10, 10, 5, 5)]
+    props_rows = [(0, 0, 10, 10, 4.5, 4.5), (2, 1, 11, 12, 5.0, 6.2)]
+    violations = find_violations([7, 8], meta_rows, props_rows, index, index)
+
+    assert violations == {
+        "Xmin": [8],
+        "Ymin": [],
+        "Xmax": [],
+        "Ymax": [8],
+        "CentroidX": [],
+        "CentroidY": [8],
+    }
 
 
 def test_missing_data(caplog):
@@ -214,3 +331,326 @@ def test_convert_intfloat_good_inputs(x: float):
 @given(st.floats().filter(lambda x: not x.is_integer()))
 def test_convert_intfloat_bad_inputs(x: float):
     assert convert_intfloat(str(x)) is None
+
+
+def test_type_convert_columns(caplog):
+    columns = {
+        "Identifier.ObjectCode": ["1", "2", "x"],
+        "Identifier.Xmin": ["3.0", "4.5", "5.0"],
+        "Classif.StandardClass": ["TILsCell", "Bogus", "OtherCell"],
+        "ClassifProbab.TILsCell": ["0.5", "", "nan"],
+    }
+    converted = type_convert_columns(columns, "meta")
+
+    assert converted["Identifier.ObjectCode"] == [1, 2, None]
+    assert converted["Identifier.Xmin"] == [3, None, 5]
+    assert converted["Classif.StandardClass"] == ["TILsCell", None, "OtherCell"]
+    assert converted["ClassifProbab.TILsCell"][:2] == [0.5, None]
+    assert math.isnan(converted["ClassifProbab.TILsCell"][2])
+
+    assert "Invalid int value: x (row 2, field 'Identifier.ObjectCode')" in caplog.text
+    assert (
+        "Value 4.5 is not a valid intfloat (row 1, field 'Identifier.Xmin')"
+        in caplog.text
+    )
+    assert (
+        "Invalid enum value 'Bogus' for field 'Classif.StandardClass' (row 1)"
+        in caplog.text
+    )
+
+
+def test_diagnostics_rate_limit(caplog, monkeypatch):
+    monkeypatch.setattr(diagnostics, "limit", 2)
+    diagnostics.reset()
+
+    convert_int_column(["a", "b", "c", "d", "e"], "Identifier.ObjectCode")
+    assert caplog.text.count("Invalid int value") == 2
+
+    log_diagnostics()
+    assert "... 3 more similar warnings suppressed" in caplog.text
+    assert diagnostics.summary() == [
+        {
+            "category": "Invalid int value: %s (row %s, field '%s')",
+            "level": "WARNING",
+            "count": 5,
+            "suppressed": 3,
+        }
+    ]
+
+
+def test_json_log_format():
+    record = logging.LogRecord(
+        "hips_etl.logging", logging.WARNING, __file__, 0, "bad %s", ("value",), None
+    )
+    record.key = record.msg
+
+    assert json.loads(JsonFormatter().format(record)) == {
+        "logger": "hips_etl.logging",
+        "level": "WARNING",
+        "message": "bad value",
+        "category": "bad %s",
+    }
+
+
+def test_validation_cache(caplog, monkeypatch, tmp_path):
+    cache_dir = tmp_path / "cache"
+    copy_hips_dir(test_data_dir / "good", tmp_path / "good")
+    modeled = validate_hips_dir(tmp_path / "good", cache_dir=cache_dir)
+    assert modeled == validate_hips_dir(tmp_path / "good")
+    # The digest of the file pair and the verdict, without the nuclei.
+    entries = {path.name: cache.load(cache_dir, path.stem) for path in cache_dir.iterdir()}
+    assert len(entries) == 2
+    [verdict] = [entry for entry in entries.values() if isinstance(entry, tuple)]
+    assert verdict[0][0]["nuclei"] == []
+
+    # Unchanged files are not validated again, and touched files are not
+    # validated again either, since their contents are unchanged.
+    def fail(*args):
+        raise AssertionError("validated a cached ROI")
+
+    monkeypatch.setattr(validation, "validate_roi_files", fail)
+    monkeypatch.setattr(validation, "read_converted", Mock(wraps=validation.read_converted))
+    cached = validate_hips_dir(tmp_path / "good", cache_dir=cache_dir)
+    assert "Using cached validation results" in caplog.text
+    # The files are not parsed again until the nuclei are used.
+    validation.read_converted.assert_not_called()
+    assert cached == modeled
+    assert validation.read_converted.call_count == 2
+
+    for path in (tmp_path / "good").rglob("*.csv"):
+        path.touch()
+    monkeypatch.setattr(cache, "roi_digest", Mock(wraps=cache.roi_digest))
+    assert validate_hips_dir(tmp_path / "good", cache_dir=cache_dir) == modeled
+    assert cache.roi_digest.call_count == 1
+    assert len(list(cache_dir.iterdir())) == 3
+
+    # Nuclei with missing values are skipped when read back, too.
+    monkeypatch.undo()
+    expected = validate_hips_dir(test_data_dir / "missing_data", skip_missing=True)
+    validate_hips_dir(test_data_dir / "missing_data", skip_missing=True, cache_dir=cache_dir)
+    monkeypatch.setattr(validation, "validate_roi_files", fail)
+    assert validate_hips_dir(
+        test_data_dir / "missing_data", skip_missing=True, cache_dir=cache_dir
+    ) == expected
+
+    # Cached failures are reported again.
+    monkeypatch.undo()
+    validate_hips_dir(test_data_dir / "broken_checks", cache_dir=cache_dir)
+    caplog.clear()
+    monkeypatch.setattr(validation, "validate_roi_files", fail)
+    assert not validate_hips_dir(test_data_dir / "broken_checks", cache_dir=cache_dir)
+    assert "meta[Xmin] and props[Xmin] do not match" in caplog.text
+
+
+def test_preflight(caplog):
+    assert validate_hips_dir(test_data_dir / "good", preflight=True)
+    assert "Preflight check passed" in caplog.text
+
+    success = validate_hips_dir(test_data_dir / "missing_props_fields", preflight=True)
+    assert not success
+    filename = (
+        "missing_props_fields_roi-5_left-18001_top-45779_right-20049_bottom-47827.csv"
+    )
+    assert f"Props fields for {filename} do not match expected fields" in caplog.text
+
+    assert not validate_hips_dir(test_data_dir / "regex_mismatch", preflight=True)
+    assert "Preflight check failed" in caplog.text
+
+
+def test_preflight_sample(caplog):
+    # The only missing value in the meta data is in the third row.
+    filename = "missing_data_roi-5_left-18001_top-45779_right-20049_bottom-47827.csv"
+    with pytest.raises(HipsValidationError):
+        preflight_hips_dir(test_data_dir / "missing_data", sample_rows=3)
+    assert f"Meta sample for {filename} has missing values" in caplog.text
+
+    caplog.clear()
+    with pytest.raises(HipsValidationError):
+        preflight_hips_dir(test_data_dir / "missing_data", sample_rows=2)
+    assert f"Meta sample for {filename} has missing values" not in caplog.text
+
+
+def copy_hips_dir(src, dest, compress=None):
+    """Copy a hips data directory, optionally compressing each CSV file."""
+    for subdir in ("nucleiMeta", "nucleiProps"):
+        (dest / subdir).mkdir(parents=True)
+        for path in (src / subdir).iterdir():
+            if compress is None:
+                shutil.copy(path, dest / subdir / path.name)
+            else:
+                with open(path, "rb") as f:
+                    (dest / subdir / f"{path.name}.gz").write_bytes(compress(f.read()))
+
+
+def test_compressed_csv_files(tmp_path):
+    copy_hips_dir(test_data_dir / "good", tmp_path / "good", compress=gzip.compress)
+    assert validate_hips_dir(tmp_path / "good") == validate_hips_dir(
+        test_data_dir / "good"
+    )
+
+
+def test_roi_digests(tmp_path):
+    copy_hips_dir(test_data_dir / "good", tmp_path / "good")
+    [roi] = validate_hips_dir(tmp_path / "good")["roi"]
+    assert roi_digests(tmp_path / "good") == {roi["name"]: roi["digest"]}
+
+    # The digest is of the data, not of how it is stored.
+    copy_hips_dir(test_data_dir / "good", tmp_path / "compressed", compress=gzip.compress)
+    assert roi_digests(tmp_path / "compressed") == roi_digests(tmp_path / "good")
+
+    meta_file = next((tmp_path / "good" / "nucleiMeta").iterdir())
+    meta_file.write_text(meta_file.read_text() + "\n")
+    assert roi_digests(tmp_path / "good") != roi_digests(tmp_path / "compressed")
+
+
+def test_blank_lines(monkeypatch, tmp_path):
+    # Blank lines are skipped, as by `csv.DictReader`.
+    copy_hips_dir(test_data_dir / "good", tmp_path / "good")
+    for csv_file in (tmp_path / "good").rglob("*.csv"):
+        lines = csv_file.read_text().splitlines(keepends=True)
+        lines.insert(4, "\n")
+        csv_file.write_text("".join(lines) + "\n\n")
+
+    def nuclei(data_dir, **kwargs):
+        return [roi["nuclei"] for roi in validate_hips_dir(data_dir, **kwargs)["roi"]]
+
+    expected = nuclei(test_data_dir / "good")
+    assert nuclei(tmp_path / "good") == expected
+
+    monkeypatch.setattr(validation, "chunk_min_bytes", 0)
+    monkeypatch.setattr(fastcsv, "block_bytes", 1024)
+    assert nuclei(tmp_path / "good", chunk_workers=3) == expected
+
+
+@pytest.mark.parametrize("archive", ["good.zip", "good.tar", "good.tar.gz"])
+def test_archives(tmp_path, archive):
+    copy_hips_dir(test_data_dir / "good", tmp_path / "good")
+    archive = tmp_path / archive
+    if archive.name.endswith(".zip"):
+        with zipfile.ZipFile(archive, "w") as z:
+            for path in sorted((tmp_path / "good").rglob("*")):
+                z.write(path, path.relative_to(tmp_path))
+    else:
+        with tarfile.open(archive, "w:gz" if archive.name.endswith(".gz") else "w") as t:
+            t.add(tmp_path / "good", "good")
+
+    expected = validate_hips_dir(test_data_dir / "good")
+    assert validate_hips_dir(archive) == expected
+    assert validate_hips_dir(archive, workers=2) == expected
+    assert validate_hips_dir(archive, preflight=True)
+
+
+def test_archive_nonmatching_files(caplog, tmp_path):
+    archive = tmp_path / "nonmatching_files.tar"
+    with tarfile.open(archive, "w") as t:
+        t.add(test_data_dir / "nonmatching_files", "nonmatching_files")
+
+    assert not validate_hips_dir(archive)
+    assert "Files in nucleiMeta and nucleiProps do not match" in caplog.text
+
+
+def test_csv_chunks(tmp_path):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text(
+        "a,b\n" + "".join(f"{i},{i * 2}\n" + "\n" * (i % 3 == 0) for i in range(100))
+    )
+
+    header, ranges = csv_chunks(csv_file, 3)
+    assert header == ["a", "b"]
+    assert len(ranges) == 3
+
+    rows = []
+    for start, end, first_row in ranges:
+        assert first_row == len(rows)
+        with open(csv_file, "rb") as f:
+            f.seek(start)
+            rows.extend(filter(None, f.read(end - start).decode().splitlines()))
+    assert [tuple(row.split(",")) for row in rows] == read_csv(csv_file)[0]
+
+
+@pytest.mark.parametrize("type", ["meta", "props"])
+def test_read_typed_range(monkeypatch, tmp_path, type):
+    # Use small blocks, so that files are tokenized in several of them.
+    monkeypatch.setattr(fastcsv, "block_bytes", 1024)
+
+    subdir = "nucleiMeta" if type == "meta" else "nucleiProps"
+    source = next((test_data_dir / "good" / subdir).iterdir())
+    lines = source.read_bytes().splitlines(keepends=True)
+    # Quoted fields and CRLF line endings are handled as by `read_csv`.
+    first, _, rest = lines[5].partition(b",")
+    lines[5] = b'"' + first + b'",' + rest
+    lines[7] = lines[7].rstrip(b"\n") + b"\r\n"
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_bytes(b"".join(lines))
+
+    rows, header = read_csv(csv_file)
+    expected = type_convert_rows(rows, header, type)
+
+    header, [(start, end, first_row)] = csv_chunks(csv_file, 1)
+    assert read_typed_range(csv_file, start, end, header, type) == (True, expected)
+
+
+def test_chunked_parsing(caplog, monkeypatch):
+    monkeypatch.setattr(validation, "chunk_min_bytes", 0)
+
+    assert validate_hips_dir(test_data_dir / "good", chunk_workers=3) == (
+        validate_hips_dir(test_data_dir / "good")
+    )
+
+    success = validate_hips_dir(test_data_dir / "missing_data", chunk_workers=3)
+    assert not success
+    assert "meta[4][ClassifProbab.NormalEpithelium] is missing" in caplog.text
+
+    success = validate_hips_dir(
+        test_data_dir / "duplicate_objectcodes_props", chunk_workers=3
+    )
+    assert not success
+    filename = "duplicate_objectcodes_props_roi-5_left-18001_top-45779_right-20049_bottom-47827.csv"
+    assert f"Duplicate ObjectCodes found in props data for {filename}" in caplog.text
+
+
+@pytest.fixture
+def small_pools(monkeypatch):
+    # Generating the pools of shapes and classifications dominates small ROIs.
+    monkeypatch.setattr(synthetic, "shape_pool", 64)
+    monkeypatch.setattr(synthetic, "class_pool", 8)
+
+
+def test_synthetic_hips_dir(caplog, small_pools, tmp_path):
+    stats = generate_hips_dir(tmp_path / "synthetic", rois=3, nuclei=200, seed=1)
+    assert stats == {"rois": 3, "nuclei": 600}
+
+    modeled = validate_hips_dir(tmp_path / "synthetic")
+    assert modeled
+    # Float fields hold non-integral values, as in real data.
+    assert "contains only int values" not in caplog.text
+    assert [len(roi["nuclei"]) for roi in modeled["roi"]] == [200, 200, 200]
+
+    # The same seed gives the same data, also in parallel and compressed.
+    generate_hips_dir(tmp_path / "copy" / "synthetic", rois=3, nuclei=200, seed=1)
+    generate_hips_dir(
+        tmp_path / "gz" / "synthetic", rois=3, nuclei=200, seed=1, compression="gz", workers=2
+    )
+    for path in (tmp_path / "synthetic").glob("*/*.csv"):
+        relative = path.relative_to(tmp_path / "synthetic")
+        assert (tmp_path / "copy" / "synthetic" / relative).read_bytes() == path.read_bytes()
+        with gzip.open(tmp_path / "gz" / "synthetic" / f"{relative}.gz") as f:
+            assert f.read() == path.read_bytes()
+
+
+@pytest.mark.parametrize(
+    "defect,message",
+    [
+        ("missing", "is missing"),
+        ("duplicate", "Duplicate ObjectCodes found in meta data"),
+        ("off_by_one", "are not off by one"),
+    ],
+)
+def test_synthetic_defects(caplog, small_pools, tmp_path, defect, message):
+    stats = generate_hips_dir(
+        tmp_path / "defects", rois=2, nuclei=200, defect_rate=0.05, defects=[defect]
+    )
+    assert stats[defect] > 0
+
+    assert not validate_hips_dir(tmp_path / "defects")
+    assert message in caplog.text
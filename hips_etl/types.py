@@ -1,7 +1,8 @@
 import importlib.resources
 import json
 import math
-from typing import Literal
+from operator import itemgetter
+from typing import Iterable, Literal
 
 from .logging import logger
 
@@ -23,12 +24,12 @@ def convert_intfloat(value: str) -> int | None:
             or math.isnan(floatval)
             or (intval := int(floatval)) != floatval
         ):
-            logger.warning(f"Value {value} is not a valid intfloat")
+            logger.warning("Value %s is not a valid intfloat", value)
             return None
 
         return intval
     except (ValueError, TypeError):
-        logger.warning(f"Invalid intfloat value: {value}")
+        logger.warning("Invalid intfloat value: %s", value)
         return None
 
 
@@ -48,7 +49,7 @@ def convert_float(value: str, ints: list[bool]) -> float | None:
             ints.append(floatval == int(floatval))
         return floatval
     except (ValueError, TypeError):
-        logger.warning(f"Invalid float value: {value}")
+        logger.warning("Invalid float value: %s", value)
         return None
 
 
@@ -57,66 +58,246 @@ def convert_int(value: str) -> int | None:
     try:
         return int(value)
     except (ValueError, TypeError):
-        logger.warning(f"Invalid int value: {value}")
+        logger.warning("Invalid int value: %s", value)
         return None
 
 
-def type_convert_rows(
-    rows: list[dict], type: Literal["meta", "props"]
-) -> list[dict] | None:
-    """Convert the raw rows to a properly typed rows."""
-    typemap = types[type]
-    floatint = {}
-    for row in rows:
-        for key in row:
-            value = row[key]
-            conversion_type = typemap.get(key)
-            match conversion_type:
-                case "int":
-                    value = convert_int(value)
-                case "intfloat":
-                    value = convert_intfloat(value)
-                case "float":
-                    floatints = floatint.setdefault(key, [])
-                    value = convert_float(value, floatints)
-                case "string":
-                    # String data needs no conversion.
-                    pass
-                case "enum":
-                    enum_values = types["enum_values"][type].get(key)
-                    if enum_values is None:
-                        logger.critical(
-                            f"Field '{key}' is not registered as an enum type."
-                        )
-                        return None
-
-                    if value not in enum_values:
-                        logger.warning(
-                            f"Invalid enum value '{value}' for field '{key}'"
-                        )
-                        value = None
-                case _:
-                    logger.critical(
-                        f"Unknown type '{conversion_type}' in {type} types."
-                    )
-                    return None
-
-            row[key] = value
-
-    for key in floatint:
-        if False not in floatint[key]:
+def convert_int_column(
+    values: list[str], key: str, first_row: int = 0
+) -> list[int | None]:
+    """
+    Convert a column of strings to integers.
+
+    The whole column is converted in one pass with the builtin `int`; only if
+    that fails is each cell converted individually, so that the invalid cells
+    can be reported by position.
+    """
+    try:
+        return list(map(int, values))
+    except (ValueError, TypeError):
+        pass
+
+    converted = []
+    for row, value in enumerate(values, first_row):
+        try:
+            converted.append(int(value))
+        except (ValueError, TypeError):
+            logger.warning(
+                "Invalid int value: %s (row %s, field '%s')", value, row, key
+            )
+            converted.append(None)
+
+    return converted
+
+
+def convert_intfloat_column(
+    values: list[str], key: str, first_row: int = 0
+) -> list[int | None]:
+    """
+    Convert a column of integers encoded as floating point strings.
+
+    Like `convert_int_column`, each cell is only looked at individually if
+    the bulk conversion of the whole column fails.
+    """
+    try:
+        floats = list(map(float, values))
+        ints = list(map(int, floats))
+        if ints == floats:
+            return ints
+    except (ValueError, TypeError, OverflowError):
+        pass
+
+    converted = []
+    for row, value in enumerate(values, first_row):
+        try:
+            floatval = float(value)
+        except (ValueError, TypeError):
+            logger.warning(
+                "Invalid intfloat value: %s (row %s, field '%s')", value, row, key
+            )
+            converted.append(None)
+            continue
+
+        if not math.isfinite(floatval) or not floatval.is_integer():
+            logger.warning(
+                "Value %s is not a valid intfloat (row %s, field '%s')", value, row, key
+            )
+            converted.append(None)
+            continue
+
+        converted.append(int(floatval))
+
+    return converted
+
+
+def convert_float_column(
+    values: list[str], key: str, first_row: int = 0, check_ints: bool = True
+) -> list[float | None]:
+    """
+    Convert a column of strings to floats.
+
+    Empty strings are treated as missing values. Unless `check_ints` is false,
+    a warning is issued if every finite value in the column is an integer (see
+    `warn_integral_floats`).
+    """
+    try:
+        converted = list(map(float, values))
+    except (ValueError, TypeError):
+        converted = []
+        for row, value in enumerate(values, first_row):
+            if value == "":
+                converted.append(None)
+                continue
+
+            try:
+                converted.append(float(value))
+            except (ValueError, TypeError):
+                logger.warning(
+                    "Invalid float value: %s (row %s, field '%s')", value, row, key
+                )
+                converted.append(None)
+
+    if check_ints and converted:
+        warn_integral_floats(converted, key)
+
+    return converted
+
+
+def warn_integral_floats(values: Iterable[float | None], key: str):
+    """
+    Warn if every finite value of a (non-empty) float column is an integer.
+
+    Such a field may be better described as an intfloat. The values are only
+    looked at up to the first non-integer.
+    """
+    present = (value for value in values if value is not None)
+    if all(map(float.is_integer, filter(math.isfinite, present))):
+        logger.warning(
+            "Float field '%s' contains only int values (should it be a floatint?)", key
+        )
+
+
+def convert_enum_column(
+    values: list[str], key: str, enum_values: list[str], first_row: int = 0
+) -> list[str | None]:
+    """Check a column of strings against the allowed values of an enum."""
+    allowed = set(enum_values)
+    if allowed.issuperset(values):
+        return values
+
+    converted = []
+    for row, value in enumerate(values, first_row):
+        if value not in allowed:
             logger.warning(
-                f"Float field '{key}' contains only int values (should it be a floatint?)"
+                "Invalid enum value '%s' for field '%s' (row %s)", value, key, row
             )
+            value = None
+        converted.append(value)
+
+    return converted
+
+
+def type_convert_column(
+    values: list[str],
+    key: str,
+    type: Literal["meta", "props"],
+    first_row: int = 0,
+    check_ints: bool = True,
+) -> list | None:
+    """
+    Convert a raw column of strings to a properly typed column.
+
+    `first_row` is the row number of the first value, used when reporting
+    invalid values. `check_ints` is passed on to `convert_float_column`.
+    """
+    conversion_type = types[type].get(key)
+    match conversion_type:
+        case "int":
+            return convert_int_column(values, key, first_row)
+        case "intfloat":
+            return convert_intfloat_column(values, key, first_row)
+        case "float":
+            return convert_float_column(values, key, first_row, check_ints)
+        case "string":
+            # String data needs no conversion.
+            return values
+        case "enum":
+            enum_values = types["enum_values"][type].get(key)
+            if enum_values is None:
+                logger.critical("Field '%s' is not registered as an enum type.", key)
+                return None
+
+            return convert_enum_column(values, key, enum_values, first_row)
+        case _:
+            logger.critical("Unknown type '%s' in %s types.", conversion_type, type)
+            return None
+
+
+def type_convert_columns(
+    columns: dict[str, list[str]], type: Literal["meta", "props"]
+) -> dict[str, list] | None:
+    """
+    Convert raw columns of strings to properly typed columns.
+
+    `columns` maps each field name to the list of that field's values, one per
+    row. Each column is converted as a whole, which is much faster than
+    converting the data cell by cell.
+    """
+    converted = {}
+    for key, values in columns.items():
+        values = type_convert_column(values, key, type)
+        if values is None:
+            return None
+
+        converted[key] = values
+
+    return converted
+
+
+def type_convert_rows(
+    rows: list[tuple],
+    header: list[str],
+    type: Literal["meta", "props"],
+    first_row: int = 0,
+    check_ints: bool = True,
+) -> list[tuple] | None:
+    """
+    Convert the raw rows (laid out as in `header`) to properly typed rows.
+
+    `first_row` and `check_ints` are as for `type_convert_column`, for
+    converting a file in several chunks.
+    """
+    if not rows:
+        return rows
+
+    columns = []
+    for key, values in zip(header, zip(*rows)):
+        values = type_convert_column(list(values), key, type, first_row, check_ints)
+        if values is None:
+            return None
+
+        columns.append(values)
+
+    return list(zip(*columns))
+
+
+def warn_integral_float_rows(
+    rows: list[tuple], header: list[str], type: Literal["meta", "props"]
+):
+    """Run `warn_integral_floats` over the float columns of converted rows."""
+    if not rows:
+        return
 
-    return rows
+    for i, key in enumerate(header):
+        if types[type].get(key) == "float":
+            warn_integral_floats(map(itemgetter(i), rows), key)
 
 
-def type_convert_meta(rows: list[dict]) -> list[dict]:
+def type_convert_meta(rows: list[tuple], header: list[str]) -> list[tuple] | None:
     """Convert the raw meta rows to a properly typed rows."""
-    return type_convert_rows(rows, "meta")
+    return type_convert_rows(rows, header, "meta")
 
 
-def type_convert_props(rows: list[dict]) -> list[dict]:
+def type_convert_props(rows: list[tuple], header: list[str]) -> list[tuple] | None:
     """Convert the raw props rows to a properly typed rows."""
-    return type_convert_rows(rows, "props")
+    return type_convert_rows(rows, header, "props")
@@ -1,51 +1,326 @@
+import bz2
+from contextlib import contextmanager
 import csv
+import gzip
 import importlib.resources
+import io
+from itertools import islice, pairwise
 import json
-from pathlib import Path
+import lzma
+import os
+from pathlib import Path, PurePosixPath
 import sys
-
-from hipsdb.models import ROI, Nucleus
+import tarfile
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, NamedTuple
+import zipfile
 
 from .logging import logger
 
+if TYPE_CHECKING:
+    from hipsdb.models import ROI, Nucleus
+
 
 def dir_exists(directory: Path) -> bool:
     """Check if a directory exists and is a directory."""
     return directory.exists() and directory.is_dir()
 
 
-def check_same_filenames(dir1: Path, dir2: Path):
+# Suffixes of compressed files that can be read directly.
+compression_suffixes = (".gz", ".bz2", ".xz", ".zst")
+
+# Suffixes of archives that can be read in place of a data directory.
+archive_suffixes = (
+    ".zip",
+    ".tar",
+    ".tgz",
+    ".tar.gz",
+    ".tar.bz2",
+    ".tar.xz",
+    ".tar.zst",
+)
+
+
+class ArchiveMember(NamedTuple):
+    """
+    A file inside a zip or tar archive.
+
+    Members of zip archives are read from the archive when needed. Tar archives
+    can only be read front to back, so the contents of their members are read
+    up front and carried in `data`.
+    """
+
+    archive: Path
+    name: str
+    data: bytes | None = None
+
+
+def csv_name(name: str) -> str:
+    """Strip a compression suffix (e.g. `.gz`) from a filename."""
+    for suffix in compression_suffixes:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def is_archive(path: Path) -> bool:
+    """Check if a path names a zip or tar archive."""
+    return path.name.endswith(archive_suffixes)
+
+
+def hips_image_name(path: Path) -> str:
+    """Return the image name of a hips data directory or archive."""
+    for suffix in archive_suffixes:
+        if path.name.endswith(suffix):
+            return path.name[: -len(suffix)]
+    return path.name
+
+
+def _zstd_reader(fileobj: BinaryIO) -> BinaryIO:
+    """Wrap a binary stream of zstd-compressed data in a decompressing reader."""
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading .zst files requires the zstandard package")
+
+    return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+def decompress(fileobj: BinaryIO, name: str) -> BinaryIO:
+    """Wrap a binary stream in a decompressing reader according to its name."""
+    if name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=fileobj)
+    if name.endswith(".bz2"):
+        return bz2.BZ2File(fileobj)
+    if name.endswith(".xz"):
+        return lzma.LZMAFile(fileobj)
+    if name.endswith(".zst"):
+        return _zstd_reader(fileobj)
+    return fileobj
+
+
+@contextmanager
+def open_source(source: "Path | ArchiveMember") -> Iterator[BinaryIO]:
+    """Open a file or archive member for reading its raw (compressed) bytes."""
+    if isinstance(source, ArchiveMember):
+        if source.data is not None:
+            yield io.BytesIO(source.data)
+        else:
+            with zipfile.ZipFile(source.archive) as archive:
+                with archive.open(source.name) as f:
+                    yield f
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+
+def list_csv_files(directory: Path) -> dict[str, Path]:
+    """Map the (uncompressed) name of each file in a directory to its path."""
+    return {csv_name(path.name): path for path in directory.iterdir()}
+
+
+def list_zip_csv_files(
+    archive: Path, subdir: str
+) -> dict[str, ArchiveMember] | None:
+    """
+    Map the (uncompressed) name of each file in a subdirectory of a zip
+    archive to the archive member.
+
+    The subdirectory may be at the top of the archive or inside a single
+    top-level directory. Returns None if the archive has no such subdirectory.
+    """
+    found = False
+    files = {}
+    with zipfile.ZipFile(archive) as z:
+        for info in z.infolist():
+            path = PurePosixPath(info.filename)
+            parent = path if info.is_dir() else path.parent
+            if parent.name != subdir or len(parent.parts) > 2:
+                continue
+
+            found = True
+            if not info.is_dir():
+                files[csv_name(path.name)] = ArchiveMember(archive, info.filename)
+
+    return files if found else None
+
+
+@contextmanager
+def _open_tar(archive: Path) -> Iterator[tarfile.TarFile]:
+    """Open a (possibly compressed) tar archive for reading as a stream."""
+    if archive.name.endswith(".tar.zst"):
+        with open(archive, "rb") as f:
+            with tarfile.open(fileobj=_zstd_reader(f), mode="r|") as tar:
+                yield tar
+    else:
+        with tarfile.open(archive, mode="r|*") as tar:
+            yield tar
+
+
+def iter_tar_csv_pairs(
+    archive: Path, subdirs: tuple[str, str]
+) -> Iterator[tuple[ArchiveMember, ArchiveMember, str]]:
+    """
+    Read the files of two subdirectories of a tar archive, in one pass.
+
+    Yields (first, second, name) for each (uncompressed) filename as soon as
+    it has been found in both subdirectories, in archive order. Files whose
+    partner has not been seen yet are held in memory. The subdirectories may
+    be at the top of the archive or inside a single top-level directory.
+
+    The return value of the generator is the set of names that were only found
+    in one of the subdirectories, or None if either subdirectory is missing.
+    """
+    pending = ({}, {})
+    found = [False, False]
+    with _open_tar(archive) as tar:
+        for member in tar:
+            path = PurePosixPath(member.name)
+            parent = path if member.isdir() else path.parent
+            if parent.name not in subdirs or len(parent.parts) > 2:
+                continue
+
+            which = subdirs.index(parent.name)
+            found[which] = True
+            if not member.isfile():
+                continue
+
+            name = csv_name(path.name)
+            data = tar.extractfile(member).read()
+            pending[which][name] = ArchiveMember(archive, member.name, data)
+
+            if name in pending[0] and name in pending[1]:
+                yield (pending[0].pop(name), pending[1].pop(name), name)
+
+    if not all(found):
+        return None
+
+    return set(pending[0]) | set(pending[1])
+
+
+def check_same_filenames(
+    dir1: Path | Iterable[str], dir2: Path | Iterable[str]
+) -> set[str] | None:
     """
     Check if two directories contain the same set of filenames.
     Returns the set of filenames if they match, otherwise returns None.
+
+    Compression suffixes are ignored, so `a.csv` and `a.csv.gz` match. Instead
+    of a directory, either argument may be a collection of filenames (such as
+    the mapping returned by `list_csv_files` or `list_zip_csv_files`).
     """
-    files1 = set(dir1.iterdir())
-    files2 = set(dir2.iterdir())
-    if {x.name for x in files1} != {x.name for x in files2}:
+    names1 = set(list_csv_files(dir1) if isinstance(dir1, Path) else dir1)
+    names2 = set(list_csv_files(dir2) if isinstance(dir2, Path) else dir2)
+    if names1 != names2:
         return None
-    return {x.name for x in files1}
+    return names1
+
+
+def read_csv(
+    csv_file: "Path | ArchiveMember", limit: int | None = None
+) -> tuple[list[tuple], list[str]]:
+    """
+    Read a CSV file and return its rows as tuples, along with its header.
+
+    As with `csv.DictReader`, blank lines are skipped, and rows with fewer
+    values than the header are padded out with None. If `limit` is given, only
+    that many rows (after the header) are read.
+
+    `csv_file` may also be a member of an archive, and the file may be
+    compressed (as indicated by a `.gz`, `.bz2`, `.xz` or `.zst` suffix); it is
+    decompressed as it is read.
+    """
+    with open_source(csv_file) as raw:
+        with io.TextIOWrapper(decompress(raw, csv_file.name), newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            reader = filter(None, reader)
+            if limit is not None:
+                reader = islice(reader, limit)
+            rows = list(map(tuple, reader))
+
+    return (pad_rows(rows, len(header)), header)
 
 
-def read_csv(csv_file: Path) -> tuple[list[dict], list[str]]:
-    """Read a CSV file and return its contents as a list of dictionaries."""
-    with open(csv_file) as f:
-        reader = csv.DictReader(f)
-        fields = set(reader.fieldnames)
-        return (list(reader), fields)
+def pad_rows(rows: list[tuple], width: int) -> list[tuple]:
+    """Pad out rows with fewer than `width` values with None."""
+    if any(len(row) < width for row in rows):
+        rows = [row + (None,) * (width - len(row)) for row in rows]
+
+    return rows
+
+
+def csv_chunks(
+    csv_file: Path, chunks: int
+) -> tuple[list[str], list[tuple[int, int, int]]]:
+    """
+    Split the data rows of an (uncompressed) CSV file into byte ranges.
+
+    The file is split into at most `chunks` ranges of roughly equal size, each
+    starting at the beginning of a line. Returns the header of the file and a
+    (start, end, first row) tuple for each range, where the first row is the
+    number of data rows (not counting blank lines) before the range. Values
+    must not contain line breaks, which holds for HiPS data.
+    """
+    with open(csv_file, "rb") as f:
+        header = next(csv.reader(io.TextIOWrapper(io.BytesIO(f.readline()))), [])
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+
+        bounds = [start]
+        for i in range(1, chunks):
+            # Move to the start of the line following the target offset.
+            f.seek(start + (size - start) * i // chunks - 1)
+            f.readline()
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+        bounds.append(size)
+
+        ranges = []
+        row = 0
+        for start, end in pairwise(bounds):
+            ranges.append((start, end, row))
+
+            f.seek(start)
+            remaining = end - start
+            # Whether the line continued from the previous block has values.
+            pending = False
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 24))
+                remaining -= len(block)
+                lines = block.split(b"\n")
+                row += sum(1 for line in lines[:-1] if line.strip(b"\r"))
+                if pending and len(lines) > 1 and not lines[0].strip(b"\r"):
+                    row += 1
+                pending = bool(lines[-1].strip(b"\r")) or (pending and len(lines) == 1)
+
+    return (header, ranges)
+
+
+def rows_fit_header(rows: list[tuple], header: list[str]) -> bool:
+    """Check that no row has more values than there are fields in the header."""
+    width = len(header)
+    return all(len(row) <= width for row in rows)
 
 
 def fields_match(fields: set, expected_fields: set) -> bool:
     missing_fields = expected_fields - fields
     extra_fields = fields - expected_fields
     if missing_fields or extra_fields:
-        logger.error(f"Fields mismatch: missing {missing_fields}, extra {extra_fields}")
+        logger.error("Fields mismatch: missing %s, extra %s", missing_fields, extra_fields)
         return False
     return True
 
 
-def get_object_mapping(rows: list[dict]) -> dict[int, dict] | None:
-    """Construct a mapping from ObjectCode to row for a list of dictionaries."""
-    mapping = {int(float(row["Identifier.ObjectCode"])): row for row in rows}
+def get_object_mapping(
+    rows: list, key: str | int = "Identifier.ObjectCode"
+) -> dict[int, dict | tuple] | None:
+    """
+    Construct a mapping from ObjectCode to row for a list of rows.
+
+    `key` locates the ObjectCode in each row: a field name for rows that are
+    dictionaries, or a column index for rows that are tuples.
+    """
+    mapping = {int(float(row[key])): row for row in rows}
 
     return mapping if len(mapping) == len(rows) else None
 
@@ -55,7 +330,7 @@ def get_json_fields(jsonfile: str) -> set[str]:
         with open(importlib.resources.files(__package__) / "fields" / jsonfile) as f:
             fields = set(json.load(f))
     except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.critical(f"Failed to load {jsonfile}: {e}")
+        logger.critical("Failed to load %s: %s", jsonfile, e)
         sys.exit(1)
 
     return fields
@@ -66,14 +341,14 @@ def get_json_value(jsonfile: str):
         with open(importlib.resources.files(__package__) / "fields" / jsonfile) as f:
             value = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.critical(f"Failed to load {jsonfile}: {e}")
+        logger.critical("Failed to load %s: %s", jsonfile, e)
         sys.exit(1)
 
     return value
 
 
-def random_nucleus(roi: ROI) -> Nucleus:
-    """Generate a random nucleus with dummy data."""
+def random_nucleus_values() -> dict:
+    """Generate dummy values of all nucleus fields, by Django field name."""
     nucleus_fields = get_json_value("nucleus_fields.json")
 
     data = {}
@@ -90,7 +365,22 @@ def random_nucleus(roi: ROI) -> Nucleus:
         else:
             raise ValueError(f"Unknown field type: {field_type} for field {field_name}")
 
+    return data
+
+
+def random_nucleus(roi: "ROI") -> "Nucleus":
+    """
+    Generate a random nucleus with dummy data.
+
+    Only the fields of the nucleus table are set; the feature fields are
+    stored by separate models (see `random_nucleus_values`).
+    """
+    # Imported here so that the ETL code can be used (e.g. in worker
+    # processes) without a configured Django project.
+    from hipsdb.models import Nucleus, nucleus_field_models
+
+    data = random_nucleus_values()
     return Nucleus(
         roi=roi,
-        **data,
+        **{name: value for name, value in data.items() if nucleus_field_models[name] is Nucleus},
     )
@@ -1,17 +1,53 @@
+from collections import Counter, deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import cached_property, partial
+from itertools import chain, compress, islice, repeat
+import json
+import logging
 import re
 from pathlib import Path
 import math
+from operator import itemgetter, ne, sub
+from typing import Callable, Container, Iterable, Iterator, Literal, TextIO
+
 from hips_etl.utils import (
+    ArchiveMember,
     dir_exists,
     check_same_filenames,
+    csv_chunks,
+    csv_name,
     get_json_fields,
+    hips_image_name,
+    is_archive,
+    iter_tar_csv_pairs,
+    list_csv_files,
+    list_zip_csv_files,
     read_csv,
     fields_match,
     get_object_mapping,
+    rows_fit_header,
+)
+from hips_etl.types import (
+    type_convert_meta,
+    type_convert_props,
+    type_convert_rows,
+    warn_integral_float_rows,
 )
-from hips_etl.types import type_convert_meta, type_convert_props
+from hips_etl import cache
+from hips_etl.fastcsv import read_typed_range
+from hips_etl.profiling import PhaseTimer, log_timings, timer
 
-from .logging import logger
+from .logging import (
+    Diagnostics,
+    active_diagnostics,
+    diagnostics,
+    log_diagnostics,
+    logger,
+    replay,
+    run_captured,
+)
 
 csv_filename_pattern = re.compile(
     r"^(?P<image>.*)_roi-(?P<roi>[0-9]+)_left-(?P<left>[0-9]+)_top-(?P<top>[0-9]+)_right-(?P<right>[0-9]+)_bottom-(?P<bottom>[0-9]+)\.csv$"
@@ -24,208 +60,1060 @@ meta_only_fields = get_json_fields("meta_only.json")
 props_only_fields = get_json_fields("props_only.json")
 
 
-def construct_nucleus(meta: dict, props: dict) -> dict:
-    """Construct a nucleus dictionary from meta and props dictionaries."""
+def _minus_one(column: Iterable) -> Iterator:
+    """Subtract one from each value of a column."""
+    return map(sub, column, repeat(1))
 
-    def django_field_name(field_name: str) -> str:
-        """Convert a field name to a Django model field name."""
-        return field_name.replace('.', '_')
 
-    nucleus_common = {
-        django_field_name("Identifier.ObjectCode"): meta["Identifier.ObjectCode"],
-        django_field_name("Identifier.Xmin"): meta["Identifier.Xmin"],
-        django_field_name("Identifier.Ymin"): meta["Identifier.Ymin"],
-        django_field_name("Identifier.Xmax"): props["Identifier.Xmax"],
-        django_field_name("Identifier.Ymax"): props["Identifier.Ymax"],
-        django_field_name("Identifier.CentroidX"): meta["Identifier.CentroidX"],
-        django_field_name("Identifier.CentroidY"): meta["Identifier.CentroidY"],
-    }
+def _floor(column: Iterable) -> Iterator:
+    """Round each value of a column down."""
+    return map(math.floor, column)
 
-    nucleus_meta = {django_field_name(k): v for k, v in meta.items() if k in meta_only_fields}
 
-    nucleus_props = {django_field_name(k): v for k, v in props.items() if k in props_only_fields}
-    del nucleus_props['slide']
-    del nucleus_props['roiname']
+# Data integrity rules between meta and props, as (rule name, meta field,
+# props field, transform applied to the props column before comparing it with
+# the meta column, description).
+consistency_rules = (
+    (
+        "Xmin",
+        "Identifier.Xmin",
+        "Identifier.Xmin",
+        None,
+        "meta[Xmin] and props[Xmin] do not match",
+    ),
+    (
+        "Ymin",
+        "Identifier.Ymin",
+        "Identifier.Ymin",
+        None,
+        "meta[Ymin] and props[Ymin] do not match",
+    ),
+    (
+        "Xmax",
+        "Identifier.Xmax",
+        "Identifier.Xmax",
+        _minus_one,
+        "meta[Xmax] and props[Xmax] are not off by one",
+    ),
+    (
+        "Ymax",
+        "Identifier.Ymax",
+        "Identifier.Ymax",
+        _minus_one,
+        "meta[Ymax] and props[Ymax] are not off by one",
+    ),
+    (
+        "CentroidX",
+        "Identifier.CentroidX",
+        "Identifier.CentroidX",
+        _floor,
+        "meta[Identifier.CentroidX] is not the floor of props[Identifier.CentroidX]",
+    ),
+    (
+        "CentroidY",
+        "Identifier.CentroidY",
+        "Identifier.CentroidY",
+        _floor,
+        "meta[Identifier.CentroidY] is not the floor of props[Identifier.CentroidY]",
+    ),
+)
 
-    return nucleus_common | nucleus_meta | nucleus_props
+# Number of example ObjectCodes to log for each violated rule.
+violation_examples = 5
 
+# Smallest CSV file that is parsed in chunks when chunk workers are requested.
+chunk_min_bytes = 32 * 1024 * 1024
 
-def validate_hips_dir(data_dir: Path, skip_missing: bool = False) -> bool:
-    """Validate the data in a hips data directory."""
 
-    success = True
+class HipsValidationError(Exception):
+    """Raised when a HiPS data directory fails validation."""
 
-    modeled = {
-        "image": data_dir.name,
-        "roi": [],
-    }
 
-    # Check that the data directory exists and is a directory.
-    if not dir_exists(data_dir):
-        logger.error(f"No such directory {data_dir}")
-        return False
+def django_field_name(field_name: str) -> str:
+    """Convert a field name to a Django model field name."""
+    return field_name.replace('.', '_')
 
-    # Check that the data directory contains `nucleiMeta` and `nucleiProps` subdirectories.
-    meta_dir = data_dir / "nucleiMeta"
-    props_dir = data_dir / "nucleiProps"
-    if not dir_exists(meta_dir) or not dir_exists(props_dir):
-        logger.error("Subdirectories nucleiMeta and nucleiProps must both exist")
+
+def nucleus_projection(
+    meta_header: list[str], props_header: list[str]
+) -> tuple[tuple[str, ...], Callable[[tuple, tuple], tuple]]:
+    """
+    Work out how to construct nuclei from meta and props rows.
+
+    Returns the Django field names of the nucleus, and a function that takes a
+    meta row and a props row (laid out as in `meta_header` and `props_header`)
+    and returns the nucleus values in the same order as the field names.
+    """
+    meta_columns = [
+        "Identifier.ObjectCode",
+        "Identifier.Xmin",
+        "Identifier.Ymin",
+        "Identifier.CentroidX",
+        "Identifier.CentroidY",
+    ] + [k for k in meta_header if k in meta_only_fields]
+
+    props_columns = ["Identifier.Xmax", "Identifier.Ymax"] + [
+        k for k in props_header if k in props_only_fields and k not in ("slide", "roiname")
+    ]
+
+    meta_getter = itemgetter(*(meta_header.index(k) for k in meta_columns))
+    props_getter = itemgetter(*(props_header.index(k) for k in props_columns))
+
+    def construct_nucleus(meta: tuple, props: tuple) -> tuple:
+        """Construct the nucleus values from a meta and a props row."""
+        return meta_getter(meta) + props_getter(props)
+
+    fields = tuple(django_field_name(k) for k in meta_columns + props_columns)
+
+    return (fields, construct_nucleus)
+
+
+def find_violations(
+    object_codes: list[int],
+    meta_rows: list[tuple],
+    props_rows: list[tuple],
+    meta_index: dict[str, int],
+    props_index: dict[str, int],
+) -> dict[str, list[int]]:
+    """
+    Check the data integrity rules between aligned meta and props rows.
+
+    `meta_rows` and `props_rows` hold the rows of the nuclei in
+    `object_codes`, in the same order. Each rule is checked over whole columns
+    at once. Returns the ObjectCodes violating each rule, keyed by rule name.
+    """
+    violations = {}
+    for rule, meta_key, props_key, transform, _ in consistency_rules:
+        meta_column = map(itemgetter(meta_index[meta_key]), meta_rows)
+        props_column = map(itemgetter(props_index[props_key]), props_rows)
+        if transform is not None:
+            props_column = transform(props_column)
+
+        mismatches = map(ne, meta_column, props_column)
+        violations[rule] = list(compress(object_codes, mismatches))
+
+    return violations
+
+
+def log_violations(violations: dict[str, list[int]]):
+    """Log a one-line summary for each violated integrity rule."""
+    for rule, _, _, _, description in consistency_rules:
+        object_codes = violations.get(rule)
+        if not object_codes:
+            continue
+
+        examples = ", ".join(map(str, object_codes[:violation_examples]))
+        if len(object_codes) > violation_examples:
+            examples += ", ..."
+        logger.warning(
+            description + " for %s nuclei (ObjectCodes %s)",
+            len(object_codes),
+            examples,
+        )
+
+
+def _check_fields(header: list[str], type: Literal["meta", "props"], filename: str):
+    """Check that the fields of a meta or props file are the expected ones."""
+    only_fields = meta_only_fields if type == "meta" else props_only_fields
+    if not fields_match(set(header), common_fields | only_fields):
+        logger.error(
+            "%s fields for %s do not match expected fields", type.capitalize(), filename
+        )
         return False
 
-    # Make sure that each subdirectory contains the same set of files.
-    filenames = check_same_filenames(meta_dir, props_dir)
-    if filenames is None:
-        logger.error("Files in nucleiMeta and nucleiProps do not match")
+    return True
+
+
+def _check_rows_fit(
+    rows: list[tuple], header: list[str], type: Literal["meta", "props"], filename: str
+):
+    """Check that no row of a meta or props file has extra values."""
+    if not rows_fit_header(rows, header):
+        logger.error(
+            "%s data for %s has rows with extra values", type.capitalize(), filename
+        )
         return False
 
-    # Validate each file in the directories.
-    skipped = 0
-    total = 0
-    for filename in filenames:
-        logger.info(f"Validating {filename}")
-        logger.indent()
+    return True
 
-        # Check that the filename matches the expected pattern.
-        match = csv_filename_pattern.match(filename)
-        if not match:
-            logger.warning(f"Filename {filename} does not match the pattern")
-            success = False
-            continue
 
-        # Create an ROI entry for the modeled data.
-        roi = {
-            "name": match.group("roi"),
-            "left": int(match.group("left")),
-            "top": int(match.group("top")),
-            "right": int(match.group("right")),
-            "bottom": int(match.group("bottom")),
-            "nuclei": [],
-        }
-
-        # Check that the case name matches the directory name.
-        if match.group("image") != data_dir.name:
-            logger.warning(
-                f"Image name for {filename} does not match directory name {data_dir.name}"
-            )
-            success = False
+def check_structure(
+    meta_rows: list[tuple],
+    meta_header: list[str],
+    props_rows: list[tuple],
+    props_header: list[str],
+    filename: str,
+) -> bool:
+    """Check that the fields of a meta/props file pair are the expected ones."""
+    return (
+        _check_fields(meta_header, "meta", filename)
+        and _check_fields(props_header, "props", filename)
+        and _check_rows_fit(meta_rows, meta_header, "meta", filename)
+        and _check_rows_fit(props_rows, props_header, "props", filename)
+    )
 
-        # Read the CSV files and check that the fields match the expected fields.
-        meta_rows, meta_fields = read_csv(meta_dir / filename)
-        if not fields_match(meta_fields, common_fields | meta_only_fields):
-            logger.error(f"Meta fields for {filename} do not match expected fields")
-            return False
-
-        props_rows, props_fields = read_csv(props_dir / filename)
-        if not fields_match(props_fields, common_fields | props_only_fields):
-            logger.error(f"Props fields for {filename} do not match expected fields")
-            return False
-
-        meta_rows = type_convert_meta(meta_rows)
-        props_rows = type_convert_props(props_rows)
-
-        if meta_rows is None or props_rows is None:
-            return False
-
-        # Construct a mapping from ObjectCode to row for both meta and props.
-        meta_dict = get_object_mapping(meta_rows)
-        if meta_dict is None:
-            logger.error(f"Duplicate ObjectCodes found in meta data for {filename}")
-            return False
-
-        props_dict = get_object_mapping(props_rows)
-        if props_dict is None:
-            logger.error(f"Duplicate ObjectCodes found in props data for {filename}")
-            return False
-
-        # Check that the ObjectCodes in meta and props match.
-        if set(meta_dict.keys()) != set(props_dict.keys()):
-            logger.error(
-                f"ObjectCodes in {filename} do not match between meta and props"
-            )
-            return False
-
-        # Check the data integrity properties between meta and props.
-        total += len(meta_dict)
-        for id in meta_dict.keys():
-            meta = meta_dict[id]
-            props = props_dict[id]
-            skip = False
-
-            # Ensure no missing values in meta and props.
-            for key in meta:
-                if meta[key] is None:
+
+def _read_mapped(
+    csv_file: Path,
+    type: Literal["meta", "props"],
+    filename: str,
+    chunk_workers: int = 1,
+) -> tuple[list[tuple] | None, list[str]] | None:
+    """
+    Read and type convert an uncompressed CSV file with `read_typed_range`.
+
+    With `chunk_workers` greater than one, the file is split into chunks on
+    line boundaries (see `csv_chunks`) that are converted in a process pool.
+    Their rows are put back together in file order, so later checks (such as
+    the duplicate ObjectCode detection) see the same rows as with `read_csv`.
+    Returns None if the file has structural errors.
+    """
+    header, ranges = csv_chunks(csv_file, chunk_workers)
+    if not _check_fields(header, type, filename):
+        return None
+
+    if chunk_workers > 1:
+        limit = active_diagnostics().limit
+        with ProcessPoolExecutor(max_workers=chunk_workers) as executor:
+            futures = [
+                executor.submit(
+                    _run_captured_timed,
+                    limit,
+                    read_typed_range,
+                    csv_file,
+                    start,
+                    end,
+                    header,
+                    type,
+                    first_row,
+                )
+                for start, end, first_row in ranges
+            ]
+
+            results = []
+            for future in futures:
+                result, records, counts, timings = future.result()
+                replay(records, counts)
+                timer.merge(timings)
+                results.append(result)
+    else:
+        results = [
+            read_typed_range(csv_file, start, end, header, type, first_row)
+            for start, end, first_row in ranges
+        ]
+
+    if not all(fits for fits, _ in results):
+        logger.error(
+            "%s data for %s has rows with extra values", type.capitalize(), filename
+        )
+        return None
+
+    if any(chunk_rows is None for _, chunk_rows in results):
+        return (None, header)
+
+    rows = list(chain.from_iterable(chunk_rows for _, chunk_rows in results))
+    warn_integral_float_rows(rows, header, type)
+
+    return (rows, header)
+
+
+def read_converted(
+    csv_file: Path | ArchiveMember,
+    type: Literal["meta", "props"],
+    filename: str,
+    chunk_workers: int = 1,
+) -> tuple[list[tuple] | None, list[str]] | None:
+    """
+    Read a meta or props CSV file, check its structure and type convert it.
+
+    Returns the converted rows (None if the conversion failed) and the header,
+    or None if the file has structural errors. Uncompressed files are
+    memory-mapped and parsed without decoding their numeric values (see
+    `read_typed_range`); archive members and compressed files are read with
+    `read_csv`. With `chunk_workers` greater than one, large uncompressed files
+    are parsed and converted in chunks over that many processes.
+    """
+    if isinstance(csv_file, Path) and csv_name(csv_file.name) == csv_file.name:
+        if csv_file.stat().st_size < chunk_min_bytes:
+            chunk_workers = 1
+        return _read_mapped(csv_file, type, filename, chunk_workers)
+
+    with timer.phase("csv_read"):
+        rows, header = read_csv(csv_file)
+    timer.count("csv_read", len(rows))
+    if not _check_fields(header, type, filename):
+        return None
+    if not _check_rows_fit(rows, header, type, filename):
+        return None
+
+    with timer.phase("type_convert", len(rows)):
+        return (type_convert_rows(rows, header, type), header)
+
+
+def validate_roi_files(
+    meta_file: Path | ArchiveMember,
+    props_file: Path | ArchiveMember,
+    filename: str,
+    image_name: str,
+    skip_missing: bool = False,
+    chunk_workers: int = 1,
+    digest: str | None = None,
+) -> tuple[dict | None, bool, int, int, dict[str, list[int]]] | None:
+    """
+    Validate a single pair of nucleiMeta/nucleiProps files.
+
+    With `chunk_workers` greater than one, each large file is parsed in chunks
+    over that many processes (see `read_converted`). The `digest` of the file
+    pair is computed unless it is passed in.
+
+    Returns a tuple of the modeled ROI, whether the ROI passed validation, the
+    number of nuclei processed and skipped, and the ObjectCodes violating each
+    data integrity rule. The nuclei of the modeled ROI are tuples of values,
+    in the order of the Django field names in its "fields" entry, and its
+    "digest" is that of the file pair (see `hips_etl.cache.roi_digest`). If
+    the filename does not match the expected pattern, the ROI is None. If an
+    error is found that should stop validation of the whole directory,
+    returns None.
+    """
+    success = True
+
+    # Check that the filename matches the expected pattern.
+    match = csv_filename_pattern.match(filename)
+    if not match:
+        logger.warning("Filename %s does not match the pattern", filename)
+        return (None, False, 0, 0, {})
+
+    # Create an ROI entry for the modeled data.
+    if digest is None:
+        with timer.phase("digest"):
+            digest = cache.roi_digest(meta_file, props_file)
+    roi = {
+        "name": match.group("roi"),
+        "left": int(match.group("left")),
+        "top": int(match.group("top")),
+        "right": int(match.group("right")),
+        "bottom": int(match.group("bottom")),
+        "digest": digest,
+        "fields": (),
+        "nuclei": [],
+    }
+
+    # Check that the case name matches the directory name.
+    if match.group("image") != image_name:
+        logger.warning(
+            "Image name for %s does not match directory name %s", filename, image_name
+        )
+        success = False
+
+    # Read the CSV files, check that the fields match the expected fields, and
+    # convert the data.
+    meta = read_converted(meta_file, "meta", filename, chunk_workers)
+    if meta is None:
+        return None
+
+    props = read_converted(props_file, "props", filename, chunk_workers)
+    if props is None:
+        return None
+
+    (meta_rows, meta_header), (props_rows, props_header) = meta, props
+    if meta_rows is None or props_rows is None:
+        return None
+
+    with timer.phase("cross_checks", len(meta_rows)):
+        checked = _cross_check(
+            meta_rows, meta_header, props_rows, props_header, filename, skip_missing
+        )
+    if checked is None:
+        return None
+
+    checks_success, total, skipped, metas, propss, violations = checked
+    success = success and checks_success
+
+    # Add the nucleus data to the ROI.
+    roi["fields"], construct_nucleus = nucleus_projection(meta_header, props_header)
+    with timer.phase("construct_nucleus", len(metas)):
+        roi["nuclei"] = list(map(construct_nucleus, metas, propss))
+
+    return (roi, success, total, skipped, violations)
+
+
+def _cross_check(
+    meta_rows: list[tuple],
+    meta_header: list[str],
+    props_rows: list[tuple],
+    props_header: list[str],
+    filename: str,
+    skip_missing: bool,
+) -> tuple | None:
+    """
+    Match up the meta and props rows of a file pair by ObjectCode and check them.
+
+    Returns whether the checks passed, the number of nuclei processed and
+    skipped, the meta and props rows of the nuclei that are kept, and the
+    ObjectCodes violating each data integrity rule. Returns None
+    if an error is found that should stop validation of the whole directory.
+    """
+    success = True
+
+    # Resolve the position of each field once for the whole file.
+    meta_index = {key: i for i, key in enumerate(meta_header)}
+    props_index = {key: i for i, key in enumerate(props_header)}
+
+    # Construct a mapping from ObjectCode to row for both meta and props.
+    meta_dict = get_object_mapping(meta_rows, meta_index["Identifier.ObjectCode"])
+    if meta_dict is None:
+        logger.error("Duplicate ObjectCodes found in meta data for %s", filename)
+        return None
+
+    props_dict = get_object_mapping(props_rows, props_index["Identifier.ObjectCode"])
+    if props_dict is None:
+        logger.error("Duplicate ObjectCodes found in props data for %s", filename)
+        return None
+
+    # Check that the ObjectCodes in meta and props match.
+    if set(meta_dict.keys()) != set(props_dict.keys()):
+        logger.error("ObjectCodes in %s do not match between meta and props", filename)
+        return None
+
+    # Check for missing values, and line up the meta and props rows of the
+    # nuclei that are kept.
+    total = len(meta_dict)
+    skipped = 0
+    object_codes = []
+    metas = []
+    propss = []
+    for id, meta in meta_dict.items():
+        props = props_dict[id]
+        skip = False
+
+        # Ensure no missing values in meta and props.
+        if None in meta:
+            for key, value in zip(meta_header, meta):
+                if value is None:
                     if not skip_missing:
-                        logger.error(f"meta[{id}][{key}] is missing")
+                        logger.error("meta[%s][%s] is missing", id, key)
                         success = False
                     else:
                         logger.warning(
-                            f"meta[{id}][{key}] is missing (skipping this record)"
+                            "meta[%s][%s] is missing (skipping this record)", id, key
                         )
                         skip = True
 
-            for key in props:
-                if props[key] is None:
+        if None in props:
+            for key, value in zip(props_header, props):
+                if value is None:
                     if not skip_missing:
-                        logger.error(f"props[{id}][{key}] is missing")
+                        logger.error("props[%s][%s] is missing", id, key)
                         success = False
                     else:
                         logger.warning(
-                            f"props[{id}][{key}] is missing (skipping this record)"
+                            "props[%s][%s] is missing (skipping this record)", id, key
                         )
                         skip = True
 
-            if skip:
-                skipped += 1
-                continue
-
-            # Check that the [X|Y]min values match.
-            if meta["Identifier.Xmin"] != props["Identifier.Xmin"]:
-                logger.warning(f"meta[{id}][Xmin] and props[{id}][Xmin] do not match")
-                success = False
-            if meta["Identifier.Ymin"] != props["Identifier.Ymin"]:
-                logger.warning(f"meta[{id}][Ymin] and props[{id}][Ymin] do not match")
-                success = False
-
-            # Check that the [X|Y]max values are off-by-one.
-            if meta["Identifier.Xmax"] != props["Identifier.Xmax"] - 1:
-                logger.warning(
-                    f"meta[{id}][Xmax] and props[{id}][Xmax] are not off by one"
-                )
-                success = False
-            if meta["Identifier.Ymax"] != props["Identifier.Ymax"] - 1:
-                logger.warning(
-                    f"meta[{id}][Ymax] and props[{id}][Ymax] are not off by one"
-                )
-                success = False
-
-            # Check for properly rounded centroid values.
-            if meta["Identifier.CentroidX"] != math.floor(
-                props["Identifier.CentroidX"]
-            ):
-                logger.warning(
-                    f"meta[{id}][Identifier.CentroidX] is not the floor of props[{id}][Identifier.CentroidX]"
-                )
-                success = False
+        if skip:
+            skipped += 1
+            continue
 
-            if meta["Identifier.CentroidY"] != math.floor(
-                props["Identifier.CentroidY"]
-            ):
-                logger.warning(
-                    f"meta[{id}][Identifier.CentroidY] is not the floor of props[{id}][Identifier.CentroidY]"
-                )
-                success = False
+        object_codes.append(id)
+        metas.append(meta)
+        propss.append(props)
 
-            # Add the nucleus data to the ROI.
-            nucleus = construct_nucleus(meta, props)
-            roi["nuclei"].append(nucleus)
+    # Check the data integrity properties between meta and props.
+    violations = find_violations(
+        object_codes, metas, propss, meta_index, props_index
+    )
+    if any(violations.values()):
+        log_violations(violations)
+        success = False
 
-        modeled["roi"].append(roi)
-        logger.dedent()
+    return (success, total, skipped, metas, propss, violations)
+
+
+def load_roi_nuclei(
+    meta_file: Path | ArchiveMember,
+    props_file: Path | ArchiveMember,
+    chunk_workers: int = 1,
+) -> list[tuple] | None:
+    """
+    Read the nuclei of a file pair that is known to be valid, without checking it again.
+
+    This rebuilds the nuclei of a cached validation result (see
+    `_validate_roi_files_cached`). The rows are paired up by ObjectCode and
+    nuclei with missing values are skipped, as by `validate_roi_files` with
+    `skip_missing`; the nuclei are laid out as in its "fields" entry. Returns
+    None if the files can no longer be read as they were when validated.
+    """
+    meta = read_converted(meta_file, "meta", meta_file.name, chunk_workers)
+    props = read_converted(props_file, "props", props_file.name, chunk_workers)
+    if meta is None or props is None or meta[0] is None or props[0] is None:
+        return None
+
+    (meta_rows, meta_header), (props_rows, props_header) = meta, props
+    meta_dict = get_object_mapping(meta_rows, meta_header.index("Identifier.ObjectCode"))
+    props_dict = get_object_mapping(props_rows, props_header.index("Identifier.ObjectCode"))
+    if meta_dict is None or props_dict is None or meta_dict.keys() != props_dict.keys():
+        return None
+
+    _, construct_nucleus = nucleus_projection(meta_header, props_header)
+    with timer.phase("construct_nucleus", len(meta_dict)):
+        return [
+            construct_nucleus(meta, props)
+            for id, meta in meta_dict.items()
+            if None not in meta and None not in (props := props_dict[id])
+        ]
+
+
+class CachedNuclei(Sequence):
+    """
+    The nuclei of a file pair whose cached verdict says it is valid.
+
+    The files are only read (with `load_roi_nuclei`) once the nuclei are
+    first used, so validating unchanged files does not parse them at all.
+    Raises `HipsValidationError` if the files can no longer be read as they
+    were when validated.
+    """
+
+    def __init__(
+        self,
+        meta_file: Path | ArchiveMember,
+        props_file: Path | ArchiveMember,
+        filename: str,
+        chunk_workers: int = 1,
+    ):
+        self.meta_file = meta_file
+        self.props_file = props_file
+        self.filename = filename
+        self.chunk_workers = chunk_workers
+
+    @cached_property
+    def nuclei(self) -> list[tuple]:
+        # The log output of reading the files was already cached with the verdict.
+        nuclei, _, _ = run_captured(
+            0, load_roi_nuclei, self.meta_file, self.props_file, self.chunk_workers
+        )
+        if nuclei is None:
+            raise HipsValidationError(f"{self.filename} changed since it was validated")
+
+        return nuclei
+
+    def __getitem__(self, index):
+        return self.nuclei[index]
+
+    def __len__(self) -> int:
+        return len(self.nuclei)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self.nuclei)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CachedNuclei):
+            other = other.nuclei
+        return isinstance(other, list) and self.nuclei == other
+
+    def __repr__(self) -> str:
+        return f"<CachedNuclei of {self.filename}>"
+
+
+def preflight_roi_files(
+    meta_file: Path | ArchiveMember,
+    props_file: Path | ArchiveMember,
+    filename: str,
+    image_name: str,
+    skip_missing: bool = False,
+    sample_rows: int = 100,
+) -> bool | None:
+    """
+    Quickly check a single pair of nucleiMeta/nucleiProps files.
+
+    Only the filename, the headers and the first `sample_rows` rows of each
+    file are checked. Returns whether the files passed the check, or None if an
+    error is found that should stop validation of the whole directory.
+    """
+    success = True
+
+    match = csv_filename_pattern.match(filename)
+    if not match:
+        logger.warning("Filename %s does not match the pattern", filename)
+        return False
+
+    if match.group("image") != image_name:
+        logger.warning(
+            "Image name for %s does not match directory name %s", filename, image_name
+        )
+        success = False
+
+    meta_rows, meta_header = read_csv(meta_file, limit=sample_rows)
+    props_rows, props_header = read_csv(props_file, limit=sample_rows)
+    if not check_structure(meta_rows, meta_header, props_rows, props_header, filename):
+        return None
+
+    meta_rows = type_convert_meta(meta_rows, meta_header)
+    props_rows = type_convert_props(props_rows, props_header)
 
-    logger.info(f"Processed {total} nuclei (skipped {skipped})")
+    if meta_rows is None or props_rows is None:
+        return None
+
+    for kind, rows in (("Meta", meta_rows), ("Props", props_rows)):
+        if not any(None in row for row in rows):
+            continue
+
+        if skip_missing:
+            logger.warning(
+                "%s sample for %s has missing values (these records will be skipped)",
+                kind,
+                filename,
+            )
+        else:
+            logger.error("%s sample for %s has missing values", kind, filename)
+            success = False
+
+    return success
+
+
+@contextmanager
+def open_violations_file(violations_file: Path | None) -> Iterator[TextIO | None]:
+    """Open the JSONL violations file for writing, if one was requested."""
+    if violations_file is None:
+        yield None
+        return
+
+    with open(violations_file, "w") as f:
+        yield f
+
+
+def _run_captured_timed(
+    limit: int, func: Callable, *args
+) -> tuple[object, list, Diagnostics, PhaseTimer]:
+    """
+    Call `func(*args)` with `run_captured`, also capturing its phase timings.
+
+    Returns the output of `run_captured` followed by the timings, for the
+    parent process to add up (see `hips_etl.profiling.PhaseTimer.merge`).
+    """
+    with timer.capture() as timings:
+        output = run_captured(limit, func, *args)
+
+    return (*output, timings)
+
+
+def _validate_roi_files_captured(
+    limit: int, *args
+) -> tuple[tuple | None, list, Diagnostics, PhaseTimer]:
+    """
+    Run `validate_roi_files` in a worker process, capturing its log output.
+
+    The parent process replays the log output so that it stays in filename
+    order (see `hips_etl.logging.run_captured`).
+    """
+    return _run_captured_timed(limit, validate_roi_files, *args)
+
+
+def _validate_roi_files_cached(
+    cache_dir: Path,
+    limit: int,
+    meta_file: Path | ArchiveMember,
+    props_file: Path | ArchiveMember,
+    filename: str,
+    image_name: str,
+    skip_missing: bool = False,
+    chunk_workers: int = 1,
+) -> tuple[tuple | None, list, Diagnostics, PhaseTimer]:
+    """
+    Run `_validate_roi_files_captured`, reusing its verdict for unchanged files.
+
+    Only the verdict of each file pair (its result without the nuclei) and its
+    log output are stored in `cache_dir`, keyed by the digest of the files
+    (see `hips_etl.cache.cache_key`). For a valid file pair found in the
+    cache, the nuclei are only read from the files again, without checking
+    them, once they are used (see `CachedNuclei`).
+    """
+    timings = PhaseTimer()
+    with timings.phase("cache_lookup"):
+        digest = cache.cached_roi_digest(cache_dir, meta_file, props_file)
+        key = cache.cache_key(digest, filename, image_name, skip_missing)
+        entry = cache.load(cache_dir, key)
+
+    if entry is None:
+        output = _validate_roi_files_captured(
+            limit, meta_file, props_file, filename, image_name, skip_missing, chunk_workers, digest
+        )
+        verdict = output[0]
+        if verdict is not None and verdict[0] is not None:
+            verdict = ({**verdict[0], "nuclei": []}, *verdict[1:])
+        cache.store(cache_dir, key, (verdict, output[1], output[2]))
+        output[3].merge(timings)
+
+        return output
+
+    result, records, worker_diagnostics = entry
+    if result is not None and result[0] is not None and result[1]:
+        nuclei = CachedNuclei(meta_file, props_file, filename, chunk_workers)
+        result = ({**result[0], "nuclei": nuclei}, *result[1:])
+
+    note = logger.makeRecord(
+        logger.name,
+        logging.INFO,
+        __file__,
+        0,
+        "Using cached validation results",
+        None,
+        None,
+    )
+    return (result, [note] + records, worker_diagnostics, timings)
+
+
+def _replay(filename: str, output: tuple) -> tuple | None:
+    """Log the captured output of validating a file pair and return its result."""
+    result, records, worker_diagnostics, timings = output
+
+    logger.info("Validating %s", filename)
+    logger.indent()
+    replay(records, worker_diagnostics)
+    logger.dedent()
+    timer.merge(timings)
+
+    return result
+
+
+def _validate_tasks(
+    tasks: Iterable[tuple], workers: int, cache_dir: Path | None = None
+) -> Iterator[tuple[str, tuple | None]]:
+    """
+    Run `validate_roi_files` over a sequence of argument tuples.
+
+    Yields (filename, result) pairs in the order of `tasks`. With more than one
+    worker, the tasks are spread over a process pool; only a bounded number of
+    tasks are in flight at once so that results do not pile up in memory. With
+    a `cache_dir`, results for unchanged files are taken from the cache.
+    """
+    if workers <= 1 and cache_dir is None:
+        for task in tasks:
+            filename = task[2]
+            logger.info("Validating %s", filename)
+            logger.indent()
+            result = validate_roi_files(*task)
+            logger.dedent()
+
+            yield (filename, result)
+        return
+
+    if cache_dir is None:
+        run = partial(_validate_roi_files_captured, diagnostics.limit)
+    else:
+        run = partial(_validate_roi_files_cached, cache_dir, diagnostics.limit)
+
+    if workers <= 1:
+        for task in tasks:
+            filename = task[2]
+            yield (filename, _replay(filename, run(*task)))
+        return
+
+    tasks = iter(tasks)
+    executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(task: tuple) -> tuple[str, Future]:
+        return (task[2], executor.submit(run, *task))
+
+    try:
+        pending = deque(submit(task) for task in islice(tasks, 2 * workers))
+        while pending:
+            filename, future = pending.popleft()
+            if (task := next(tasks, None)) is not None:
+                pending.append(submit(task))
+
+            yield (filename, _replay(filename, future.result()))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _tar_file_pairs(
+    archive: Path,
+) -> Iterator[tuple[ArchiveMember, ArchiveMember, str]]:
+    """Yield the file pairs of a tar archive as they are read from it."""
+    unpaired = yield from iter_tar_csv_pairs(archive, ("nucleiMeta", "nucleiProps"))
+
+    if unpaired is None:
+        logger.error("Subdirectories nucleiMeta and nucleiProps must both exist")
+        raise HipsValidationError(
+            "Subdirectories nucleiMeta and nucleiProps must both exist"
+        )
+
+    if unpaired:
+        logger.error("Files in nucleiMeta and nucleiProps do not match")
+        raise HipsValidationError("Files in nucleiMeta and nucleiProps do not match")
+
+
+def roi_file_pairs(
+    data_dir: Path,
+) -> Iterable[tuple[Path | ArchiveMember, Path | ArchiveMember, str]]:
+    """
+    Find the nucleiMeta/nucleiProps file pairs of a hips data directory.
+
+    Returns (meta file, props file, filename) tuples in filename order, where
+    the filename has any compression suffix removed. Raises
+    `HipsValidationError` if the directory does not have the expected layout.
+
+    `data_dir` may also be a zip or tar archive of a data directory. The pairs
+    of a tar archive are produced lazily in archive order, as the archive can
+    only be read front to back; layout errors are then only raised once the
+    whole archive has been read.
+    """
+    if is_archive(data_dir) and data_dir.is_file():
+        if not data_dir.name.endswith(".zip"):
+            return _tar_file_pairs(data_dir)
+
+        meta_files = list_zip_csv_files(data_dir, "nucleiMeta")
+        props_files = list_zip_csv_files(data_dir, "nucleiProps")
+    else:
+        # Check that the data directory exists and is a directory.
+        if not dir_exists(data_dir):
+            logger.error("No such directory %s", data_dir)
+            raise HipsValidationError(f"No such directory {data_dir}")
+
+        # Check that the data directory contains `nucleiMeta` and `nucleiProps` subdirectories.
+        meta_dir = data_dir / "nucleiMeta"
+        props_dir = data_dir / "nucleiProps"
+        meta_files = list_csv_files(meta_dir) if dir_exists(meta_dir) else None
+        props_files = list_csv_files(props_dir) if dir_exists(props_dir) else None
+
+    if meta_files is None or props_files is None:
+        logger.error("Subdirectories nucleiMeta and nucleiProps must both exist")
+        raise HipsValidationError(
+            "Subdirectories nucleiMeta and nucleiProps must both exist"
+        )
+
+    # Make sure that each subdirectory contains the same set of files.
+    filenames = check_same_filenames(meta_files, props_files)
+    if filenames is None:
+        logger.error("Files in nucleiMeta and nucleiProps do not match")
+        raise HipsValidationError("Files in nucleiMeta and nucleiProps do not match")
+
+    return [
+        (meta_files[filename], props_files[filename], filename)
+        for filename in sorted(filenames)
+    ]
+
+
+def roi_digests(data_dir: Path) -> dict[str, str]:
+    """
+    Compute the digest of the files of each ROI of a hips data directory.
+
+    Returns a mapping from ROI name to the digest of its nucleiMeta/nucleiProps
+    file pair (see `hips_etl.cache.roi_digest`). Files whose name does not
+    match the expected pattern are left out.
+    """
+    digests = {}
+    for meta_file, props_file, filename in roi_file_pairs(data_dir):
+        match = csv_filename_pattern.match(filename)
+        if match is not None:
+            digests[match.group("roi")] = cache.roi_digest(meta_file, props_file)
+
+    return digests
+
+
+def stream_hips_dir(
+    data_dir: Path,
+    skip_missing: bool = False,
+    workers: int = 1,
+    violations_file: Path | None = None,
+    cache_dir: Path | None = None,
+    chunk_workers: int = 1,
+    skip_rois: Container[str] = (),
+) -> Iterator[dict]:
+    """
+    Validate the data in a hips data directory, yielding one ROI at a time.
+
+    With `workers` greater than one, the nucleiMeta/nucleiProps file pairs are
+    validated in parallel in a process pool; ROIs and log output are still
+    produced in filename order.
+
+    `data_dir` may also be a zip or tar archive of a data directory, and the
+    CSV files may be compressed; they are read without being extracted to
+    disk (see `roi_file_pairs`).
+
+    Only one ROI (or a few per worker) is held in memory at a time, so callers
+    can store each ROI and discard it before the next one is read. Once the directory is known
+    to be invalid, the remaining ROIs are still validated (so that every
+    problem is reported) but are no longer yielded. Raises
+    `HipsValidationError` when validation fails.
+
+    Violations of the data integrity rules are logged as one summary line per
+    rule and file. If `violations_file` is given, every violation is also
+    written to it as a line of JSON.
+
+    Repeated warnings and errors are rate limited by `hips_etl.logging`; a
+    table of their counts is logged once the whole directory is processed.
+
+    With a `cache_dir`, the results of validating each file pair are kept
+    there, and reused (along with their log output) as long as the files and
+    field definitions do not change.
+
+    With `chunk_workers` greater than one, large CSV files are also split into
+    chunks that are parsed in parallel over that many processes (per file
+    being validated).
+
+    The files of the ROIs named in `skip_rois` (e.g. ROIs that are already
+    stored, when resuming an ingest) are neither validated nor yielded.
+    """
+    diagnostics.reset()
+
+    def skipped_roi(filename: str) -> bool:
+        match = csv_filename_pattern.match(filename)
+        return match is not None and match.group("roi") in skip_rois
+
+    if skip_rois:
+        logger.info("Skipping %s ROIs that are already ingested", len(skip_rois))
+
+    # Validate each file in the directories, in filename order (archive order
+    # for tar archives).
+    image_name = hips_image_name(data_dir)
+    tasks = (
+        (meta_file, props_file, filename, image_name, skip_missing, chunk_workers)
+        for meta_file, props_file, filename in roi_file_pairs(data_dir)
+        if not skipped_roi(filename)
+    )
+
+    success = True
+    skipped = 0
+    total = 0
+    violation_counts = Counter()
+    with open_violations_file(violations_file) as violations_out:
+        for filename, result in _validate_tasks(tasks, workers, cache_dir):
+            if result is None:
+                raise HipsValidationError(f"Failed to validate {filename}")
+
+            roi, roi_success, roi_total, roi_skipped, violations = result
+            success = success and roi_success
+            total += roi_total
+            skipped += roi_skipped
+
+            for rule, object_codes in violations.items():
+                violation_counts[rule] += len(object_codes)
+                if violations_out is not None:
+                    for object_code in object_codes:
+                        record = {
+                            "file": filename,
+                            "rule": rule,
+                            "ObjectCode": object_code,
+                        }
+                        violations_out.write(json.dumps(record) + "\n")
+
+            if success:
+                yield roi
+
+    logger.info("Processed %s nuclei (skipped %s)", total, skipped)
+
+    for rule, count in violation_counts.items():
+        if count:
+            logger.warning("%s nuclei violate the %s rule", count, rule)
+
+    log_diagnostics()
 
     if success:
         logger.info("Data directory is valid")
     else:
         logger.error("Data directory is invalid")
-    return modeled if success else None
+        raise HipsValidationError(f"Data directory {data_dir} is invalid")
+
+
+def preflight_hips_dir(
+    data_dir: Path, skip_missing: bool = False, sample_rows: int = 100
+):
+    """
+    Quickly check the data in a hips data directory.
+
+    Every filename is matched against the expected pattern, and the headers
+    and the first `sample_rows` rows of every file are checked and type
+    converted; the cross-checks between meta and props are not run. Raises
+    `HipsValidationError` as soon as a structural error is found, or at the
+    end if any file failed the check.
+    """
+    diagnostics.reset()
+
+    image_name = hips_image_name(data_dir)
+
+    success = True
+    checked = 0
+    for meta_file, props_file, filename in roi_file_pairs(data_dir):
+        logger.info("Checking %s", filename)
+        logger.indent()
+        result = preflight_roi_files(
+            meta_file, props_file, filename, image_name, skip_missing, sample_rows
+        )
+        logger.dedent()
+
+        if result is None:
+            raise HipsValidationError(f"Failed to check {filename}")
+
+        success = success and result
+        checked += 1
+
+    logger.info("Checked %s file pairs", checked)
+
+    log_diagnostics()
+
+    if success:
+        logger.info("Preflight check passed")
+    else:
+        logger.error("Preflight check failed")
+        raise HipsValidationError(f"Data directory {data_dir} failed the preflight check")
+
+
+def validate_hips_dir(
+    data_dir: Path,
+    skip_missing: bool = False,
+    workers: int = 1,
+    violations_file: Path | None = None,
+    cache_dir: Path | None = None,
+    chunk_workers: int = 1,
+    preflight: bool = False,
+    sample_rows: int = 100,
+    profile: bool = False,
+) -> dict | None:
+    """
+    Validate the data in a hips data directory.
+
+    Returns the modeled data for the whole directory, or None if validation
+    fails. Use `stream_hips_dir` to avoid holding every ROI in memory at once.
+
+    With `preflight`, only runs the quick checks of `preflight_hips_dir`; the
+    modeled data then has no ROIs.
+
+    With `profile`, a table of the time spent in each phase of validation
+    (and the rows per second processed) is logged at the end; see
+    `hips_etl.profiling`.
+    """
+    modeled = {
+        "image": hips_image_name(data_dir),
+        "roi": [],
+    }
+
+    if preflight:
+        try:
+            preflight_hips_dir(
+                data_dir, skip_missing=skip_missing, sample_rows=sample_rows
+            )
+        except HipsValidationError:
+            return None
+
+        return modeled
+
+    timer.reset()
+    try:
+        for roi in stream_hips_dir(
+            data_dir,
+            skip_missing=skip_missing,
+            workers=workers,
+            violations_file=violations_file,
+            cache_dir=cache_dir,
+            chunk_workers=chunk_workers,
+        ):
+            modeled["roi"].append(roi)
+    except HipsValidationError:
+        return None
+    finally:
+        if profile:
+            log_timings()
+
+    return modeled
@@ -1,6 +1,22 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps as global_apps
+from django.db.models.signals import post_migrate
+
+
+def ensure_nucleus_indexes(sender, using, apps=global_apps, **kwargs):
+    """Build the indexes of the nucleus table that a killed ingest left dropped."""
+    from hipsdb.loaders import ensure_indexes
+
+    try:
+        model = apps.get_model('hipsdb', 'Nucleus')
+    except LookupError:
+        # The app's migrations were reverted.
+        return
+    ensure_indexes(model, using=using)
 
 
 class HipsdbConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "hipsdb"
+
+    def ready(self):
+        post_migrate.connect(ensure_nucleus_indexes, sender=self)
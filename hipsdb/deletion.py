@@ -0,0 +1,137 @@
+from typing import Callable
+
+from django.db import connection, transaction
+from django.db.models import QuerySet
+
+from hipsdb.models import ROI, Image, Nucleus, nucleus_feature_models
+
+
+def _quote(*names: str) -> tuple[str, ...]:
+    return tuple(map(connection.ops.quote_name, names))
+
+
+def delete_nuclei(
+    roi_id: int,
+    batch_size: int = 10000,
+    progress: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Delete the nuclei of an ROI with raw SQL, at most `batch_size` at a time.
+
+    Unlike `QuerySet.delete`, this does not load the nuclei (or their primary
+    keys) into memory. The rows of a batch are deleted from the feature tables
+    first, and then from the nucleus table. Outside of a transaction each batch
+    is committed on its own, so the database is only locked against other
+    writers (and, on SQLite, readers) for one batch at a time. `progress` is
+    called with the number of nuclei deleted by each batch. Returns the number
+    of nuclei deleted.
+    """
+    table, pk, roi, code = _quote(
+        Nucleus._meta.db_table,
+        Nucleus._meta.pk.column,
+        Nucleus._meta.get_field('roi').column,
+        Nucleus._meta.get_field('Identifier_ObjectCode').column,
+    )
+    # Ordered by the unique index of the ROI and object code, so that each
+    # statement of a batch picks the same nuclei.
+    batch = f'SELECT {pk} FROM {table} WHERE {roi} = %s ORDER BY {code} LIMIT %s'
+    feature_sqls = [
+        f'DELETE FROM {feature_table} WHERE {nucleus} IN ({batch})'
+        for feature_table, nucleus in (
+            _quote(model._meta.db_table, model._meta.pk.column) for model in nucleus_feature_models
+        )
+    ]
+    sql = f'DELETE FROM {table} WHERE {pk} IN ({batch})'
+
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for feature_sql in feature_sqls:
+                cursor.execute(feature_sql, [roi_id, batch_size])
+            cursor.execute(sql, [roi_id, batch_size])
+            count = cursor.rowcount
+
+        deleted += count
+        if progress is not None and count:
+            progress(count)
+        if count < batch_size:
+            return deleted
+
+
+def delete_rois(
+    rois: QuerySet[ROI],
+    batch_size: int = 10000,
+    progress: Callable[[int], None] | None = None,
+) -> tuple[int, int]:
+    """
+    Delete ROIs and their nuclei without the cascade collector.
+
+    The nuclei of each ROI are deleted in batches (see `delete_nuclei`), and
+    then the ROI itself. The stored counts of the images the ROIs belonged to
+    are updated. Returns the number of ROIs and nuclei deleted.
+    """
+    table, pk = _quote(ROI._meta.db_table, ROI._meta.pk.column)
+
+    roi_ids = dict(rois.values_list('pk', 'image'))
+    nuclei = 0
+    for roi_id in roi_ids:
+        nuclei += delete_nuclei(roi_id, batch_size, progress)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {pk} = %s', [roi_id])
+
+    Image.objects.filter(pk__in=set(roi_ids.values())).update_counts()
+    return (len(roi_ids), nuclei)
+
+
+def delete_images(
+    images: QuerySet[Image],
+    batch_size: int = 10000,
+    progress: Callable[[int], None] | None = None,
+) -> tuple[int, int, int]:
+    """
+    Delete images with their ROIs and nuclei without the cascade collector.
+
+    See `delete_rois`. Returns the number of images, ROIs and nuclei deleted.
+    """
+    table, pk = _quote(Image._meta.db_table, Image._meta.pk.column)
+
+    image_ids = list(images.values_list('pk', flat=True))
+    rois = nuclei = 0
+    for image_id in image_ids:
+        counts = delete_rois(ROI.objects.filter(image_id=image_id), batch_size, progress)
+        rois += counts[0]
+        nuclei += counts[1]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {pk} = %s', [image_id])
+
+    return (len(image_ids), rois, nuclei)
+
+
+def reclaim_space():
+    """
+    Return the space freed by deletes to the operating system (or for reuse).
+
+    On SQLite, the database file is shrunk with an incremental vacuum. A
+    database that does not use incremental auto-vacuum yet is switched to it,
+    which takes one full VACUUM (rewriting the whole file); later calls only
+    release the free pages. On PostgreSQL, the tables are vacuumed (and
+    analyzed) so that the space of deleted rows can be reused. Must be called
+    outside of a transaction.
+    """
+    tables = _quote(
+        Nucleus._meta.db_table,
+        *(model._meta.db_table for model in nucleus_feature_models),
+        ROI._meta.db_table,
+        Image._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+            cursor.execute('PRAGMA incremental_vacuum')
+            # The pragma frees pages as its result rows are stepped through.
+            cursor.fetchall()
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'VACUUM (ANALYZE) {", ".join(tables)}')
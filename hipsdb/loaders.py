@@ -0,0 +1,275 @@
+from contextlib import contextmanager
+import csv
+import io
+from operator import itemgetter
+from typing import Callable, Iterable, Sequence
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Model
+
+from hipsdb.models import Nucleus, nucleus_feature_models, nucleus_field_models
+from hips_etl.profiling import timer
+
+
+def ensure_indexes(model: type[Model] = Nucleus, using: str = DEFAULT_DB_ALIAS) -> list[str]:
+    """
+    Build the indexes and constraints declared on the nucleus table that are missing.
+
+    They are missing when a bulk load (see `deferred_indexes`) was killed
+    before it could build them again. `model` may be a historical model of a
+    migration. Returns the names of the indexes that were built.
+    """
+    db = connections[using]
+    editor = db.schema_editor()
+    built = []
+    with db.cursor() as cursor:
+        existing = db.introspection.get_constraints(cursor, model._meta.db_table)
+        for index in [*model._meta.indexes, *model._meta.constraints]:
+            if index.name not in existing:
+                cursor.execute(str(index.create_sql(model, editor)))
+                built.append(index.name)
+    return built
+
+
+@contextmanager
+def deferred_indexes():
+    """
+    Drop the indexes of the nucleus table, and build them again on exit.
+
+    Building an index once over all rows is much faster than updating it with
+    every insert. The indexes are those declared on `Nucleus`, except for the
+    unique constraint of the ROI and ObjectCode, which is kept: statements run
+    during a load that look up the nuclei of an ROI (deleting replaced ROIs,
+    filling the spatial index) use it, and it keeps ObjectCodes unique.
+
+    The indexes are only dropped when the nucleus table is empty. Outside of a
+    transaction a dropped index stays dropped until the load ends, and a
+    killed load would leave a full table without its indexes; rebuilding them
+    for a few added images would also cost more than it saves. Missing
+    indexes are built again by `ensure_indexes`, which runs on exit, at the
+    start of an ingest and after migrations.
+    """
+    table = Nucleus._meta.db_table
+    if Nucleus.objects.exists():
+        yield
+        return
+
+    editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        existing = connection.introspection.get_constraints(cursor, table)
+        for index in Nucleus._meta.indexes:
+            if index.name in existing:
+                cursor.execute(editor.sql_delete_index % {
+                    'table': connection.ops.quote_name(table),
+                    'name': connection.ops.quote_name(index.name),
+                })
+
+    try:
+        yield
+    finally:
+        with timer.phase('index_rebuild'):
+            ensure_indexes()
+
+
+class NucleusLoader:
+    """
+    Write batches of validated nuclei to the database, through the ORM.
+
+    A batch is a list of value tuples laid out as `fields`, the Django field
+    names of `Nucleus` and its feature models (as in the "fields" entry of a
+    modeled ROI). Each nucleus is written as a row of the nucleus table and a
+    row of each feature table. This is the reference implementation; the
+    subclasses write the same rows without creating model instances.
+    """
+
+    name = 'orm'
+    vendor = None
+
+    def prepare(self):
+        """Configure the database connection for loading. Call this outside of transactions."""
+
+    @contextmanager
+    def session(self):
+        """Wrap a whole run of loads, e.g. to rebuild indexes afterwards."""
+        yield
+
+    def load(self, roi_id: int, fields: Sequence[str], rows: list[tuple]):
+        (_, names, pick), *features = self.groups(fields)
+        with timer.phase('model_construction', len(rows)):
+            nuclei = [Nucleus(roi_id=roi_id, **dict(zip(names, pick(values)))) for values in rows]
+
+        with transaction.atomic():
+            with timer.phase('bulk_create', len(rows)):
+                Nucleus.objects.bulk_create(nuclei)
+
+            for model, names, pick in features:
+                with timer.phase('model_construction'):
+                    instances = [
+                        model(nucleus_id=nucleus.pk, **dict(zip(names, pick(values))))
+                        for nucleus, values in zip(nuclei, rows)
+                    ]
+
+                with timer.phase('bulk_create'):
+                    model.objects.bulk_create(instances)
+
+    @staticmethod
+    def groups(fields: Sequence[str]) -> list[tuple[type[Model], list[str], Callable[[tuple], tuple]]]:
+        """
+        Split `fields` up by the model that stores them, `Nucleus` first.
+
+        Returns the model, its field names and a function that picks their
+        values out of a row (as a tuple) for each model.
+        """
+        positions = {model: [] for model in (Nucleus, *nucleus_feature_models)}
+        for position, name in enumerate(fields):
+            positions[nucleus_field_models[name]].append(position)
+
+        groups = []
+        for model, model_positions in positions.items():
+            if len(model_positions) == 1:
+                pick = (lambda position: lambda values: (values[position],))(model_positions[0])
+            else:
+                pick = itemgetter(*model_positions) if model_positions else lambda values: ()
+            groups.append((model, [fields[position] for position in model_positions], pick))
+        return groups
+
+    @staticmethod
+    def columns(model: type[Model], names: Sequence[str]) -> str:
+        """Return the quoted column list of fields of `model`."""
+        return ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in names)
+
+
+class SqliteLoader(NucleusLoader):
+    """
+    Write nuclei to SQLite with `executemany`.
+
+    The connection is switched to WAL journaling with relaxed syncing and a
+    large page cache, and the indexes of an empty nucleus table are dropped for
+    the session and rebuilt at its end (see `deferred_indexes`).
+    """
+
+    name = 'sqlite'
+    vendor = 'sqlite'
+    pragmas = (
+        'journal_mode = WAL',
+        'synchronous = NORMAL',
+        'cache_size = -262144',
+        'temp_store = MEMORY',
+    )
+
+    def prepare(self):
+        # These pragmas cannot be changed inside a transaction.
+        if connection.in_atomic_block:
+            return
+
+        with connection.cursor() as cursor:
+            for pragma in self.pragmas:
+                cursor.execute(f'PRAGMA {pragma}')
+
+    @contextmanager
+    def session(self):
+        with deferred_indexes():
+            yield
+
+    @classmethod
+    def insert_sql(cls, model: type[Model], names: Sequence[str]) -> str:
+        placeholders = ', '.join(['%s'] * len(names))
+        return f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({cls.columns(model, names)}) VALUES ({placeholders})'
+
+    def load(self, roi_id: int, fields: Sequence[str], rows: list[tuple]):
+        if not rows:
+            return
+
+        (_, names, pick), *features = self.groups(fields)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(self.insert_sql(Nucleus, ['roi', *names]), [(roi_id, *pick(values)) for values in rows])
+
+            # The table has AUTOINCREMENT IDs, and this transaction holds the
+            # write lock, so the rows got consecutive IDs up to the last one.
+            cursor.execute('SELECT last_insert_rowid()')
+            first_id = cursor.fetchone()[0] - len(rows) + 1
+
+            for model, names, pick in features:
+                cursor.executemany(
+                    self.insert_sql(model, ['nucleus', *names]),
+                    [(first_id + offset, *pick(values)) for offset, values in enumerate(rows)],
+                )
+
+
+class PostgresLoader(NucleusLoader):
+    """
+    Write nuclei to PostgreSQL with `COPY ... FROM STDIN`.
+
+    The IDs of the nuclei are taken from the sequence of the nucleus table up
+    front, so that the rows of the feature tables can be copied with them. The
+    indexes of an empty nucleus table are dropped for the session and rebuilt
+    at its end (see `deferred_indexes`).
+    """
+
+    name = 'postgresql'
+    vendor = 'postgresql'
+
+    def prepare(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET synchronous_commit TO OFF')
+
+    @contextmanager
+    def session(self):
+        with deferred_indexes():
+            yield
+
+    def copy(self, cursor, model: type[Model], names: Sequence[str], rows: Iterable[tuple]):
+        """Copy rows of the fields `names` of `model` into its table."""
+        sql = f'COPY {connection.ops.quote_name(model._meta.db_table)} ({self.columns(model, names)}) FROM STDIN'
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy'):
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            # psycopg2; None is written as an unquoted empty value, which
+            # is NULL in CSV format.
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            raw_cursor.copy_expert(f'{sql} WITH (FORMAT csv)', buffer)
+
+    def load(self, roi_id: int, fields: Sequence[str], rows: list[tuple]):
+        (_, names, pick), *features = self.groups(fields)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [Nucleus._meta.db_table, Nucleus._meta.pk.column, len(rows)],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+            self.copy(cursor, Nucleus, ['id', 'roi', *names], ((id, roi_id, *pick(values)) for id, values in zip(ids, rows)))
+            for model, names, pick in features:
+                self.copy(cursor, model, ['nucleus', *names], ((id, *pick(values)) for id, values in zip(ids, rows)))
+
+
+loaders = {
+    loader.name: loader for loader in (NucleusLoader, SqliteLoader, PostgresLoader)
+}
+
+
+def get_loader(name: str = 'auto') -> NucleusLoader:
+    """
+    Return the loader with the given name.
+
+    'auto' picks the fast loader for the database backend in use, falling back
+    to the ORM loader. Raises ValueError for a loader that does not work with
+    the database backend.
+    """
+    if name == 'auto':
+        for loader in loaders.values():
+            if loader.vendor == connection.vendor:
+                return loader()
+        return NucleusLoader()
+
+    loader = loaders[name]
+    if loader.vendor not in (None, connection.vendor):
+        raise ValueError(f'The {name} loader does not work with a {connection.vendor} database')
+
+    return loader()
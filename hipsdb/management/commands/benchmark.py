@@ -0,0 +1,296 @@
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+import djclick as click
+import gc
+import importlib.metadata
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import platform
+import re
+import sys
+import tempfile
+import time
+
+from hipsdb.loaders import get_loader
+from hipsdb.management.commands.ingest import ingest_image
+from hipsdb.models import Image
+from hipsdb.spatial import nuclei_in_rect
+from hips_etl.logging import logger
+from hips_etl.synthetic import generate_hips_dir
+from hips_etl.types import type_convert_rows
+from hips_etl.utils import read_csv
+from hips_etl.validation import validate_hips_dir
+
+# Largest number of nuclei in one ROI of the benchmark data; larger data sizes
+# are split over several ROIs, as in real images.
+roi_max_nuclei = 100000
+
+# Number of nuclei per page of the API benchmarks.
+page_size = 100
+
+# Amount by which time and memory may exceed their baseline regardless of the
+# threshold, so that noise in very small measurements does not count as a
+# regression. Query counts are deterministic, so any increase counts.
+metric_slack = {'seconds': 0.005, 'peak_mib': 16.0, 'queries': 0}
+
+
+def _status_mib(field: str) -> float:
+    """Read a memory size of this process from /proc/self/status, in MiB."""
+    with open('/proc/self/status') as f:
+        match = re.search(rf'^{field}:\s+(\d+) kB', f.read(), re.MULTILINE)
+    return int(match.group(1)) / 1024
+
+
+def measure(func, repeat: int = 1) -> dict:
+    """
+    Run `func` `repeat` times, and return its best time, peak memory use and number of queries.
+
+    Peak memory is how far the resident set size grew above its size at the
+    start of a run. It is only available on Linux (None elsewhere), where the
+    peak can be reset between runs.
+    """
+    times = []
+    peaks = []
+    for _ in range(repeat):
+        gc.collect()
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            start_rss = _status_mib('VmRSS')
+        except OSError:
+            start_rss = None
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+        if start_rss is not None:
+            peaks.append(_status_mib('VmHWM') - start_rss)
+
+    return {
+        'seconds': min(times),
+        'peak_mib': min(peaks) if peaks else None,
+        'queries': len(queries),
+    }
+
+
+def benchmark_size(data_root: Path, size: int, repeat: int, seed: int) -> dict[str, dict]:
+    """
+    Benchmark the ETL, ingest and API hot paths on synthetic data of `size` nuclei.
+
+    The data is generated in `data_root`, unless it is already there from an
+    earlier run. The ingest is only run once, since its data is needed by the
+    API benchmarks.
+    """
+    rois = math.ceil(size / roi_max_nuclei)
+    data_dir = data_root / f'benchmark-{size}'
+    if not data_dir.exists():
+        click.echo(f'Generating {size:,} nuclei in {data_dir}...')
+        generate_hips_dir(data_dir, rois, size // rois, seed=seed)
+
+    results = {}
+
+    def run(name: str, func, repeat: int = repeat):
+        case = f'{name}[{size}]'
+        results[case] = measure(func, repeat)
+        click.echo(
+            f'    {case:<36} {results[case]["seconds"]:9.3f}s'
+            + (f'  {results[case]["peak_mib"]:9.1f} MiB' if results[case]['peak_mib'] is not None else '')
+            + f'  {results[case]["queries"]:6} queries'
+        )
+
+    # The files of one ROI (all ROIs are the same size).
+    props_file = sorted((data_dir / 'nucleiProps').iterdir())[0]
+    run('read_csv', lambda: read_csv(props_file))
+
+    rows, header = read_csv(props_file)
+    run('type_convert_rows', lambda: type_convert_rows(rows, header, 'props'))
+    del rows
+
+    run('validate_hips_dir', lambda: validate_hips_dir(data_dir))
+
+    def ingest():
+        with get_loader().session(), open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            ingest_image(data_dir)
+
+    run('ingest', ingest, repeat=1)
+
+    image = Image.objects.filter(source=str(data_dir.resolve())).latest('id')
+    roi = image.rois.order_by('id').first()
+    url = f'/hipsdb/images/{image.id}/rois/{roi.id}/nuclei'
+    last_page = max(0, roi.nuclei.count() - page_size)
+    client = Client()
+
+    def get(query: str, url: str = url):
+        response = client.get(f'{url}?{query}')
+        if response.status_code != 200:
+            raise click.ClickException(f'GET {url}?{query} failed: {response.content.decode()}')
+
+    # Warm up the URL resolver and the API schemas.
+    get('limit=1')
+    run('api_nuclei_first_page', lambda: get(f'limit={page_size}'))
+    run('api_nuclei_last_page', lambda: get(f'limit={page_size}&offset={last_page}'))
+    run('api_nuclei_centroids', lambda: get('limit=10000&fields=Identifier_CentroidX&fields=Identifier_CentroidY'))
+
+    # A viewport of 1024x1024 pixels in the middle of the first ROI.
+    viewport = (roi.left + 512, roi.top + 512, roi.left + 1535, roi.top + 1535)
+    run('nuclei_in_rect', lambda: list(nuclei_in_rect(image.id, *viewport).values_list('pk', flat=True)))
+    run('api_image_nuclei_viewport', lambda: get(
+        f'bbox={",".join(map(str, viewport))}&fields=Identifier_CentroidX&fields=Identifier_CentroidY',
+        url=f'/hipsdb/images/{image.id}/nuclei',
+    ))
+
+    return results
+
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """
+    Compare benchmark results with a baseline.
+
+    Time and memory regress if they exceed their baseline by more than
+    `threshold` (as a fraction of the baseline) and by more than their slack;
+    the number of queries regresses if it grows at all. Returns a description
+    of each regression.
+    """
+    regressions = []
+    for case, metrics in results.items():
+        reference_metrics = baseline.get(case)
+        if reference_metrics is None:
+            continue
+
+        for metric, slack in metric_slack.items():
+            value = metrics.get(metric)
+            reference = reference_metrics.get(metric)
+            if value is None or reference is None:
+                continue
+
+            if metric == 'queries':
+                if value > reference:
+                    regressions.append(f'{case}: {value:,} queries instead of {reference:,}')
+                continue
+
+            limit = max(reference * (1 + threshold), reference + slack)
+            if value > limit:
+                regressions.append(f'{case}: {metric} {value:,.3f} exceeds {limit:,.3f} (baseline {reference:,.3f})')
+
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--size",
+    "sizes",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=(1000, 100000, 1000000),
+    show_default=True,
+    help="Number of nuclei to benchmark with (can be supplied multiple times).",
+)
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Number of times to run each benchmark (except ingest); the best run counts.",
+)
+@click.option(
+    "--data-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory to keep the generated benchmark data in, to reuse it in later runs.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the results to this file as JSON (e.g. to use as a baseline).",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Compare the results with those in this JSON file, and fail if any regressed.",
+)
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.2,
+    show_default=True,
+    help="Fraction by which a metric may exceed the baseline before it counts as a regression.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Seed of the generated benchmark data.",
+)
+def benchmark(sizes, repeat, data_dir, output, baseline, threshold, seed):
+    """
+    Benchmark the ETL, ingest and API hot paths.
+
+    Synthetic data (see `generate_hips`) of each size is read with `read_csv`,
+    type converted, validated, ingested into a temporary database and served by
+    the nuclei endpoint, recording the time, peak memory use and number of
+    database queries of each step. The configured database is not touched.
+
+    :param sizes: The numbers of nuclei to benchmark with.
+    :param repeat: The number of times to run each benchmark.
+    :param data_dir: If set, the directory to keep the generated data in.
+    :param output: If set, the file to write the results to as JSON.
+    :param baseline: If set, a JSON file of earlier results to compare with.
+    :param threshold: The fraction by which a metric may exceed the baseline.
+    :param seed: The seed of the generated data.
+    """
+    # Validation warnings about the data itself are not of interest here.
+    logger.setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_root = data_dir or Path(scratch)
+        data_root.mkdir(parents=True, exist_ok=True)
+
+        # Ingest into a throwaway database next to the data.
+        connection.settings_dict['TEST']['NAME'] = str(Path(scratch) / 'benchmark.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {}
+            for size in sizes:
+                click.echo(f'Benchmarking {size:,} nuclei ({connection.vendor}):')
+                results |= benchmark_size(data_root, size, repeat, seed)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    try:
+        version = importlib.metadata.version('hipsdb')
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+
+    report = {
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'vendor': connection.vendor,
+        'results': results,
+    }
+    if output is not None:
+        output.write_text(json.dumps(report, indent=2) + '\n')
+        click.echo(f'Wrote results to {output}')
+
+    if baseline is not None:
+        regressions = find_regressions(results, json.loads(baseline.read_text())['results'], threshold)
+        if regressions:
+            click.echo(f'{len(regressions)} regressions against {baseline}:')
+            for regression in regressions:
+                click.echo(f'    {regression}')
+            sys.exit(1)
+
+        click.echo(f'No regressions against {baseline}')
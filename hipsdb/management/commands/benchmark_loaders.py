@@ -0,0 +1,59 @@
+from django.db import connection, transaction
+import djclick as click
+import time
+
+from hipsdb.loaders import get_loader, loaders
+from hipsdb.models import ROI, Image
+from hips_etl.utils import random_nucleus_values
+
+
+@click.command()
+@click.option(
+    "--nuclei",
+    type=click.IntRange(min=1),
+    default=100000,
+    show_default=True,
+    help="Number of nuclei to load with each loader.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of nuclei to write to the database at a time.",
+)
+def benchmark_loaders(nuclei, batch_size):
+    """
+    Compare the speed of the nucleus loaders.
+
+    Every loader that works with the configured database writes the same
+    dummy nuclei into a new image. Each load is rolled back afterwards, so the
+    database is left unchanged.
+    """
+    values = random_nucleus_values()
+    fields = list(values)
+    row = tuple(values.values())
+    # ObjectCodes are unique within an ROI.
+    code = fields.index('Identifier_ObjectCode')
+    rows = [(*row[:code], i + 1, *row[code + 1:]) for i in range(nuclei)]
+
+    click.echo(f'Loading {nuclei:,} nuclei into {connection.vendor}, {batch_size} at a time:')
+    for name, loader_class in loaders.items():
+        if loader_class.vendor not in (None, connection.vendor):
+            continue
+
+        loader = get_loader(name)
+        loader.prepare()
+        with transaction.atomic():
+            image = Image.objects.create(name=f'benchmark-{name}')
+            roi = ROI.objects.create(image=image, name='benchmark', left=0, top=0, right=0, bottom=0)
+
+            start = time.perf_counter()
+            with loader.session():
+                for offset in range(0, nuclei, batch_size):
+                    loader.load(roi.id, fields, rows[offset:offset + batch_size])
+            elapsed = time.perf_counter() - start
+
+            transaction.set_rollback(True)
+
+        click.echo(f'    {name:<12} {elapsed:8.2f}s  {nuclei / elapsed:12,.0f} nuclei/s')
@@ -1,6 +1,9 @@
 import sys
+from django.db.models import Sum
 import djclick as click
+import time
 
+from hipsdb.deletion import delete_images, reclaim_space
 from hipsdb.models import Image
 
 
@@ -12,11 +15,28 @@ from hipsdb.models import Image
     default=False,
     help="Delete all images and their associated ROIs and nuclei.",
 )
-def delete(image_id: tuple[int, ...], all: bool):
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=10000,
+    show_default=True,
+    help="Number of nuclei to delete at a time.",
+)
+@click.option(
+    "--vacuum",
+    is_flag=True,
+    default=False,
+    help="Reclaim the space of the deleted data afterwards (incremental VACUUM on SQLite).",
+)
+def delete(image_id: tuple[int, ...], all: bool, batch_size: int, vacuum: bool):
     """Delete images and their associated ROIs and nuclei.
 
     Supply one or more IMAGE_IDs to delete specific images, or use --all
     to delete all images.
+
+    Nuclei are deleted BATCH_SIZE at a time, each batch in its own
+    transaction, so memory use stays low and the API can still be used
+    while a large image is deleted.
     """
     if not image_id and not all:
         click.echo("Please provide at least one image ID or use --all to delete all images.")
@@ -39,7 +59,29 @@ def delete(image_id: tuple[int, ...], all: bool):
         click.echo(f"    {image.name} (ID {image.id})")
 
     if click.confirm("Are you sure you want to delete these images and all associated data?"):
-        images.delete()
+        total = images.aggregate(total=Sum("nucleus_count"))["total"]
+        deleted = 0
+        last_report = time.monotonic()
+        start = time.monotonic()
+
+        def progress(count: int):
+            nonlocal deleted, last_report
+            deleted += count
+            if time.monotonic() - last_report >= 1:
+                last_report = time.monotonic()
+                # Nuclei of ROIs whose ingest did not finish are not in the total.
+                click.echo(f"    Deleted {deleted:,} of {max(total, deleted):,} nuclei")
+
+        counts = delete_images(images, batch_size, progress)
+        click.echo(
+            "Deleted {:,} images, {:,} ROIs and {:,} nuclei in {:.1f}s.".format(
+                *counts, time.monotonic() - start
+            )
+        )
+
+        if vacuum:
+            click.echo("Reclaiming space...")
+            reclaim_space()
         click.echo("Images deleted successfully.")
     else:
         click.echo("Deletion cancelled.")
@@ -0,0 +1,108 @@
+import djclick as click
+from pathlib import Path
+import time
+
+from hips_etl.synthetic import compressions, defect_kinds, generate_hips_dir
+
+
+@click.command()
+@click.argument(
+    "data_dir",
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option(
+    "--rois",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Number of ROIs to generate.",
+)
+@click.option(
+    "--nuclei",
+    type=click.IntRange(min=0),
+    default=10000,
+    show_default=True,
+    help="Number of nuclei to generate in each ROI.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Seed of the random generator; the same seed gives the same data.",
+)
+@click.option(
+    "--defect-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    show_default=True,
+    help="Fraction of nuclei to inject a defect into.",
+)
+@click.option(
+    "--defect",
+    "defects",
+    type=click.Choice(defect_kinds),
+    multiple=True,
+    help="Kind of defect to inject (can be supplied multiple times; default: all kinds).",
+)
+@click.option(
+    "--roi-size",
+    type=click.IntRange(min=1),
+    default=2048,
+    show_default=True,
+    help="Side length of each ROI in pixels (ROIs are made larger if their nuclei do not fit).",
+)
+@click.option(
+    "--compress",
+    "compression",
+    type=click.Choice(list(compressions)),
+    default=None,
+    help="Compress the generated CSV files.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes to generate ROIs in parallel.",
+)
+def generate_hips(data_dir, rois, nuclei, seed, defect_rate, defects, roi_size, compression, workers):
+    """
+    Generate a synthetic HiPS data directory for load testing and benchmarks.
+
+    The image is named after DATA_DIR, which must not exist yet or be empty.
+
+    :param data_dir: The directory to write the nucleiMeta and nucleiProps files to.
+    :param rois: The number of ROIs to generate.
+    :param nuclei: The number of nuclei to generate in each ROI.
+    :param seed: The seed of the random generator.
+    :param defect_rate: The fraction of nuclei to inject a defect into.
+    :param defects: The kinds of defects to inject (all kinds if empty).
+    :param roi_size: The side length of each ROI in pixels.
+    :param compression: If set, the compression to write the CSV files with.
+    :param workers: The number of processes to generate ROIs in.
+    """
+    if data_dir.exists() and any(data_dir.iterdir()):
+        raise click.BadParameter(f'Data directory {data_dir} is not empty')
+
+    start = time.perf_counter()
+    stats = generate_hips_dir(
+        data_dir,
+        rois,
+        nuclei,
+        seed=seed,
+        defect_rate=defect_rate,
+        defects=defects or defect_kinds,
+        roi_size=roi_size,
+        compression=compression,
+        workers=workers,
+    )
+    elapsed = time.perf_counter() - start
+
+    click.echo(
+        f'Generated {stats["rois"]} ROIs and {stats["nuclei"]:,} nuclei in {data_dir} in {elapsed:.1f}s'
+        f' ({stats["nuclei"] / elapsed:,.0f} nuclei/s)'
+    )
+    for kind in defect_kinds:
+        if stats[kind]:
+            click.echo(f'    {kind} defects: {stats[kind]:,} nuclei')
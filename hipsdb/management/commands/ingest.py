@@ -1,16 +1,381 @@
-from django.db import transaction
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import cProfile
+from django.db import connection, connections, transaction
 import djclick as click
+import glob
+import importlib.metadata
+import json
+import multiprocessing
 from pathlib import Path
 import sys
+import time
+from typing import Iterator, Literal
 
-from hipsdb.models import ROI, Nucleus, Image
-from hips_etl.validation import validate_hips_dir
+from hipsdb.deletion import delete_images, delete_rois
+from hipsdb.loaders import ensure_indexes, get_loader, loaders
+from hipsdb.models import ROI, Image, IngestReport
+from hipsdb.spatial import index_rois
+from hips_etl.logging import diagnostics, logger
+from hips_etl.profiling import log_timings, timer
+from hips_etl.utils import hips_image_name
+from hips_etl.validation import HipsValidationError, preflight_hips_dir, roi_digests, stream_hips_dir
+
+# Held around each write to the database when several images are ingested
+# into SQLite at once, as SQLite only allows one write transaction at a time.
+# Validation runs without it, so the images are validated in parallel. It is
+# reentrant, as the writes of an ROI are nested in those of the image when the
+# whole image is written in one transaction.
+_write_lock = None
+
+
+def expand_data_dirs(data_dirs: tuple[str, ...], manifest: Path | None) -> list[Path]:
+    """
+    Collect the data directories to ingest.
+
+    Arguments containing glob patterns (e.g. when quoted in the shell) are
+    expanded. Each non-empty line of the manifest file that does not start with
+    "#" is a data directory, relative to the directory of the manifest.
+    """
+    paths = []
+    for data_dir in data_dirs:
+        if glob.escape(data_dir) != data_dir:
+            matches = sorted(glob.glob(data_dir))
+            if not matches:
+                raise click.BadParameter(f'No data directories match {data_dir}')
+            paths.extend(map(Path, matches))
+        else:
+            paths.append(Path(data_dir))
+
+    if manifest is not None:
+        for line in manifest.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(manifest.parent / line)
+
+    for path in paths:
+        if not path.exists():
+            raise click.BadParameter(f'Data directory {path} does not exist')
+
+    return paths
+
+
+def _batches(items: list, size: int) -> Iterator[list]:
+    """Split a list into consecutive batches of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _atomic_if(enabled: bool):
+    """Return a transaction if `enabled`, and a no-op context manager otherwise."""
+    return transaction.atomic() if enabled else nullcontext()
+
+
+def _writing():
+    """Return the write lock shared by image workers, or a no-op context manager without one."""
+    return _write_lock if _write_lock is not None else nullcontext()
+
+
+def ingest_image(
+    data_dir: Path,
+    skip_missing: bool = False,
+    workers: int = 1,
+    violations_file: Path | None = None,
+    cache_dir: Path | None = None,
+    chunk_workers: int = 1,
+    batch_size: int = 1000,
+    commit: Literal['image', 'roi', 'batch'] = 'roi',
+    loader: str = 'auto',
+    resume: bool = False,
+    update: bool = False,
+    prune: bool = False,
+) -> tuple[int, int]:
+    """
+    Validate and ingest a single image.
+
+    Nuclei are written `batch_size` at a time with the named loader (see
+    `hipsdb.loaders.get_loader`). `commit` sets how often the data is committed:
+    once for the whole image (in a single transaction), after each ROI (the
+    default), or after each batch of nuclei.
+
+    The image is journaled as it is ingested: it stays in the loading state
+    (and hidden from the API) until every ROI is stored, and each ROI is
+    marked as ingested once all its nuclei are stored. If validation fails,
+    the committed part of the image is deleted again. If ingest is interrupted
+    otherwise, the committed part is kept, and with `resume` the latest
+    unfinished image from the same data directory is continued: its partially
+    stored ROIs are deleted, and only the ROIs not yet ingested are validated
+    and stored. When the whole image is committed at once, an interrupted
+    ingest leaves nothing to resume.
+
+    With `update`, the latest complete image of the same name is updated in
+    place instead of creating a new image: ROIs whose files are unchanged (by
+    digest, see `hips_etl.cache.roi_digest`) are left alone, without being
+    validated again, changed ROIs are replaced and new ROIs are added. With
+    `prune`, ROIs whose files are gone are deleted as well.
+
+    Returns the number of ROIs and nuclei created. Raises
+    `HipsValidationError` if validation fails.
+    """
+    loader = get_loader(loader)
+    loader.prepare()
+
+    source = str(data_dir.resolve())
+    image = None
+    replaced_rois = set()
+    removed_rois = set()
+    try:
+        # A single transaction for the image holds the write lock throughout.
+        with _writing() if commit == 'image' else nullcontext(), _atomic_if(commit == 'image'):
+            if resume:
+                image = Image.objects.filter(source=source, ingest_state=Image.LOADING).order_by('-id').first()
+            if image is None and update:
+                image = Image.objects.complete().filter(name=hips_image_name(data_dir)).order_by('-id').first()
+
+            if image is None:
+                skip_rois = set()
+                with _writing():
+                    image = Image.objects.create(
+                        name=hips_image_name(data_dir),
+                        source=source,
+                        ingest_state=Image.LOADING,
+                    )
+                click.echo(f'Created Image: {image.name}')
+            elif image.ingest_state == Image.LOADING:
+                with _writing():
+                    delete_rois(image.rois.filter(ingested=False), batch_size)
+                skip_rois = set(image.rois.values_list('name', flat=True))
+                click.echo(f'Resuming Image: {image.name} ({len(skip_rois)} ROIs already ingested)')
+            else:
+                digests = roi_digests(data_dir)
+                stored = dict(image.rois.filter(ingested=True).values_list('name', 'digest'))
+                stored_rois = set(image.rois.values_list('name', flat=True))
+                skip_rois = {name for name, digest in digests.items() if stored.get(name) == digest}
+                replaced_rois = (stored_rois & digests.keys()) - skip_rois
+                removed_rois = stored_rois - digests.keys()
+                click.echo(
+                    f'Updating Image: {image.name} ({len(skip_rois)} unchanged, {len(replaced_rois)} changed,'
+                    f' {len(digests.keys() - stored_rois)} new and {len(removed_rois)} removed ROIs)'
+                )
+
+            roi_count = 0
+            nucleus_count = 0
+            rois = stream_hips_dir(
+                data_dir,
+                skip_missing=skip_missing,
+                workers=workers,
+                violations_file=violations_file,
+                cache_dir=cache_dir,
+                chunk_workers=chunk_workers,
+                skip_rois=skip_rois,
+            )
+            for roi_data in timer.iterate(rois, 'validation'):
+                timer.count('validation', len(roi_data['nuclei']))
+                click.echo(f'Loading ROI {roi_data["name"]} ({len(roi_data["nuclei"])} nuclei)...')
+
+                with _writing(), _atomic_if(commit == 'roi'):
+                    if roi_data['name'] in replaced_rois:
+                        delete_rois(image.rois.filter(name=roi_data['name']), batch_size)
+
+                    with timer.phase('roi_create'):
+                        roi = ROI.objects.create(
+                            image=image,
+                            name=roi_data['name'],
+                            left=roi_data['left'],
+                            top=roi_data['top'],
+                            right=roi_data['right'],
+                            bottom=roi_data['bottom'],
+                            ingested=False,
+                            digest=roi_data['digest'],
+                        )
+
+                    fields = roi_data['fields']
+                    weighted_centroid_x = fields.index('Identifier_WeightedCentroidX')
+
+                    for batch in _batches(roi_data['nuclei'], batch_size):
+                        for values in batch:
+                            if values[weighted_centroid_x] is None:
+                                object_code = values[fields.index('Identifier_ObjectCode')]
+                                click.echo(f'Warning: Nucleus {object_code} has missing centroid data, aborting.')
+                                click.echo(roi_data['name'])
+                                click.echo(object_code)
+                                raise HipsValidationError(f'Nucleus {object_code} has missing centroid data')
+
+                        with _atomic_if(commit == 'batch'), timer.phase('db_write', len(batch)):
+                            loader.load(roi.id, fields, batch)
+
+                    index_rois([roi.pk])
+                    ROI.objects.filter(pk=roi.pk).update(ingested=True, nucleus_count=len(roi_data['nuclei']))
+                    Image.objects.filter(pk=image.pk).update_counts()
+
+                roi_count += 1
+                nucleus_count += len(roi_data['nuclei'])
+
+            with _writing():
+                if prune and removed_rois:
+                    click.echo(f'Removing {len(removed_rois)} ROIs whose files are gone')
+                    delete_rois(image.rois.filter(name__in=removed_rois), batch_size)
+
+                Image.objects.filter(pk=image.pk).update(ingest_state=Image.COMPLETE)
+                Image.objects.filter(pk=image.pk).update_counts()
+            click.echo(f'Created {roi_count} ROIs and {nucleus_count} nuclei')
+    except HipsValidationError:
+        if commit != 'image' and image is not None:
+            if image.ingest_state == Image.LOADING:
+                click.echo(f'Removing partially ingested Image: {image.name}')
+                with _writing():
+                    delete_images(Image.objects.filter(pk=image.pk), batch_size)
+            else:
+                click.echo(f'Image {image.name} is partially updated; the ROIs that passed validation are stored.')
+        raise
+    except BaseException:
+        if commit != 'image' and image is not None:
+            click.echo(f'Image {image.name} is partially ingested; run ingest again with --resume to continue.')
+        raise
+
+    return (roi_count, nucleus_count)
+
+
+def _init_worker(write_lock):
+    global _write_lock
+    _write_lock = write_lock
+
+
+def _ingest_image_result(data_dir: Path, options: dict) -> dict:
+    """Ingest an image with `ingest_image`, and report how that went and its timings."""
+    start = time.perf_counter()
+    result = {'name': hips_image_name(data_dir), 'rois': 0, 'nuclei': 0, 'error': None}
+    with timer.capture() as timings:
+        try:
+            result['rois'], result['nuclei'] = ingest_image(data_dir, **options)
+        except HipsValidationError as e:
+            result['error'] = str(e) or 'validation failed'
+        except Exception as e:
+            result['error'] = f'Unexpected error: {e}'
+
+    result['seconds'] = time.perf_counter() - start
+    result['timings'] = timings
+    return result
+
+
+def save_report(results: list[dict], seconds: float, report_file: Path | None = None) -> dict:
+    """
+    Record the throughput and phase timings of an ingest run.
+
+    The report is stored in the `IngestReport` history table, and also written
+    to `report_file` as JSON if given.
+    """
+    try:
+        version = importlib.metadata.version('hipsdb')
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+
+    nuclei = sum(result['nuclei'] for result in results)
+    report = {
+        'version': version,
+        'images': len(results),
+        'failed_images': sum(result['error'] is not None for result in results),
+        'rois': sum(result['rois'] for result in results),
+        'nuclei': nuclei,
+        'seconds': seconds,
+        'phases': timer.report(),
+    }
+    IngestReport.objects.create(**report)
+
+    if report_file is not None:
+        report['images_per_second'] = len(results) / seconds
+        report['nuclei_per_second'] = nuclei / seconds
+        report['results'] = [
+            {key: value for key, value in result.items() if key != 'timings'}
+            for result in results
+        ]
+        report_file.write_text(json.dumps(report, indent=2) + '\n')
+
+    return report
+
+
+def _image_options(data_dir: Path, options: dict, several: bool) -> dict:
+    """Give each image its own violations file when ingesting several images."""
+    violations_file = options['violations_file']
+    if several and violations_file is not None:
+        name = f'{violations_file.stem}.{hips_image_name(data_dir)}{violations_file.suffix}'
+        options = {**options, 'violations_file': violations_file.with_name(name)}
+
+    return options
 
 
 @click.command()
-@click.argument(
-    "data_dir",
-    type=click.Path(exists=True, file_okay=False, dir_okay=True, path_type=Path),
+@click.argument("data_dirs", nargs=-1)
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="File listing data directories to ingest, one per line.",
+)
+@click.option(
+    "--image-workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of images to ingest at once, each in its own process.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of nuclei to write to the database at a time.",
+)
+@click.option(
+    "--commit",
+    type=click.Choice(["image", "roi", "batch"]),
+    default="roi",
+    show_default=True,
+    help="Commit after each ROI, once per image (which leaves nothing to resume), or after each batch.",
+)
+@click.option(
+    "--loader",
+    type=click.Choice(["auto", *loaders]),
+    default="auto",
+    show_default=True,
+    help="How to write nuclei: through the ORM, or with a fast path for the database backend.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Continue interrupted ingests of the data directories, skipping ROIs already stored.",
+)
+@click.option(
+    "--update",
+    is_flag=True,
+    default=False,
+    help="Update existing images of the same name in place, only ingesting new and changed ROIs.",
+)
+@click.option(
+    "--prune",
+    is_flag=True,
+    default=False,
+    help="With --update, also delete ROIs whose files are gone.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Show the time spent in each phase of the ingest at the end.",
+)
+@click.option(
+    "--profile-report",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write the phase timings and throughput of the ingest to this file as JSON.",
+)
+@click.option(
+    "--pstats",
+    "pstats_file",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Profile the ingest with cProfile and write the statistics to this file.",
 )
 @click.option(
     "--skip-missing",
@@ -18,52 +383,212 @@ from hips_etl.validation import validate_hips_dir
     default=False,
     help="Skip rows with missing data during validation.",
 )
-def ingest(data_dir, skip_missing):
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes to use for validating ROI files in parallel.",
+)
+@click.option(
+    "--violations-file",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Write every data integrity violation to this file as JSON lines.",
+)
+@click.option(
+    "--log-format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Format of the validation log output.",
+)
+@click.option(
+    "--max-repeats",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Number of similar validation warnings to show before suppressing the rest.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory in which to cache validation results of unchanged ROI files.",
+)
+@click.option(
+    "--preflight",
+    is_flag=True,
+    default=False,
+    help="Only check filenames, headers and a sample of rows of every file; do not ingest.",
+)
+@click.option(
+    "--sample-rows",
+    type=click.IntRange(min=0),
+    default=100,
+    show_default=True,
+    help="Number of rows per file to type check with --preflight.",
+)
+@click.option(
+    "--chunk-workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes to parse each large CSV file with, in chunks.",
+)
+def ingest(
+    data_dirs,
+    manifest,
+    image_workers,
+    batch_size,
+    commit,
+    loader,
+    resume,
+    update,
+    prune,
+    profile,
+    profile_report,
+    pstats_file,
+    skip_missing,
+    workers,
+    violations_file,
+    log_format,
+    max_repeats,
+    cache_dir,
+    preflight,
+    sample_rows,
+    chunk_workers,
+):
     """
-    Validate and ingest a HiPS data directory.
+    Validate and ingest HiPS data directories.
 
-    :param data_dir: The path to the directory to validate/ingest.
+    Supply one or more DATA_DIRS (glob patterns are expanded), and/or a
+    manifest file listing them. Each data directory is one image. A data
+    directory may also be a zip or tar archive (optionally gzip, bzip2, xz or
+    zstd compressed), and its CSV files may be compressed individually; they
+    are read in place without extracting them.
+
+    ROIs are written to the database one at a time as they are validated, so
+    memory use depends on the largest ROI rather than the whole image. Nuclei
+    are written in batches, and committed after each ROI, or per image or
+    batch (see `ingest_image`). Images are hidden from the API
+    until they are completely ingested. If validation of an image fails,
+    nothing of that image is kept; an image whose ingest is interrupted
+    otherwise can be continued with --resume. Either way, the other images
+    are still ingested.
+
+    :param data_dirs: The paths to the directories (or archives) to validate/ingest.
+    :param manifest: If set, a file listing more directories to validate/ingest.
+    :param image_workers: The number of images to ingest at once.
+    :param batch_size: The number of nuclei to write to the database at a time.
+    :param commit: Whether to commit per image, per ROI or per batch of nuclei.
+    :param loader: The loader to write nuclei with (see `hipsdb.loaders`).
+    :param resume: If set, continue interrupted ingests of the data directories.
+    :param update: If set, update existing images in place.
+    :param prune: If set with --update, delete ROIs whose files are gone.
+    :param profile: If set, show the time spent in each phase of the ingest.
+    :param profile_report: If set, the file to write the timings to as JSON.
+    :param pstats_file: If set, the file to write cProfile statistics to.
     :param skip_missing: If set, skip rows with missing data during validation.
+    :param workers: The number of processes to validate ROI files with.
+    :param violations_file: If set, the file to write integrity violations to.
+    :param log_format: Whether to log validation output as text or JSON lines.
+    :param max_repeats: The number of similar warnings to show.
+    :param cache_dir: If set, the directory to cache validation results in.
+    :param preflight: If set, only run quick checks of the data directories.
+    :param sample_rows: The number of rows per file to check with --preflight.
+    :param chunk_workers: The number of processes to parse each large CSV file with.
     """
+    logger.set_format(log_format)
+    diagnostics.limit = max_repeats
+
+    data_dirs = expand_data_dirs(data_dirs, manifest)
+    if not data_dirs:
+        click.echo('Please provide at least one data directory or a manifest file.')
+        sys.exit(1)
+
+    if preflight:
+        success = True
+        for data_dir in data_dirs:
+            try:
+                preflight_hips_dir(data_dir, skip_missing=skip_missing, sample_rows=sample_rows)
+            except HipsValidationError:
+                success = False
+
+        sys.exit(0 if success else 1)
+
+    options = {
+        'skip_missing': skip_missing,
+        'workers': workers,
+        'violations_file': violations_file,
+        'cache_dir': cache_dir,
+        'chunk_workers': chunk_workers,
+        'batch_size': batch_size,
+        'commit': commit,
+        'loader': loader,
+        'resume': resume,
+        'update': update,
+        'prune': prune,
+    }
+    several = len(data_dirs) > 1
+    image_workers = min(image_workers, len(data_dirs))
+
     try:
-        data = validate_hips_dir(data_dir, skip_missing=skip_missing)
+        session = get_loader(loader).session()
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--loader')
 
-        if data is not None:
-            click.echo('Loading data into the database...')
-            with transaction.atomic():
-                image = Image.objects.create(name=data['image'])
-                click.echo(f'Created Image: {image.name}')
-                rois = []
-                nuclei = []
-                for roi_data in data['roi']:
-                    click.echo(f'Processing ROI {roi_data["name"]} ({len(roi_data["nuclei"])} nuclei)...')
-
-                    roi = ROI(
-                        image=image,
-                        name=roi_data['name'],
-                        left=roi_data['left'],
-                        top=roi_data['top'],
-                        right=roi_data['right'],
-                        bottom=roi_data['bottom'],
+    # An earlier ingest that was killed while loading may have left the
+    # nucleus table without its indexes.
+    built = ensure_indexes()
+    if built:
+        click.echo(f'Built missing indexes: {", ".join(built)}')
+
+    timer.reset()
+    profiler = cProfile.Profile() if pstats_file is not None else None
+    start = time.perf_counter()
+    with profiler or nullcontext(), session:
+        if image_workers > 1:
+            write_lock = multiprocessing.RLock() if connection.vendor == 'sqlite' else None
+
+            # Let every worker process open its own database connection.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=image_workers, initializer=_init_worker, initargs=(write_lock,)
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _ingest_image_result, data_dir, _image_options(data_dir, options, several)
                     )
-                    rois.append(roi)
-
-                    for nucleus_data in roi_data['nuclei']:
-                        nuclei.append(Nucleus(
-                            roi=roi,
-                            **nucleus_data,
-                        ))
-
-                        if nucleus_data['Identifier_WeightedCentroidX'] is None:
-                            click.echo(f'Warning: Nucleus {nucleus_data["Identifier_ObjectCode"]} has missing centroid data, aborting.')
-                            click.echo(roi_data['name'])
-                            click.echo(nucleus_data['Identifier_ObjectCode'])
-                            sys.exit(1)
-
-                click.echo(f'Creating {len(rois)} ROIs and {len(nuclei)} nuclei...')
-                ROI.objects.bulk_create(rois)
-                Nucleus.objects.bulk_create(nuclei)
-
-        sys.exit(0 if data else 1)
-    except Exception as e:
-        raise click.ClickException(f"Unexpected error: {e}")
+                    for data_dir in data_dirs
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = [
+                _ingest_image_result(data_dir, _image_options(data_dir, options, several))
+                for data_dir in data_dirs
+            ]
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        timer.merge(result['timings'])
+    save_report(results, elapsed, profile_report)
+    if profile:
+        log_timings()
+    if profiler is not None:
+        profiler.dump_stats(pstats_file)
+        click.echo(f'Wrote profile statistics to {pstats_file}')
+
+    failed = [result for result in results if result['error'] is not None]
+    if several:
+        click.echo('Ingest summary:')
+        for result in results:
+            status = 'FAILED' if result['error'] is not None else 'ok'
+            click.echo(f"    {result['name']}: {status} ({result['rois']} ROIs, {result['nuclei']} nuclei, {result['seconds']:.1f}s)")
+
+    nucleus_count = sum(result['nuclei'] for result in results)
+    click.echo(f'Ingested {len(results) - len(failed)} of {len(results)} images in {elapsed:.1f}s ({len(results) / elapsed:.2f} images/s, {nucleus_count / elapsed:,.0f} nuclei/s)')
+    for result in failed:
+        click.echo(f"Failed to ingest {result['name']}: {result['error']}")
+
+    sys.exit(1 if failed else 0)
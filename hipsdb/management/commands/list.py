@@ -1,22 +1,12 @@
-from django.db.models import Count, OuterRef, Subquery
 import djclick as click
 
-from hipsdb.models import ROI, Image, Nucleus
+from hipsdb.models import Image
 
 
 @click.command()
 def list():
-    roi_count = ROI.objects.filter(image=OuterRef('pk')).values('image')\
-        .annotate(count=Count('id'))\
-        .values('count')
-    nucleus_count = Nucleus.objects.filter(roi__image=OuterRef('pk'))\
-        .values('roi__image')\
-        .annotate(count=Count('id'))\
-        .values('count')
-    images = Image.objects.annotate(
-        roi_count=Subquery(roi_count),
-        nucleus_count=Subquery(nucleus_count)
-    ).values('id', 'name', 'created_at', 'roi_count', 'nucleus_count')
+    images = Image.objects.values('id', 'name', 'created_at', 'ingest_state', 'roi_count', 'nucleus_count')
 
     for image in images:
-        click.echo(f"{image['name']} (ID {image['id']}, {image['roi_count']} ROIs, {image['nucleus_count']} nuclei, created at {image['created_at']})")
+        incomplete = ", ingest incomplete" if image['ingest_state'] != Image.COMPLETE else ""
+        click.echo(f"{image['name']} (ID {image['id']}, {image['roi_count']} ROIs, {image['nucleus_count']} nuclei, created at {image['created_at']}{incomplete})")
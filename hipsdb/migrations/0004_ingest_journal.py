@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0003_alter_image_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='ingest_state',
+            field=models.CharField(choices=[('loading', 'loading'), ('complete', 'complete')], default='complete', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='source',
+            field=models.CharField(blank=True, default='', max_length=4096),
+        ),
+        migrations.AddField(
+            model_name='roi',
+            name='ingested',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0004_ingest_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roi',
+            name='digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
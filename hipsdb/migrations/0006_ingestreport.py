@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0005_roi_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('version', models.CharField(max_length=64)),
+                ('images', models.IntegerField()),
+                ('failed_images', models.IntegerField()),
+                ('rois', models.IntegerField()),
+                ('nuclei', models.IntegerField()),
+                ('seconds', models.FloatField()),
+                ('phases', models.JSONField(default=list)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_existing(apps, schema_editor):
+    """Fill in the counts of the data that is already stored."""
+    Image = apps.get_model('hipsdb', 'Image')
+    ROI = apps.get_model('hipsdb', 'ROI')
+    Nucleus = apps.get_model('hipsdb', 'Nucleus')
+
+    nuclei = Nucleus.objects.filter(roi=OuterRef('pk')).values('roi').annotate(count=Count('pk')).values('count')
+    ROI.objects.filter(ingested=True).update(nucleus_count=Coalesce(Subquery(nuclei), 0))
+
+    rois = ROI.objects.filter(image=OuterRef('pk'), ingested=True).values('image')
+    Image.objects.update(
+        roi_count=Coalesce(Subquery(rois.annotate(count=Count('pk')).values('count')), 0),
+        nucleus_count=Coalesce(Subquery(rois.annotate(count=Sum('nucleus_count')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0006_ingestreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='nucleus_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='roi_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='roi',
+            name='nucleus_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _roi_indexes(schema_editor, Nucleus) -> list[str]:
+    """Return the names of the plain indexes on just the ROI column of the nucleus table."""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, Nucleus._meta.db_table)
+
+    column = Nucleus._meta.get_field('roi').column
+    return [
+        name for name, info in constraints.items()
+        if info['index'] and not info['unique'] and info['columns'] == [column]
+    ]
+
+
+def drop_roi_index(apps, schema_editor):
+    """
+    Drop the index of the ROI foreign key, which the new indexes make redundant.
+
+    AlterField would copy the whole nucleus table to do this on SQLite.
+    """
+    Nucleus = apps.get_model('hipsdb', 'Nucleus')
+    for name in _roi_indexes(schema_editor, Nucleus):
+        schema_editor.execute(schema_editor._delete_index_sql(Nucleus, name))
+
+
+def create_roi_index(apps, schema_editor):
+    Nucleus = apps.get_model('hipsdb', 'Nucleus')
+    if not _roi_indexes(schema_editor, Nucleus):
+        schema_editor.execute(schema_editor._create_index_sql(Nucleus, fields=[Nucleus._meta.get_field('roi')]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0007_stored_counts'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='nucleus',
+            constraint=models.UniqueConstraint(models.F('roi'), models.F('Identifier_ObjectCode'), name='nucleus_roi_objectcode'),
+        ),
+        migrations.AddIndex(
+            model_name='nucleus',
+            index=models.Index(fields=['roi', 'Identifier_CentroidX', 'Identifier_CentroidY'], name='nucleus_roi_centroid'),
+        ),
+        migrations.AddIndex(
+            model_name='nucleus',
+            index=models.Index(fields=['roi', 'Classif_StandardClass'], name='nucleus_roi_standard_class'),
+        ),
+        migrations.AddIndex(
+            model_name='nucleus',
+            index=models.Index(fields=['roi', 'Classif_SuperClass'], name='nucleus_roi_super_class'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='nucleus',
+                    name='roi',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='nuclei', to='hipsdb.roi'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_roi_index, create_roi_index),
+            ],
+        ),
+    ]
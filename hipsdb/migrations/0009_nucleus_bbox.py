@@ -0,0 +1,59 @@
+from django.db import migrations
+
+
+def create_spatial_index(apps, schema_editor):
+    """
+    Create the spatial index of the nuclei (see `hipsdb.spatial`), and add the stored nuclei to it.
+
+    There is no index on database backends other than SQLite and PostgreSQL.
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE hipsdb_nucleus_bbox USING rtree_i32(id, image_min, image_max, xmin, xmax, ymin, ymax)'
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER hipsdb_nucleus_bbox_delete AFTER DELETE ON hipsdb_nucleus'
+            ' BEGIN DELETE FROM hipsdb_nucleus_bbox WHERE id = OLD.id; END'
+        )
+        schema_editor.execute(
+            'INSERT INTO hipsdb_nucleus_bbox (id, image_min, image_max, xmin, xmax, ymin, ymax)'
+            ' SELECT n.id, r.image_id, r.image_id,'
+            ' r."left" + n."Identifier.Xmin", r."left" + n."Identifier.Xmax",'
+            ' r."top" + n."Identifier.Ymin", r."top" + n."Identifier.Ymax"'
+            ' FROM hipsdb_nucleus n JOIN hipsdb_roi r ON r.id = n.roi_id WHERE r.ingested'
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE hipsdb_nucleus_bbox ('
+            ' id bigint PRIMARY KEY REFERENCES hipsdb_nucleus (id) ON DELETE CASCADE,'
+            ' image_id bigint NOT NULL,'
+            ' bbox box NOT NULL)'
+        )
+        schema_editor.execute(
+            'INSERT INTO hipsdb_nucleus_bbox (id, image_id, bbox)'
+            ' SELECT n.id, r.image_id, box('
+            'point(r."left" + n."Identifier.Xmin", r."top" + n."Identifier.Ymin"),'
+            ' point(r."left" + n."Identifier.Xmax", r."top" + n."Identifier.Ymax"))'
+            ' FROM hipsdb_nucleus n JOIN hipsdb_roi r ON r.id = n.roi_id WHERE r.ingested'
+        )
+        schema_editor.execute('CREATE INDEX hipsdb_nucleus_bbox_bbox ON hipsdb_nucleus_bbox USING gist (bbox)')
+
+
+def drop_spatial_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TRIGGER hipsdb_nucleus_bbox_delete')
+    if connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE hipsdb_nucleus_bbox')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0008_nucleus_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_spatial_index, drop_spatial_index),
+    ]
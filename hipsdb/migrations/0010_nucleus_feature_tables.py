@@ -0,0 +1,958 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+feature_models = (
+    'NucleusClassification',
+    'NucleusShape',
+    'NucleusIntensity',
+    'NucleusGradient',
+    'NucleusHaralick',
+)
+
+
+def copy_features(apps, schema_editor):
+    """Copy the features of the stored nuclei into the new feature tables."""
+    Nucleus = apps.get_model('hipsdb', 'Nucleus')
+    quote = schema_editor.quote_name
+    for name in feature_models:
+        model = apps.get_model('hipsdb', name)
+        columns = [field.column for field in model._meta.local_concrete_fields if not field.primary_key]
+        schema_editor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({quote(model._meta.pk.column)}, {", ".join(map(quote, columns))})'
+            f' SELECT {quote(Nucleus._meta.pk.column)}, {", ".join(map(quote, columns))} FROM {quote(Nucleus._meta.db_table)}'
+        )
+
+
+def drop_feature_columns(apps, schema_editor):
+    """
+    Drop the columns of the features from the nucleus table.
+
+    On SQLite, the table is rebuilt once without them, rather than once per
+    column, and the trigger of the spatial index (see migration 0009), which
+    goes with the old table, is created again. Elsewhere the columns are
+    dropped.
+    """
+    Nucleus = apps.get_model('hipsdb', 'Nucleus')
+    quote = schema_editor.quote_name
+    if schema_editor.connection.vendor == 'sqlite':
+        # RemoveField operations would copy the whole nucleus table for each
+        # of the 165 columns, as SQLite rewrites a table to drop a column.
+        # _remake_table is the private method of Django's SQLite schema
+        # editor that RemoveField and AlterField rebuild tables with; called
+        # with the model of the state after this migration, it rebuilds the
+        # table once with just the remaining columns.
+        schema_editor._remake_table(Nucleus)
+        schema_editor.execute(
+            'CREATE TRIGGER hipsdb_nucleus_bbox_delete AFTER DELETE ON hipsdb_nucleus'
+            ' BEGIN DELETE FROM hipsdb_nucleus_bbox WHERE id = OLD.id; END'
+        )
+        return
+
+    for name in feature_models:
+        model = apps.get_model('hipsdb', name)
+        for field in model._meta.local_concrete_fields:
+            if not field.primary_key:
+                schema_editor.execute(
+                    f'ALTER TABLE {quote(Nucleus._meta.db_table)} DROP COLUMN {quote(field.column)}'
+                )
+
+
+def restore_feature_columns(apps, schema_editor):
+    """
+    Add the columns of the features back to the nucleus table, and copy the features into them.
+
+    This reverses `drop_feature_columns` and `copy_features`. The columns are
+    added as nullable, so that they can be added to a table with rows; the
+    features of every stored nucleus are copied back, so none stays NULL.
+    """
+    Nucleus = apps.get_model('hipsdb', 'Nucleus')
+    quote = schema_editor.quote_name
+    table = quote(Nucleus._meta.db_table)
+    for name in feature_models:
+        model = apps.get_model('hipsdb', name)
+        fields = [field for field in model._meta.local_concrete_fields if not field.primary_key]
+        for field in fields:
+            schema_editor.execute(
+                f'ALTER TABLE {table} ADD COLUMN {quote(field.column)} {field.db_type(schema_editor.connection)} NULL'
+            )
+
+        columns = ', '.join(quote(field.column) for field in fields)
+        schema_editor.execute(
+            f'UPDATE {table} SET ({columns}) = (SELECT {columns} FROM {quote(model._meta.db_table)} f'
+            f' WHERE f.{quote(model._meta.pk.column)} = {table}.{quote(Nucleus._meta.pk.column)})'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hipsdb', '0009_nucleus_bbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NucleusClassification',
+            fields=[
+                ('nucleus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='classification', serialize=False, to='hipsdb.nucleus')),
+                ('ClassifProbab_CancerEpithelium', models.FloatField(db_column='ClassifProbab.CancerEpithelium')),
+                ('ClassifProbab_StromalCellNOS', models.FloatField(db_column='ClassifProbab.StromalCellNOS')),
+                ('ClassifProbab_ActiveStromalCellNOS', models.FloatField(db_column='ClassifProbab.ActiveStromalCellNOS')),
+                ('ClassifProbab_TILsCell', models.FloatField(db_column='ClassifProbab.TILsCell')),
+                ('ClassifProbab_ActiveTILsCell', models.FloatField(db_column='ClassifProbab.ActiveTILsCell')),
+                ('ClassifProbab_NormalEpithelium', models.FloatField(db_column='ClassifProbab.NormalEpithelium')),
+                ('ClassifProbab_OtherCell', models.FloatField(db_column='ClassifProbab.OtherCell')),
+                ('ClassifProbab_UnknownOrAmbiguousCell', models.FloatField(db_column='ClassifProbab.UnknownOrAmbiguousCell')),
+                ('ClassifProbab_BACKGROUND', models.FloatField(db_column='ClassifProbab.BACKGROUND')),
+                ('SuperClassifProbab_EpithelialSuperclass', models.FloatField(db_column='SuperClassifProbab.EpithelialSuperclass')),
+                ('SuperClassifProbab_StromalSuperclass', models.FloatField(db_column='SuperClassifProbab.StromalSuperclass')),
+                ('SuperClassifProbab_TILsSuperclass', models.FloatField(db_column='SuperClassifProbab.TILsSuperclass')),
+                ('SuperClassifProbab_OtherSuperclass', models.FloatField(db_column='SuperClassifProbab.OtherSuperclass')),
+                ('SuperClassifProbab_AmbiguousSuperclass', models.FloatField(db_column='SuperClassifProbab.AmbiguousSuperclass')),
+                ('SuperClassifProbab_BACKGROUND', models.FloatField(db_column='SuperClassifProbab.BACKGROUND')),
+                ('Unconstrained_Identifier_Xmin', models.IntegerField(db_column='Unconstrained.Identifier.Xmin')),
+                ('Unconstrained_Identifier_Ymin', models.IntegerField(db_column='Unconstrained.Identifier.Ymin')),
+                ('Unconstrained_Identifier_Xmax', models.IntegerField(db_column='Unconstrained.Identifier.Xmax')),
+                ('Unconstrained_Identifier_Ymax', models.IntegerField(db_column='Unconstrained.Identifier.Ymax')),
+                ('Unconstrained_Identifier_CentroidX', models.IntegerField(db_column='Unconstrained.Identifier.CentroidX')),
+                ('Unconstrained_Identifier_CentroidY', models.IntegerField(db_column='Unconstrained.Identifier.CentroidY')),
+                ('Unconstrained_Classif_StandardClass', models.CharField(choices=[('ActiveStromalCellNOS', 'ActiveStromalCellNOS'), ('ActiveTILsCell', 'ActiveTILsCell'), ('BACKGROUND', 'BACKGROUND'), ('CancerEpithelium', 'CancerEpithelium'), ('NormalEpithelium', 'NormalEpithelium'), ('StromalCellNOS', 'StromalCellNOS'), ('TILsCell', 'TILsCell'), ('UnknownOrAmbiguousCell', 'UnknownOrAmbiguousCell')], db_column='Unconstrained.Classif.StandardClass', max_length=22)),
+                ('Unconstrained_Classif_SuperClass', models.CharField(choices=[('AmbiguousSuperclass', 'AmbiguousSuperclass'), ('BACKGROUND', 'BACKGROUND'), ('EpithelialSuperclass', 'EpithelialSuperclass'), ('StromalSuperclass', 'StromalSuperclass'), ('TILsSuperclass', 'TILsSuperclass')], db_column='Unconstrained.Classif.SuperClass', max_length=20)),
+                ('Unconstrained_ClassifProbab_CancerEpithelium', models.FloatField(db_column='Unconstrained.ClassifProbab.CancerEpithelium')),
+                ('Unconstrained_ClassifProbab_StromalCellNOS', models.FloatField(db_column='Unconstrained.ClassifProbab.StromalCellNOS')),
+                ('Unconstrained_ClassifProbab_ActiveStromalCellNOS', models.FloatField(db_column='Unconstrained.ClassifProbab.ActiveStromalCellNOS')),
+                ('Unconstrained_ClassifProbab_TILsCell', models.FloatField(db_column='Unconstrained.ClassifProbab.TILsCell')),
+                ('Unconstrained_ClassifProbab_ActiveTILsCell', models.FloatField(db_column='Unconstrained.ClassifProbab.ActiveTILsCell')),
+                ('Unconstrained_ClassifProbab_NormalEpithelium', models.FloatField(db_column='Unconstrained.ClassifProbab.NormalEpithelium')),
+                ('Unconstrained_ClassifProbab_OtherCell', models.FloatField(db_column='Unconstrained.ClassifProbab.OtherCell')),
+                ('Unconstrained_ClassifProbab_UnknownOrAmbiguousCell', models.FloatField(db_column='Unconstrained.ClassifProbab.UnknownOrAmbiguousCell')),
+                ('Unconstrained_ClassifProbab_BACKGROUND', models.FloatField(db_column='Unconstrained.ClassifProbab.BACKGROUND')),
+                ('Unconstrained_SuperClassifProbab_EpithelialSuperclass', models.FloatField(db_column='Unconstrained.SuperClassifProbab.EpithelialSuperclass')),
+                ('Unconstrained_SuperClassifProbab_StromalSuperclass', models.FloatField(db_column='Unconstrained.SuperClassifProbab.StromalSuperclass')),
+                ('Unconstrained_SuperClassifProbab_TILsSuperclass', models.FloatField(db_column='Unconstrained.SuperClassifProbab.TILsSuperclass')),
+                ('Unconstrained_SuperClassifProbab_OtherSuperclass', models.FloatField(db_column='Unconstrained.SuperClassifProbab.OtherSuperclass')),
+                ('Unconstrained_SuperClassifProbab_AmbiguousSuperclass', models.FloatField(db_column='Unconstrained.SuperClassifProbab.AmbiguousSuperclass')),
+                ('Unconstrained_SuperClassifProbab_BACKGROUND', models.FloatField(db_column='Unconstrained.SuperClassifProbab.BACKGROUND')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NucleusGradient',
+            fields=[
+                ('nucleus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='gradient', serialize=False, to='hipsdb.nucleus')),
+                ('Nucleus_Gradient_Mag_Mean', models.FloatField(db_column='Nucleus.Gradient.Mag.Mean')),
+                ('Nucleus_Gradient_Mag_Std', models.FloatField(db_column='Nucleus.Gradient.Mag.Std')),
+                ('Nucleus_Gradient_Mag_Skewness', models.FloatField(db_column='Nucleus.Gradient.Mag.Skewness')),
+                ('Nucleus_Gradient_Mag_Kurtosis', models.FloatField(db_column='Nucleus.Gradient.Mag.Kurtosis')),
+                ('Nucleus_Gradient_Mag_HistEntropy', models.FloatField(db_column='Nucleus.Gradient.Mag.HistEntropy')),
+                ('Nucleus_Gradient_Mag_HistEnergy', models.FloatField(db_column='Nucleus.Gradient.Mag.HistEnergy')),
+                ('Nucleus_Gradient_Canny_Sum', models.IntegerField(db_column='Nucleus.Gradient.Canny.Sum')),
+                ('Nucleus_Gradient_Canny_Mean', models.FloatField(db_column='Nucleus.Gradient.Canny.Mean')),
+                ('Cytoplasm_Gradient_Mag_Mean', models.FloatField(db_column='Cytoplasm.Gradient.Mag.Mean')),
+                ('Cytoplasm_Gradient_Mag_Std', models.FloatField(db_column='Cytoplasm.Gradient.Mag.Std')),
+                ('Cytoplasm_Gradient_Mag_Skewness', models.FloatField(db_column='Cytoplasm.Gradient.Mag.Skewness')),
+                ('Cytoplasm_Gradient_Mag_Kurtosis', models.FloatField(db_column='Cytoplasm.Gradient.Mag.Kurtosis')),
+                ('Cytoplasm_Gradient_Mag_HistEntropy', models.FloatField(db_column='Cytoplasm.Gradient.Mag.HistEntropy')),
+                ('Cytoplasm_Gradient_Mag_HistEnergy', models.FloatField(db_column='Cytoplasm.Gradient.Mag.HistEnergy')),
+                ('Cytoplasm_Gradient_Canny_Sum', models.IntegerField(db_column='Cytoplasm.Gradient.Canny.Sum')),
+                ('Cytoplasm_Gradient_Canny_Mean', models.FloatField(db_column='Cytoplasm.Gradient.Canny.Mean')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NucleusHaralick',
+            fields=[
+                ('nucleus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='haralick', serialize=False, to='hipsdb.nucleus')),
+                ('Nucleus_Haralick_ASM_Mean', models.FloatField(db_column='Nucleus.Haralick.ASM.Mean')),
+                ('Nucleus_Haralick_ASM_Range', models.FloatField(db_column='Nucleus.Haralick.ASM.Range')),
+                ('Nucleus_Haralick_Contrast_Mean', models.FloatField(db_column='Nucleus.Haralick.Contrast.Mean')),
+                ('Nucleus_Haralick_Contrast_Range', models.FloatField(db_column='Nucleus.Haralick.Contrast.Range')),
+                ('Nucleus_Haralick_Correlation_Mean', models.FloatField(db_column='Nucleus.Haralick.Correlation.Mean')),
+                ('Nucleus_Haralick_Correlation_Range', models.FloatField(db_column='Nucleus.Haralick.Correlation.Range')),
+                ('Nucleus_Haralick_SumOfSquares_Mean', models.FloatField(db_column='Nucleus.Haralick.SumOfSquares.Mean')),
+                ('Nucleus_Haralick_SumOfSquares_Range', models.FloatField(db_column='Nucleus.Haralick.SumOfSquares.Range')),
+                ('Nucleus_Haralick_IDM_Mean', models.FloatField(db_column='Nucleus.Haralick.IDM.Mean')),
+                ('Nucleus_Haralick_IDM_Range', models.FloatField(db_column='Nucleus.Haralick.IDM.Range')),
+                ('Nucleus_Haralick_SumAverage_Mean', models.FloatField(db_column='Nucleus.Haralick.SumAverage.Mean')),
+                ('Nucleus_Haralick_SumAverage_Range', models.FloatField(db_column='Nucleus.Haralick.SumAverage.Range')),
+                ('Nucleus_Haralick_SumVariance_Mean', models.FloatField(db_column='Nucleus.Haralick.SumVariance.Mean')),
+                ('Nucleus_Haralick_SumVariance_Range', models.FloatField(db_column='Nucleus.Haralick.SumVariance.Range')),
+                ('Nucleus_Haralick_SumEntropy_Mean', models.FloatField(db_column='Nucleus.Haralick.SumEntropy.Mean')),
+                ('Nucleus_Haralick_SumEntropy_Range', models.FloatField(db_column='Nucleus.Haralick.SumEntropy.Range')),
+                ('Nucleus_Haralick_Entropy_Mean', models.FloatField(db_column='Nucleus.Haralick.Entropy.Mean')),
+                ('Nucleus_Haralick_Entropy_Range', models.FloatField(db_column='Nucleus.Haralick.Entropy.Range')),
+                ('Nucleus_Haralick_DifferenceVariance_Mean', models.FloatField(db_column='Nucleus.Haralick.DifferenceVariance.Mean')),
+                ('Nucleus_Haralick_DifferenceVariance_Range', models.FloatField(db_column='Nucleus.Haralick.DifferenceVariance.Range')),
+                ('Nucleus_Haralick_DifferenceEntropy_Mean', models.FloatField(db_column='Nucleus.Haralick.DifferenceEntropy.Mean')),
+                ('Nucleus_Haralick_DifferenceEntropy_Range', models.FloatField(db_column='Nucleus.Haralick.DifferenceEntropy.Range')),
+                ('Nucleus_Haralick_IMC1_Mean', models.FloatField(db_column='Nucleus.Haralick.IMC1.Mean')),
+                ('Nucleus_Haralick_IMC1_Range', models.FloatField(db_column='Nucleus.Haralick.IMC1.Range')),
+                ('Nucleus_Haralick_IMC2_Mean', models.FloatField(db_column='Nucleus.Haralick.IMC2.Mean')),
+                ('Nucleus_Haralick_IMC2_Range', models.FloatField(db_column='Nucleus.Haralick.IMC2.Range')),
+                ('Cytoplasm_Haralick_ASM_Mean', models.FloatField(db_column='Cytoplasm.Haralick.ASM.Mean')),
+                ('Cytoplasm_Haralick_ASM_Range', models.FloatField(db_column='Cytoplasm.Haralick.ASM.Range')),
+                ('Cytoplasm_Haralick_Contrast_Mean', models.FloatField(db_column='Cytoplasm.Haralick.Contrast.Mean')),
+                ('Cytoplasm_Haralick_Contrast_Range', models.FloatField(db_column='Cytoplasm.Haralick.Contrast.Range')),
+                ('Cytoplasm_Haralick_Correlation_Mean', models.FloatField(db_column='Cytoplasm.Haralick.Correlation.Mean')),
+                ('Cytoplasm_Haralick_Correlation_Range', models.FloatField(db_column='Cytoplasm.Haralick.Correlation.Range')),
+                ('Cytoplasm_Haralick_SumOfSquares_Mean', models.FloatField(db_column='Cytoplasm.Haralick.SumOfSquares.Mean')),
+                ('Cytoplasm_Haralick_SumOfSquares_Range', models.FloatField(db_column='Cytoplasm.Haralick.SumOfSquares.Range')),
+                ('Cytoplasm_Haralick_IDM_Mean', models.FloatField(db_column='Cytoplasm.Haralick.IDM.Mean')),
+                ('Cytoplasm_Haralick_IDM_Range', models.FloatField(db_column='Cytoplasm.Haralick.IDM.Range')),
+                ('Cytoplasm_Haralick_SumAverage_Mean', models.FloatField(db_column='Cytoplasm.Haralick.SumAverage.Mean')),
+                ('Cytoplasm_Haralick_SumAverage_Range', models.FloatField(db_column='Cytoplasm.Haralick.SumAverage.Range')),
+                ('Cytoplasm_Haralick_SumVariance_Mean', models.FloatField(db_column='Cytoplasm.Haralick.SumVariance.Mean')),
+                ('Cytoplasm_Haralick_SumVariance_Range', models.FloatField(db_column='Cytoplasm.Haralick.SumVariance.Range')),
+                ('Cytoplasm_Haralick_SumEntropy_Mean', models.FloatField(db_column='Cytoplasm.Haralick.SumEntropy.Mean')),
+                ('Cytoplasm_Haralick_SumEntropy_Range', models.FloatField(db_column='Cytoplasm.Haralick.SumEntropy.Range')),
+                ('Cytoplasm_Haralick_Entropy_Mean', models.FloatField(db_column='Cytoplasm.Haralick.Entropy.Mean')),
+                ('Cytoplasm_Haralick_Entropy_Range', models.FloatField(db_column='Cytoplasm.Haralick.Entropy.Range')),
+                ('Cytoplasm_Haralick_DifferenceVariance_Mean', models.FloatField(db_column='Cytoplasm.Haralick.DifferenceVariance.Mean')),
+                ('Cytoplasm_Haralick_DifferenceVariance_Range', models.FloatField(db_column='Cytoplasm.Haralick.DifferenceVariance.Range')),
+                ('Cytoplasm_Haralick_DifferenceEntropy_Mean', models.FloatField(db_column='Cytoplasm.Haralick.DifferenceEntropy.Mean')),
+                ('Cytoplasm_Haralick_DifferenceEntropy_Range', models.FloatField(db_column='Cytoplasm.Haralick.DifferenceEntropy.Range')),
+                ('Cytoplasm_Haralick_IMC1_Mean', models.FloatField(db_column='Cytoplasm.Haralick.IMC1.Mean')),
+                ('Cytoplasm_Haralick_IMC1_Range', models.FloatField(db_column='Cytoplasm.Haralick.IMC1.Range')),
+                ('Cytoplasm_Haralick_IMC2_Mean', models.FloatField(db_column='Cytoplasm.Haralick.IMC2.Mean')),
+                ('Cytoplasm_Haralick_IMC2_Range', models.FloatField(db_column='Cytoplasm.Haralick.IMC2.Range')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NucleusIntensity',
+            fields=[
+                ('nucleus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='intensity', serialize=False, to='hipsdb.nucleus')),
+                ('Nucleus_Intensity_Min', models.IntegerField(db_column='Nucleus.Intensity.Min')),
+                ('Nucleus_Intensity_Max', models.IntegerField(db_column='Nucleus.Intensity.Max')),
+                ('Nucleus_Intensity_Mean', models.FloatField(db_column='Nucleus.Intensity.Mean')),
+                ('Nucleus_Intensity_Median', models.FloatField(db_column='Nucleus.Intensity.Median')),
+                ('Nucleus_Intensity_MeanMedianDiff', models.FloatField(db_column='Nucleus.Intensity.MeanMedianDiff')),
+                ('Nucleus_Intensity_Std', models.FloatField(db_column='Nucleus.Intensity.Std')),
+                ('Nucleus_Intensity_IQR', models.FloatField(db_column='Nucleus.Intensity.IQR')),
+                ('Nucleus_Intensity_MAD', models.FloatField(db_column='Nucleus.Intensity.MAD')),
+                ('Nucleus_Intensity_Skewness', models.FloatField(db_column='Nucleus.Intensity.Skewness')),
+                ('Nucleus_Intensity_Kurtosis', models.FloatField(db_column='Nucleus.Intensity.Kurtosis')),
+                ('Nucleus_Intensity_HistEnergy', models.FloatField(db_column='Nucleus.Intensity.HistEnergy')),
+                ('Nucleus_Intensity_HistEntropy', models.FloatField(db_column='Nucleus.Intensity.HistEntropy')),
+                ('Cytoplasm_Intensity_Min', models.IntegerField(db_column='Cytoplasm.Intensity.Min')),
+                ('Cytoplasm_Intensity_Max', models.IntegerField(db_column='Cytoplasm.Intensity.Max')),
+                ('Cytoplasm_Intensity_Mean', models.FloatField(db_column='Cytoplasm.Intensity.Mean')),
+                ('Cytoplasm_Intensity_Median', models.FloatField(db_column='Cytoplasm.Intensity.Median')),
+                ('Cytoplasm_Intensity_MeanMedianDiff', models.FloatField(db_column='Cytoplasm.Intensity.MeanMedianDiff')),
+                ('Cytoplasm_Intensity_Std', models.FloatField(db_column='Cytoplasm.Intensity.Std')),
+                ('Cytoplasm_Intensity_IQR', models.FloatField(db_column='Cytoplasm.Intensity.IQR')),
+                ('Cytoplasm_Intensity_MAD', models.FloatField(db_column='Cytoplasm.Intensity.MAD')),
+                ('Cytoplasm_Intensity_Skewness', models.FloatField(db_column='Cytoplasm.Intensity.Skewness')),
+                ('Cytoplasm_Intensity_Kurtosis', models.FloatField(db_column='Cytoplasm.Intensity.Kurtosis')),
+                ('Cytoplasm_Intensity_HistEnergy', models.FloatField(db_column='Cytoplasm.Intensity.HistEnergy')),
+                ('Cytoplasm_Intensity_HistEntropy', models.FloatField(db_column='Cytoplasm.Intensity.HistEntropy')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NucleusShape',
+            fields=[
+                ('nucleus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shape', serialize=False, to='hipsdb.nucleus')),
+                ('Identifier_WeightedCentroidX', models.FloatField(db_column='Identifier.WeightedCentroidX')),
+                ('Identifier_WeightedCentroidY', models.FloatField(db_column='Identifier.WeightedCentroidY')),
+                ('Orientation_Orientation', models.FloatField(db_column='Orientation.Orientation')),
+                ('Size_Area', models.IntegerField(db_column='Size.Area')),
+                ('Size_ConvexHullArea', models.IntegerField(db_column='Size.ConvexHullArea')),
+                ('Size_MajorAxisLength', models.FloatField(db_column='Size.MajorAxisLength')),
+                ('Size_MinorAxisLength', models.FloatField(db_column='Size.MinorAxisLength')),
+                ('Size_Perimeter', models.FloatField(db_column='Size.Perimeter')),
+                ('Shape_Circularity', models.FloatField(db_column='Shape.Circularity')),
+                ('Shape_Eccentricity', models.FloatField(db_column='Shape.Eccentricity')),
+                ('Shape_EquivalentDiameter', models.FloatField(db_column='Shape.EquivalentDiameter')),
+                ('Shape_Extent', models.FloatField(db_column='Shape.Extent')),
+                ('Shape_FractalDimension', models.FloatField(db_column='Shape.FractalDimension')),
+                ('Shape_MinorMajorAxisRatio', models.FloatField(db_column='Shape.MinorMajorAxisRatio')),
+                ('Shape_Solidity', models.FloatField(db_column='Shape.Solidity')),
+                ('Shape_HuMoments1', models.FloatField(db_column='Shape.HuMoments1')),
+                ('Shape_HuMoments2', models.FloatField(db_column='Shape.HuMoments2')),
+                ('Shape_HuMoments3', models.FloatField(db_column='Shape.HuMoments3')),
+                ('Shape_HuMoments4', models.FloatField(db_column='Shape.HuMoments4')),
+                ('Shape_HuMoments5', models.FloatField(db_column='Shape.HuMoments5')),
+                ('Shape_HuMoments6', models.FloatField(db_column='Shape.HuMoments6')),
+                ('Shape_HuMoments7', models.FloatField(db_column='Shape.HuMoments7')),
+                ('Shape_WeightedHuMoments1', models.FloatField(db_column='Shape.WeightedHuMoments1')),
+                ('Shape_WeightedHuMoments2', models.FloatField(db_column='Shape.WeightedHuMoments2')),
+                ('Shape_WeightedHuMoments3', models.FloatField(db_column='Shape.WeightedHuMoments3')),
+                ('Shape_WeightedHuMoments4', models.FloatField(db_column='Shape.WeightedHuMoments4')),
+                ('Shape_WeightedHuMoments5', models.FloatField(db_column='Shape.WeightedHuMoments5')),
+                ('Shape_WeightedHuMoments6', models.FloatField(db_column='Shape.WeightedHuMoments6')),
+                ('Shape_WeightedHuMoments7', models.FloatField(db_column='Shape.WeightedHuMoments7')),
+                ('Shape_FSD1', models.FloatField(db_column='Shape.FSD1')),
+                ('Shape_FSD2', models.FloatField(db_column='Shape.FSD2')),
+                ('Shape_FSD3', models.FloatField(db_column='Shape.FSD3')),
+                ('Shape_FSD4', models.FloatField(db_column='Shape.FSD4')),
+                ('Shape_FSD5', models.FloatField(db_column='Shape.FSD5')),
+                ('Shape_FSD6', models.FloatField(db_column='Shape.FSD6')),
+            ],
+        ),
+        # Reversed by restore_feature_columns, before the feature tables are dropped.
+        migrations.RunPython(copy_features, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_ActiveStromalCellNOS',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_ActiveTILsCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_BACKGROUND',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_CancerEpithelium',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_NormalEpithelium',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_OtherCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_StromalCellNOS',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_TILsCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='ClassifProbab_UnknownOrAmbiguousCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Canny_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Canny_Sum',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Mag_HistEnergy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Mag_HistEntropy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Mag_Kurtosis',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Mag_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Mag_Skewness',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Gradient_Mag_Std',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_ASM_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_ASM_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_Contrast_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_Contrast_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_Correlation_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_Correlation_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_DifferenceEntropy_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_DifferenceEntropy_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_DifferenceVariance_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_DifferenceVariance_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_Entropy_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_Entropy_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_IDM_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_IDM_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_IMC1_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_IMC1_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_IMC2_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_IMC2_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumAverage_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumAverage_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumEntropy_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumEntropy_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumOfSquares_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumOfSquares_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumVariance_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Haralick_SumVariance_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_HistEnergy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_HistEntropy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_IQR',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Kurtosis',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_MAD',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Max',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_MeanMedianDiff',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Median',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Min',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Skewness',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Cytoplasm_Intensity_Std',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Identifier_WeightedCentroidX',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Identifier_WeightedCentroidY',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Canny_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Canny_Sum',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Mag_HistEnergy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Mag_HistEntropy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Mag_Kurtosis',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Mag_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Mag_Skewness',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Gradient_Mag_Std',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_ASM_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_ASM_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_Contrast_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_Contrast_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_Correlation_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_Correlation_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_DifferenceEntropy_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_DifferenceEntropy_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_DifferenceVariance_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_DifferenceVariance_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_Entropy_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_Entropy_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_IDM_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_IDM_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_IMC1_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_IMC1_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_IMC2_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_IMC2_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumAverage_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumAverage_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumEntropy_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumEntropy_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumOfSquares_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumOfSquares_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumVariance_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Haralick_SumVariance_Range',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_HistEnergy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_HistEntropy',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_IQR',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Kurtosis',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_MAD',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Max',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Mean',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_MeanMedianDiff',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Median',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Min',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Skewness',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Nucleus_Intensity_Std',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Orientation_Orientation',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_Circularity',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_Eccentricity',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_EquivalentDiameter',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_Extent',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FSD1',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FSD2',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FSD3',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FSD4',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FSD5',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FSD6',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_FractalDimension',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments1',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments2',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments3',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments4',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments5',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments6',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_HuMoments7',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_MinorMajorAxisRatio',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_Solidity',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments1',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments2',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments3',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments4',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments5',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments6',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Shape_WeightedHuMoments7',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Size_Area',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Size_ConvexHullArea',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Size_MajorAxisLength',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Size_MinorAxisLength',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Size_Perimeter',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='SuperClassifProbab_AmbiguousSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='SuperClassifProbab_BACKGROUND',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='SuperClassifProbab_EpithelialSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='SuperClassifProbab_OtherSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='SuperClassifProbab_StromalSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='SuperClassifProbab_TILsSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_ActiveStromalCellNOS',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_ActiveTILsCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_BACKGROUND',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_CancerEpithelium',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_NormalEpithelium',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_OtherCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_StromalCellNOS',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_TILsCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_ClassifProbab_UnknownOrAmbiguousCell',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Classif_StandardClass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Classif_SuperClass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Identifier_CentroidX',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Identifier_CentroidY',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Identifier_Xmax',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Identifier_Xmin',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Identifier_Ymax',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_Identifier_Ymin',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_SuperClassifProbab_AmbiguousSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_SuperClassifProbab_BACKGROUND',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_SuperClassifProbab_EpithelialSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_SuperClassifProbab_OtherSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_SuperClassifProbab_StromalSuperclass',
+                ),
+                migrations.RemoveField(
+                    model_name='nucleus',
+                    name='Unconstrained_SuperClassifProbab_TILsSuperclass',
+                ),
+            ],
+        ),
+        migrations.RunPython(drop_feature_columns, restore_feature_columns),
+    ]
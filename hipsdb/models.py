@@ -1,10 +1,50 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+class ImageQuerySet(models.QuerySet):
+    def complete(self):
+        """Return the images whose ingest has finished."""
+        return self.filter(ingest_state=Image.COMPLETE)
+
+    def update_counts(self) -> int:
+        """
+        Recompute the stored ROI and nucleus counts of the images.
+
+        Only ROIs whose nuclei are completely stored are counted. The counts
+        are summed up from the ROI table, so the nucleus table is not scanned.
+        """
+        rois = ROI.objects.filter(image=OuterRef('pk'), ingested=True).values('image')
+        return self.update(
+            roi_count=Coalesce(Subquery(rois.annotate(count=Count('pk')).values('count')), 0),
+            nucleus_count=Coalesce(Subquery(rois.annotate(count=Sum('nucleus_count')).values('count')), 0),
+        )
 
 
 class Image(models.Model):
+    LOADING = 'loading'
+    COMPLETE = 'complete'
+
     name: str = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Ingest journal: images are only complete once every ROI is stored, and
+    # an interrupted ingest of the same source can be resumed.
+    ingest_state: str = models.CharField(
+        max_length=16,
+        choices=[(LOADING, LOADING), (COMPLETE, COMPLETE)],
+        default=COMPLETE,
+    )
+    source: str = models.CharField(max_length=4096, blank=True, default='')
+
+    # Number of stored ROIs and nuclei, kept up to date by ingest and delete
+    # (see `ImageQuerySet.update_counts`), so they need not be counted.
+    roi_count: int = models.IntegerField(default=0)
+    nucleus_count: int = models.IntegerField(default=0)
+
+    objects = ImageQuerySet.as_manager()
+
 
 class ROI(models.Model):
     name: str = models.CharField(max_length=255)
@@ -15,9 +55,24 @@ class ROI(models.Model):
     right: int = models.IntegerField()
     bottom: int = models.IntegerField()
 
+    # Set once all nuclei of the ROI are stored.
+    ingested: bool = models.BooleanField(default=True)
+    # Digest of the data of the ROI's CSV files, to detect changed files.
+    digest: str = models.CharField(max_length=64, blank=True, default='')
+    # Number of nuclei, set once they are all stored.
+    nucleus_count: int = models.IntegerField(default=0)
+
 
+# The nucleus table only holds the fields most queries need (identity,
+# bounding box, centroid and class); the other features are split over the
+# models below, each joined 1:1 with the nucleus, so that reading nuclei does
+# not drag ~170 feature columns through the page cache. Generated with
+# `hips_etl/scripts/generate_nucleus_model.py`.
 class Nucleus(models.Model):
-    roi: ROI = models.ForeignKey(ROI, on_delete=models.CASCADE, related_name="nuclei")
+    # Lookups by ROI use the indexes below, which all start with the ROI. The
+    # unique constraint is kept while the other indexes are dropped for a bulk
+    # load (see `hipsdb.loaders.deferred_indexes`), so ROI lookups stay indexed.
+    roi: ROI = models.ForeignKey(ROI, on_delete=models.CASCADE, related_name="nuclei", db_index=False)
 
     Identifier_ObjectCode = models.IntegerField(db_column="Identifier.ObjectCode")
     Identifier_Xmin = models.IntegerField(db_column="Identifier.Xmin")
@@ -53,6 +108,31 @@ class Nucleus(models.Model):
         ],
         db_column="Classif.SuperClass",
     )
+
+    class Meta:
+        # The fast loaders drop these while they bulk load nuclei, and build
+        # them again afterwards (see `hipsdb.loaders`).
+        indexes = [
+            # Covers queries for centroids within (a range of) an ROI.
+            models.Index(fields=["roi", "Identifier_CentroidX", "Identifier_CentroidY"], name="nucleus_roi_centroid"),
+            models.Index(fields=["roi", "Classif_StandardClass"], name="nucleus_roi_standard_class"),
+            models.Index(fields=["roi", "Classif_SuperClass"], name="nucleus_roi_super_class"),
+        ]
+        constraints = [
+            # Written with expressions so that it is a plain unique index on
+            # every backend (SQLite would otherwise make it part of the table
+            # definition), which can be dropped during bulk loads.
+            models.UniqueConstraint(F("roi"), F("Identifier_ObjectCode"), name="nucleus_roi_objectcode"),
+        ]
+
+
+class NucleusClassification(models.Model):
+    """Classification probabilities of a nucleus, also before constraints."""
+
+    nucleus: Nucleus = models.OneToOneField(
+        Nucleus, on_delete=models.CASCADE, primary_key=True, related_name="classification"
+    )
+
     ClassifProbab_CancerEpithelium = models.FloatField(
         db_column="ClassifProbab.CancerEpithelium"
     )
@@ -180,6 +260,15 @@ class Nucleus(models.Model):
     Unconstrained_SuperClassifProbab_BACKGROUND = models.FloatField(
         db_column="Unconstrained.SuperClassifProbab.BACKGROUND"
     )
+
+
+class NucleusShape(models.Model):
+    """Size and shape features of a nucleus."""
+
+    nucleus: Nucleus = models.OneToOneField(
+        Nucleus, on_delete=models.CASCADE, primary_key=True, related_name="shape"
+    )
+
     Identifier_WeightedCentroidX = models.FloatField(
         db_column="Identifier.WeightedCentroidX"
     )
@@ -219,6 +308,15 @@ class Nucleus(models.Model):
     Shape_FSD4 = models.FloatField(db_column="Shape.FSD4")
     Shape_FSD5 = models.FloatField(db_column="Shape.FSD5")
     Shape_FSD6 = models.FloatField(db_column="Shape.FSD6")
+
+
+class NucleusIntensity(models.Model):
+    """Intensity features of a nucleus and its cytoplasm."""
+
+    nucleus: Nucleus = models.OneToOneField(
+        Nucleus, on_delete=models.CASCADE, primary_key=True, related_name="intensity"
+    )
+
     Nucleus_Intensity_Min = models.IntegerField(db_column="Nucleus.Intensity.Min")
     Nucleus_Intensity_Max = models.IntegerField(db_column="Nucleus.Intensity.Max")
     Nucleus_Intensity_Mean = models.FloatField(db_column="Nucleus.Intensity.Mean")
@@ -265,6 +363,15 @@ class Nucleus(models.Model):
     Cytoplasm_Intensity_HistEntropy = models.FloatField(
         db_column="Cytoplasm.Intensity.HistEntropy"
     )
+
+
+class NucleusGradient(models.Model):
+    """Gradient features of a nucleus and its cytoplasm."""
+
+    nucleus: Nucleus = models.OneToOneField(
+        Nucleus, on_delete=models.CASCADE, primary_key=True, related_name="gradient"
+    )
+
     Nucleus_Gradient_Mag_Mean = models.FloatField(db_column="Nucleus.Gradient.Mag.Mean")
     Nucleus_Gradient_Mag_Std = models.FloatField(db_column="Nucleus.Gradient.Mag.Std")
     Nucleus_Gradient_Mag_Skewness = models.FloatField(
@@ -309,6 +416,15 @@ class Nucleus(models.Model):
     Cytoplasm_Gradient_Canny_Mean = models.FloatField(
         db_column="Cytoplasm.Gradient.Canny.Mean"
     )
+
+
+class NucleusHaralick(models.Model):
+    """Haralick texture features of a nucleus and its cytoplasm."""
+
+    nucleus: Nucleus = models.OneToOneField(
+        Nucleus, on_delete=models.CASCADE, primary_key=True, related_name="haralick"
+    )
+
     Nucleus_Haralick_ASM_Mean = models.FloatField(db_column="Nucleus.Haralick.ASM.Mean")
     Nucleus_Haralick_ASM_Range = models.FloatField(
         db_column="Nucleus.Haralick.ASM.Range"
@@ -461,3 +577,45 @@ class Nucleus(models.Model):
     Cytoplasm_Haralick_IMC2_Range = models.FloatField(
         db_column="Cytoplasm.Haralick.IMC2.Range"
     )
+
+
+# The models of the feature groups of a nucleus.
+nucleus_feature_models = (
+    NucleusClassification,
+    NucleusShape,
+    NucleusIntensity,
+    NucleusGradient,
+    NucleusHaralick,
+)
+
+# The model that stores each nucleus field, by field name.
+nucleus_field_models = {
+    field.name: model
+    for model in (Nucleus, *nucleus_feature_models)
+    for field in model._meta.concrete_fields
+    if not field.primary_key and not field.is_relation
+}
+
+
+def nucleus_field_path(name: str) -> str:
+    """Return the lookup of a nucleus field from `Nucleus`, e.g. "shape__Size_Area" for "Size_Area"."""
+    model = nucleus_field_models[name]
+    if model is Nucleus:
+        return name
+
+    return f'{model._meta.get_field("nucleus").related_query_name()}__{name}'
+
+
+class IngestReport(models.Model):
+    """Timings and throughput of an ingest run, to track them across releases."""
+    created_at = models.DateTimeField(auto_now_add=True)
+    version: str = models.CharField(max_length=64)
+
+    images: int = models.IntegerField()
+    failed_images: int = models.IntegerField()
+    rois: int = models.IntegerField()
+    nuclei: int = models.IntegerField()
+    seconds: float = models.FloatField()
+
+    # The time, calls and rows/sec of each phase (see `hips_etl.profiling`).
+    phases = models.JSONField(default=list)
@@ -0,0 +1,114 @@
+from typing import Iterable
+
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.db.models.expressions import RawSQL
+
+from hipsdb.models import ROI, Nucleus
+from hips_etl.profiling import timer
+
+# The spatial index holds the bounding box of each nucleus in image
+# coordinates (nuclei are stored relative to their ROI), keyed by the ID of
+# the nucleus. On SQLite it is an R*Tree virtual table with the image as a
+# third dimension, so a search only descends into the boxes of one image; on
+# PostgreSQL it is a table of boxes with a GiST index. It is created by
+# migration 0009, and its entries are deleted along with their nuclei by the
+# database (by a trigger on SQLite, and a cascading foreign key on PostgreSQL).
+table = 'hipsdb_nucleus_bbox'
+
+
+def _columns() -> dict[str, str]:
+    """Return the quoted names of the tables and columns needed to fill the index."""
+    names = {
+        'table': table,
+        'nucleus': Nucleus._meta.db_table,
+        'roi': ROI._meta.db_table,
+        'roi_id': Nucleus._meta.get_field('roi').column,
+        'image_id': ROI._meta.get_field('image').column,
+        'left': ROI._meta.get_field('left').column,
+        'top': ROI._meta.get_field('top').column,
+    }
+    for field in ('Identifier_Xmin', 'Identifier_Ymin', 'Identifier_Xmax', 'Identifier_Ymax'):
+        names[field] = Nucleus._meta.get_field(field).column
+    return {key: connection.ops.quote_name(name) for key, name in names.items()}
+
+
+def index_rois(roi_ids: Iterable[int]) -> int:
+    """
+    Add the nuclei of completely stored ROIs to the spatial index.
+
+    Each ROI's nuclei are read through the unique index of the ROI and
+    ObjectCode, which deferred_indexes() keeps during a bulk load, so the
+    cost of an ROI does not grow with the nucleus table. Does nothing on
+    database backends without a spatial index. Returns the number of nuclei
+    added.
+    """
+    c = _columns()
+    source = (
+        f'FROM {c["nucleus"]} n JOIN {c["roi"]} r ON r.id = n.{c["roi_id"]} WHERE n.{c["roi_id"]} = %s'
+    )
+    if connection.vendor == 'sqlite':
+        sql = (
+            f'INSERT INTO {c["table"]} (id, image_min, image_max, xmin, xmax, ymin, ymax)'
+            f' SELECT n.id, r.{c["image_id"]}, r.{c["image_id"]},'
+            f' r.{c["left"]} + n.{c["Identifier_Xmin"]}, r.{c["left"]} + n.{c["Identifier_Xmax"]},'
+            f' r.{c["top"]} + n.{c["Identifier_Ymin"]}, r.{c["top"]} + n.{c["Identifier_Ymax"]} {source}'
+        )
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f'INSERT INTO {c["table"]} (id, image_id, bbox)'
+            f' SELECT n.id, r.{c["image_id"]}, box('
+            f'point(r.{c["left"]} + n.{c["Identifier_Xmin"]}, r.{c["top"]} + n.{c["Identifier_Ymin"]}),'
+            f' point(r.{c["left"]} + n.{c["Identifier_Xmax"]}, r.{c["top"]} + n.{c["Identifier_Ymax"]})) {source}'
+        )
+    else:
+        return 0
+
+    count = 0
+    with timer.phase('spatial_index'), connection.cursor() as cursor:
+        for roi_id in roi_ids:
+            cursor.execute(sql, [roi_id])
+            count += cursor.rowcount
+    timer.count('spatial_index', count)
+    return count
+
+
+def nuclei_in_rect(image_id: int, x0: int, y0: int, x1: int, y1: int, centroid: bool = False) -> QuerySet[Nucleus]:
+    """
+    Return the nuclei of an image that intersect a rectangle.
+
+    The rectangle spans `x0` to `x1` and `y0` to `y1` (inclusive) in image
+    coordinates. A nucleus intersects it if its bounding box does, or with
+    `centroid`, if its centroid lies in it. Only the nuclei of completely
+    stored ROIs are found. The spatial index finds them without scanning the
+    nuclei of whole ROIs; on database backends without a spatial index, the
+    nuclei of the image are filtered instead.
+    """
+    if connection.vendor == 'sqlite':
+        nuclei = Nucleus.objects.filter(pk__in=RawSQL(
+            f'SELECT id FROM {table} WHERE image_min <= %s AND image_max >= %s'
+            ' AND xmin <= %s AND xmax >= %s AND ymin <= %s AND ymax >= %s',
+            [image_id, image_id, x1, x0, y1, y0],
+        ))
+    elif connection.vendor == 'postgresql':
+        nuclei = Nucleus.objects.filter(pk__in=RawSQL(
+            f'SELECT id FROM {table} WHERE bbox && box(point(%s, %s), point(%s, %s)) AND image_id = %s',
+            [x0, y0, x1, y1, image_id],
+        ))
+    else:
+        nuclei = Nucleus.objects.filter(roi__image_id=image_id, roi__ingested=True).alias(
+            xmin=F('roi__left') + F('Identifier_Xmin'),
+            xmax=F('roi__left') + F('Identifier_Xmax'),
+            ymin=F('roi__top') + F('Identifier_Ymin'),
+            ymax=F('roi__top') + F('Identifier_Ymax'),
+        ).filter(xmin__lte=x1, xmax__gte=x0, ymin__lte=y1, ymax__gte=y0)
+
+    if centroid:
+        # The centroid lies in the bounding box, so this only narrows down
+        # the nuclei found by the index.
+        nuclei = nuclei.alias(
+            x=F('roi__left') + F('Identifier_CentroidX'),
+            y=F('roi__top') + F('Identifier_CentroidY'),
+        ).filter(x__range=(x0, x1), y__range=(y0, y1))
+
+    return nuclei
@@ -1 +1,746 @@
-# Create your tests here.
+from contextlib import ExitStack, contextmanager, redirect_stdout
+import io
+import json
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Callable, ContextManager, Iterator, TypeVar
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from hipsdb.deletion import delete_images, delete_nuclei, delete_rois
+from hipsdb.loaders import deferred_indexes, ensure_indexes, get_loader, loaders
+from hipsdb.management.commands import benchmark, delete
+from hipsdb.management.commands.ingest import ingest_image
+from hipsdb.models import ROI, Image, IngestReport, Nucleus, nucleus_feature_models, nucleus_field_models, nucleus_field_path
+from hipsdb import spatial
+from hips_etl.synthetic import generate_hips_dir
+from hips_etl.utils import get_json_value, random_nucleus_values
+from hips_etl.validation import HipsValidationError, roi_digests
+
+
+T = TypeVar('T')
+
+# The names of the indexes and constraints declared on the nucleus table.
+declared_indexes = {index.name for index in [*Nucleus._meta.indexes, *Nucleus._meta.constraints]}
+
+# A query plan that reads the whole nucleus table, rather than searching an index.
+table_scan = rf'SCAN {Nucleus._meta.db_table}\b(?! USING)'
+
+
+@contextmanager
+def synthetic_dir(rois: int, nuclei: int, seed: int = 0, name: str = 'image') -> Iterator[Path]:
+    """Generate a synthetic data directory in a temporary directory, and yield its path."""
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / name
+        generate_hips_dir(data_dir, rois=rois, nuclei=nuclei, seed=seed)
+        yield data_dir
+
+
+def enter_context(test: TestCase, context: ContextManager[T]) -> T:
+    """Enter a context manager until the end of a test (`TestCase.enterContext` of Python 3.11)."""
+    value = context.__enter__()
+    test.addCleanup(context.__exit__, None, None, None)
+    return value
+
+
+def ingest_synthetic(rois: int, nuclei: int, seed: int = 0) -> Image:
+    """Generate and ingest a synthetic image, and return it."""
+    with synthetic_dir(rois, nuclei, seed) as data_dir, redirect_stdout(io.StringIO()):
+        ingest_image(data_dir)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    return Image.objects.latest('id')
+
+
+@contextmanager
+def watch_loads(watch: Callable[[list[tuple]], None]) -> Iterator[None]:
+    """Call `watch` with each batch of nuclei before the loader writes it."""
+    loader_class = type(get_loader('auto'))
+    load = loader_class.load
+
+    def watched_load(loader, roi_id: int, fields: list[str], rows: list[tuple]):
+        watch(rows)
+        load(loader, roi_id, fields, rows)
+
+    with mock.patch.object(loader_class, 'load', watched_load):
+        yield
+
+
+def index_names() -> set[str]:
+    """Return the names of the indexes of the nucleus table."""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, Nucleus._meta.db_table)
+    return {name for name, info in constraints.items() if info['index']}
+
+
+def count_rows(table: str) -> int:
+    """Count the rows of a table."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+def query_plan(sql: str) -> str:
+    """Return the SQLite query plan of a query, one step after another."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return ' / '.join(row[-1] for row in cursor.fetchall())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite')
+class NucleusQueryPlanTests(TestCase):
+    """The nuclei endpoint is served from the indexes of the nucleus table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        image = ingest_synthetic(rois=2, nuclei=500)
+        cls.roi = image.rois.order_by('id').first()
+        cls.url = f'/hipsdb/images/{image.id}/rois/{cls.roi.id}/nuclei'
+
+    def query_plans(self, query: str) -> dict[str, str]:
+        """Get the nuclei endpoint, and return the query plan of each of its queries of the nucleus table."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200)
+
+        plans = {
+            executed['sql']: query_plan(executed['sql'])
+            for executed in queries if Nucleus._meta.db_table in executed['sql']
+        }
+        self.assertTrue(plans)
+        return plans
+
+    def assertUsesIndex(self, query: str, index: str, covering: bool = False):
+        using = f'USING COVERING INDEX {index}' if covering else f'INDEX {index}'
+        for sql, plan in self.query_plans(query).items():
+            # The count of the pagination may use any index of the ROI.
+            if 'COUNT(' not in sql:
+                self.assertIn(using, plan)
+
+    def assertNoTableScan(self, query: str):
+        for plan in self.query_plans(query).values():
+            self.assertNotRegex(plan, table_scan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_page(self):
+        self.assertNoTableScan('limit=100&offset=200')
+
+    def test_centroids(self):
+        query = 'limit=1000&fields=Identifier_CentroidX&fields=Identifier_CentroidY'
+        self.assertNoTableScan(query)
+        self.assertUsesIndex(query, 'nucleus_roi_centroid', covering=True)
+
+    def test_classes(self):
+        self.assertNoTableScan('standard_class=TILsCell')
+        self.assertUsesIndex('standard_class=TILsCell', 'nucleus_roi_standard_class')
+        self.assertNoTableScan('super_class=TILsSuperclass')
+        self.assertUsesIndex('super_class=TILsSuperclass', 'nucleus_roi_super_class')
+
+    def test_class_filter(self):
+        response = self.client.get(f'{self.url}?standard_class=TILsCell&fields=Classif_StandardClass&limit=1000')
+        items = response.json()['items']
+        self.assertTrue(items)
+        self.assertEqual({item['Classif_StandardClass'] for item in items}, {'TILsCell'})
+
+
+class DeferredIndexTests(TestCase):
+    """The indexes of the nucleus table are dropped for a bulk load, and built again afterwards."""
+
+    def test_deferred_indexes(self):
+        self.assertLessEqual(declared_indexes, index_names())
+
+        with deferred_indexes():
+            # The unique index of the ROI and ObjectCode is kept.
+            self.assertEqual(declared_indexes & index_names(), {'nucleus_roi_objectcode'})
+        self.assertLessEqual(declared_indexes, index_names())
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite')
+    def test_roi_lookups_while_deferred(self):
+        with deferred_indexes():
+            image = ingest_synthetic(rois=2, nuclei=100)
+            roi = image.rois.order_by('id').first()
+            with CaptureQueriesContext(connection) as queries:
+                delete_nuclei(roi.id, batch_size=30)
+
+            for executed in queries:
+                plan = query_plan(executed['sql'])
+                self.assertNotRegex(plan, table_scan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite')
+    def test_spatial_index_while_deferred(self):
+        with deferred_indexes():
+            image = ingest_synthetic(rois=2, nuclei=100)
+            roi = image.rois.order_by('id').first()
+            nucleus_ids = list(roi.nuclei.values_list('id', flat=True))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {spatial.table} WHERE id IN ({", ".join(map(str, nucleus_ids))})')
+
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(spatial.index_rois([roi.id]), len(nucleus_ids))
+
+            for executed in queries:
+                plan = query_plan(executed['sql'])
+                # The nucleus table is aliased as n.
+                self.assertNotRegex(plan, r'SCAN n\b(?! USING)')
+                self.assertIn('SEARCH n USING', plan)
+
+        found = spatial.nuclei_in_rect(image.id, 0, 0, 10**6, 10**6).filter(roi=roi)
+        self.assertEqual(set(found.values_list('id', flat=True)), set(nucleus_ids))
+
+    def test_missing_indexes_are_built(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name("nucleus_roi_centroid")}')
+
+        with deferred_indexes():
+            pass
+        self.assertLessEqual(declared_indexes, index_names())
+
+    def test_stored_nuclei_keep_indexes(self):
+        ingest_synthetic(rois=1, nuclei=50)
+        with deferred_indexes():
+            self.assertLessEqual(declared_indexes, index_names())
+
+
+class KilledLoadTests(TransactionTestCase):
+    """Indexes dropped by a load that was killed, outside of a transaction, are built again."""
+
+    def setUp(self):
+        # Leave the context open during the test, like a killed process. It
+        # is closed (building the indexes) once the test is done.
+        enter_context(self, deferred_indexes())
+        ingest_synthetic(rois=1, nuclei=50)
+        self.assertEqual(declared_indexes & index_names(), {'nucleus_roi_objectcode'})
+
+    def test_ensure_indexes(self):
+        self.assertEqual(set(ensure_indexes()), declared_indexes - {'nucleus_roi_objectcode'})
+        self.assertLessEqual(declared_indexes, index_names())
+        self.assertEqual(ensure_indexes(), [])
+
+    def test_ingest(self):
+        with synthetic_dir(rois=1, nuclei=50, seed=1) as data_dir, redirect_stdout(io.StringIO()) as output:
+            with self.assertRaises(SystemExit) as exit:
+                call_command('ingest', str(data_dir))
+        self.assertEqual(exit.exception.code, 0)
+        self.assertIn('Built missing indexes', output.getvalue())
+        self.assertLessEqual(declared_indexes, index_names())
+
+    def test_migrate(self):
+        call_command('migrate', verbosity=0)
+        self.assertLessEqual(declared_indexes, index_names())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the spatial index is checked with SQLite')
+class SpatialIndexTests(TestCase):
+    """Nuclei in a rectangle of an image are found with the spatial index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.image = ingest_synthetic(rois=4, nuclei=300)
+        # Another image in the same coordinates, which must not be found.
+        ingest_synthetic(rois=1, nuclei=300, seed=1)
+
+    def expected(self, x0: int, y0: int, x1: int, y1: int, centroid: bool = False) -> set[int]:
+        """Find the nuclei in a rectangle of the image by looking at every nucleus."""
+        found = set()
+        for roi in self.image.rois.all():
+            for nucleus in roi.nuclei.all():
+                if centroid:
+                    x = roi.left + nucleus.Identifier_CentroidX
+                    y = roi.top + nucleus.Identifier_CentroidY
+                    inside = x0 <= x <= x1 and y0 <= y <= y1
+                else:
+                    inside = (
+                        roi.left + nucleus.Identifier_Xmin <= x1 and roi.left + nucleus.Identifier_Xmax >= x0
+                        and roi.top + nucleus.Identifier_Ymin <= y1 and roi.top + nucleus.Identifier_Ymax >= y0
+                    )
+                if inside:
+                    found.add(nucleus.pk)
+        return found
+
+    def test_nuclei_in_rect(self):
+        # Within an ROI, across ROIs, around the whole image and outside it.
+        for rect in [(100, 100, 600, 400), (1800, 1500, 2300, 2600), (0, 0, 10**6, 10**6), (10**5, 0, 10**6, 10)]:
+            for centroid in (False, True):
+                with self.subTest(rect=rect, centroid=centroid):
+                    nuclei = spatial.nuclei_in_rect(self.image.pk, *rect, centroid=centroid)
+                    self.assertEqual(set(nuclei.values_list('pk', flat=True)), self.expected(*rect, centroid))
+
+    def test_query_plan(self):
+        nuclei = spatial.nuclei_in_rect(self.image.pk, 100, 100, 600, 400)
+        plan = nuclei.explain()
+        self.assertIn(f'SCAN {spatial.table} VIRTUAL TABLE INDEX', plan)
+        self.assertNotRegex(plan, table_scan)
+
+    def test_deleted_nuclei_leave_index(self):
+        roi = self.image.rois.order_by('id').first()
+        before = count_rows(spatial.table)
+        delete_rois(self.image.rois.filter(pk=roi.pk))
+        self.assertEqual(count_rows(spatial.table), before - roi.nucleus_count)
+
+    def test_image_nuclei_endpoint(self):
+        url = f'/hipsdb/images/{self.image.pk}/nuclei'
+        rect = (1800, 1500, 2300, 2600)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{url}?bbox={",".join(map(str, rect))}&fields=Identifier_ObjectCode')
+        self.assertEqual(response.status_code, 200)
+        # The image, the nuclei (through the spatial index) and their ROIs.
+        self.assertEqual(len(queries), 3)
+
+        data = response.json()
+        self.assertFalse(data['truncated'])
+        self.assertEqual(
+            {(item['roi'], item['Identifier_ObjectCode']) for item in data['items']},
+            set(Nucleus.objects.filter(pk__in=self.expected(*rect)).values_list('roi', 'Identifier_ObjectCode')),
+        )
+        self.assertEqual({roi['id'] for roi in data['rois']}, {item['roi'] for item in data['items']})
+        self.assertGreater(len(data['rois']), 1)
+        self.assertEqual(set(data['items'][0]), {'roi', 'Identifier_ObjectCode'})
+
+    def test_image_nuclei_endpoint_truncated(self):
+        url = f'/hipsdb/images/{self.image.pk}/nuclei?bbox=0,0,100000,100000&max_results=10&fields=Identifier_ObjectCode'
+        data = self.client.get(url).json()
+        self.assertTrue(data['truncated'])
+        # The nuclei with the lowest IDs, every time.
+        first = Nucleus.objects.filter(pk__in=sorted(self.expected(0, 0, 100000, 100000))[:10])
+        self.assertEqual(
+            [(item['roi'], item['Identifier_ObjectCode']) for item in data['items']],
+            list(first.order_by('id').values_list('roi', 'Identifier_ObjectCode')),
+        )
+        self.assertEqual(self.client.get(url).json(), data)
+
+    def test_image_nuclei_endpoint_errors(self):
+        url = f'/hipsdb/images/{self.image.pk}/nuclei'
+        for bbox in ('1,2,3', 'a,b,c,d', '10,0,0,10'):
+            with self.subTest(bbox=bbox):
+                self.assertEqual(self.client.get(f'{url}?bbox={bbox}').status_code, 400)
+        self.assertEqual(self.client.get('/hipsdb/images/0/nuclei?bbox=0,0,1,1').status_code, 404)
+
+
+class FeatureTableTests(TestCase):
+    """The features of nuclei are stored in 1:1 tables, which are only joined when needed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.image = ingest_synthetic(rois=1, nuclei=100)
+        cls.roi = cls.image.rois.get()
+        cls.url = f'/hipsdb/images/{cls.image.id}/rois/{cls.roi.id}/nuclei'
+
+    def nucleus_queries(self, query: str) -> list[str]:
+        """Get the nuclei endpoint, and return its queries of nuclei."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [executed['sql'] for executed in queries if Nucleus._meta.db_table in executed['sql']]
+
+    def test_all_fields(self):
+        item = self.client.get(f'{self.url}?limit=1').json()['items'][0]
+        self.assertEqual(list(item), [field['django_name'] for field in get_json_value('nucleus_fields.json')])
+
+    def test_joins(self):
+        for sql in self.nucleus_queries('fields=Identifier_CentroidX&fields=Classif_StandardClass'):
+            self.assertNotIn('JOIN', sql)
+
+        shape = connection.ops.quote_name(nucleus_field_models['Size_Area']._meta.db_table)
+        for sql in self.nucleus_queries('fields=Identifier_CentroidX&fields=Size_Area'):
+            if 'COUNT(' not in sql:
+                self.assertEqual(sql.count('JOIN'), 1)
+                self.assertIn(f'JOIN {shape}', sql)
+
+    def test_loaders(self):
+        values = random_nucleus_values()
+        fields = list(values)
+        code = fields.index('Identifier_ObjectCode')
+        area = fields.index('Size_Area')
+        rows = [
+            tuple(i + 1 if n == code else i * 10 if n == area else value for n, value in enumerate(values.values()))
+            for i in range(5)
+        ]
+        paths = [nucleus_field_path(name) for name in fields]
+
+        for name, loader_class in loaders.items():
+            if loader_class.vendor not in (None, connection.vendor):
+                continue
+            with self.subTest(loader=name):
+                roi = ROI.objects.create(image=self.image, name=f'loader-{name}', left=0, top=0, right=0, bottom=0)
+                get_loader(name).load(roi.id, fields, rows)
+                self.assertEqual(list(roi.nuclei.order_by('Identifier_ObjectCode').values_list(*paths)), rows)
+
+    def test_delete_nuclei(self):
+        self.assertEqual(delete_nuclei(self.roi.id, batch_size=30), 100)
+        for model in (Nucleus, *nucleus_feature_models):
+            self.assertFalse(model.objects.exists())
+
+
+class StoredCountTests(TestCase):
+    """The ROI and nucleus counts stored on images and ROIs match their contents."""
+
+    def assertCounts(self, image: Image, rois: int, nuclei: int):
+        image.refresh_from_db()
+        self.assertEqual((image.roi_count, image.nucleus_count), (rois, nuclei))
+        self.assertEqual(image.rois.filter(ingested=True).count(), rois)
+        self.assertEqual(Nucleus.objects.filter(roi__image=image).count(), nuclei)
+        for roi in image.rois.all():
+            self.assertEqual(roi.nucleus_count, roi.nuclei.count())
+
+    def test_counts(self):
+        image = ingest_synthetic(rois=3, nuclei=100)
+        other = ingest_synthetic(rois=1, nuclei=50, seed=1)
+        self.assertCounts(image, 3, 300)
+        self.assertCounts(other, 1, 50)
+
+        images = {item['id']: item for item in self.client.get('/hipsdb/images').json()}
+        self.assertEqual((images[image.id]['roi_count'], images[image.id]['nucleus_count']), (3, 300))
+        rois = self.client.get(f'/hipsdb/images/{image.id}/rois').json()['items']
+        self.assertEqual([roi['nucleus_count'] for roi in rois], [100] * 3)
+
+        delete_rois(image.rois.filter(name='2'))
+        self.assertCounts(image, 2, 200)
+        self.assertCounts(other, 1, 50)
+
+        with redirect_stdout(io.StringIO()) as output:
+            call_command('list')
+        self.assertIn(f'(ID {image.id}, 2 ROIs, 200 nuclei', output.getvalue())
+
+    def test_update_counts(self):
+        image = ingest_synthetic(rois=2, nuclei=100)
+        Image.objects.filter(pk=image.pk).update(roi_count=0, nucleus_count=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            Image.objects.filter(pk=image.pk).update_counts()
+        # The counts are summed up from the ROIs, without reading the nuclei.
+        self.assertNotIn(Nucleus._meta.db_table, ' '.join(query['sql'] for query in queries))
+        self.assertCounts(image, 2, 200)
+
+
+class DeletionTests(TestCase):
+    """Images are deleted with their ROIs, nuclei and spatial index entries, a batch at a time."""
+
+    def test_delete_images(self):
+        image = ingest_synthetic(rois=2, nuclei=100)
+        other = ingest_synthetic(rois=1, nuclei=50, seed=1)
+
+        batches = []
+        counts = delete_images(Image.objects.filter(pk=image.pk), batch_size=30, progress=batches.append)
+        self.assertEqual(counts, (1, 2, 200))
+        self.assertEqual(batches, [30, 30, 30, 10] * 2)
+
+        self.assertEqual(list(Image.objects.all()), [other])
+        self.assertEqual(ROI.objects.filter(image=image).count(), 0)
+        tables = [spatial.table, Nucleus._meta.db_table, *(model._meta.db_table for model in nucleus_feature_models)]
+        self.assertEqual({table: count_rows(table) for table in tables}, dict.fromkeys(tables, 50))
+
+
+class DeleteCommandTests(TransactionTestCase):
+    """The delete command reports what it deleted, and reclaims the space of it."""
+
+    def test_delete(self):
+        image = ingest_synthetic(rois=2, nuclei=100)
+        other = ingest_synthetic(rois=1, nuclei=50, seed=1)
+
+        with mock.patch.object(delete.click, 'confirm', return_value=True), redirect_stdout(io.StringIO()) as output:
+            with self.assertRaises(SystemExit) as exit:
+                call_command('delete', str(image.pk), '--batch-size', '30', '--vacuum')
+        self.assertEqual(exit.exception.code, 0)
+        self.assertIn('Deleted 1 images, 2 ROIs and 200 nuclei', output.getvalue())
+        self.assertEqual(list(Image.objects.all()), [other])
+        self.assertEqual(Nucleus.objects.count(), 50)
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA auto_vacuum')
+                self.assertEqual(cursor.fetchone()[0], 2)
+                cursor.execute('PRAGMA freelist_count')
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class IngestCommitTests(TestCase):
+    """Nuclei are written in bounded batches, and a failed image is not kept in any commit mode."""
+
+    def setUp(self):
+        self.data_dir = enter_context(self, synthetic_dir(rois=3, nuclei=100))
+
+    def break_last_roi(self):
+        """Put a value that fails validation into the first nucleus of the last ROI."""
+        meta_file = sorted((self.data_dir / 'nucleiMeta').iterdir())[-1]
+        header, first, *rows = meta_file.read_text().split('\n')
+        cells = first.split(',')
+        cells[header.split(',').index('Identifier.Xmin')] = 'abc'
+        meta_file.write_text('\n'.join([header, ','.join(cells), *rows]))
+
+    def test_batches(self):
+        for commit in ('image', 'roi', 'batch'):
+            with self.subTest(commit=commit):
+                sizes = []
+                with watch_loads(lambda rows: sizes.append(len(rows))), redirect_stdout(io.StringIO()):
+                    self.assertEqual(ingest_image(self.data_dir, batch_size=40, commit=commit), (3, 300))
+                self.assertEqual(sizes, [40, 40, 20] * 3)
+
+                image = Image.objects.latest('id')
+                self.assertEqual(image.ingest_state, Image.COMPLETE)
+                self.assertEqual(Nucleus.objects.filter(roi__image=image).count(), 300)
+
+    def test_validation_failure(self):
+        # The first two ROIs are stored before the last one fails validation.
+        self.break_last_roi()
+        for commit in ('image', 'roi', 'batch'):
+            with self.subTest(commit=commit):
+                with self.assertRaises(HipsValidationError), redirect_stdout(io.StringIO()):
+                    ingest_image(self.data_dir, batch_size=40, commit=commit)
+                self.assertFalse(Image.objects.exists())
+                self.assertFalse(ROI.objects.exists())
+                self.assertFalse(Nucleus.objects.exists())
+                self.assertEqual(count_rows(spatial.table), 0)
+
+
+class IngestUpdateTests(TestCase):
+    """An image is updated in place from changed files, and ROIs whose files are gone are pruned."""
+
+    def setUp(self):
+        self.data_dir = enter_context(self, synthetic_dir(rois=4, nuclei=100))
+        # Other data of the same ROIs.
+        self.other_dir = enter_context(self, synthetic_dir(rois=4, nuclei=100, seed=1))
+
+    def roi_files(self, data_dir: Path, number: int) -> list[Path]:
+        """Return the nucleiMeta and nucleiProps files of an ROI."""
+        return sorted(data_dir.glob(f'*/image_roi-{number}_*'))
+
+    def ingest(self, **options) -> tuple[int, int]:
+        with redirect_stdout(io.StringIO()):
+            return ingest_image(self.data_dir, **options)
+
+    def test_update(self):
+        # The image starts out without the 4th ROI.
+        aside = self.data_dir.parent / 'aside'
+        for path in self.roi_files(self.data_dir, 4):
+            (aside / path.parent.name).mkdir(parents=True, exist_ok=True)
+            path.rename(aside / path.parent.name / path.name)
+        self.assertEqual(self.ingest(), (3, 300))
+        image = Image.objects.get()
+        rois = {roi.name: roi for roi in image.rois.all()}
+        unchanged_ids = set(rois['3'].nuclei.values_list('id', flat=True))
+
+        # Change the 2nd ROI, add the 4th and remove the 1st.
+        for path in self.roi_files(self.other_dir, 2):
+            shutil.copy(path, self.data_dir / path.parent.name / path.name)
+        for path in self.roi_files(aside, 4):
+            path.rename(self.data_dir / path.parent.name / path.name)
+        for path in self.roi_files(self.data_dir, 1):
+            path.unlink()
+
+        self.assertEqual(self.ingest(update=True), (2, 200))
+        self.assertEqual(Image.objects.get(), image)
+        updated = {roi.name: roi for roi in image.rois.all()}
+        self.assertEqual(updated.keys(), {'1', '2', '3', '4'})
+        self.assertEqual(updated['1'], rois['1'])
+        self.assertEqual(updated['3'], rois['3'])
+        self.assertEqual(set(updated['3'].nuclei.values_list('id', flat=True)), unchanged_ids)
+        self.assertNotEqual(updated['2'], rois['2'])
+        self.assertEqual(
+            {name: roi.digest for name, roi in updated.items() if name != '1'},
+            roi_digests(self.data_dir),
+        )
+        image.refresh_from_db()
+        self.assertEqual((image.ingest_state, image.roi_count, image.nucleus_count), (Image.COMPLETE, 4, 400))
+
+        # Nothing has changed since, and the 1st ROI is pruned.
+        self.assertEqual(self.ingest(update=True, prune=True), (0, 0))
+        self.assertEqual(set(image.rois.values_list('name', flat=True)), {'2', '3', '4'})
+        self.assertFalse(ROI.objects.filter(pk=rois['1'].pk).exists())
+        image.refresh_from_db()
+        self.assertEqual((image.roi_count, image.nucleus_count), (3, 300))
+        self.assertEqual(Nucleus.objects.count(), 300)
+        self.assertEqual(count_rows(spatial.table), 300)
+
+
+class IngestJournalTests(TestCase):
+    """The progress of an ingest is journaled, so that an interrupted ingest can be resumed."""
+
+    def setUp(self):
+        self.data_dir = enter_context(self, synthetic_dir(rois=3, nuclei=100))
+
+    def ingest(self, fail_at: int | None = None, **options) -> tuple[int, int]:
+        """Ingest the image 40 nuclei at a time, failing like a killed process at the `fail_at`th batch."""
+        calls = 0
+
+        def fail(rows: list[tuple]):
+            nonlocal calls
+            calls += 1
+            if calls == fail_at:
+                raise RuntimeError('killed')
+
+        with watch_loads(fail), redirect_stdout(io.StringIO()):
+            return ingest_image(self.data_dir, batch_size=40, **options)
+
+    def assertListed(self, image: Image, listed: bool):
+        ids = [item['id'] for item in self.client.get('/hipsdb/images').json()]
+        self.assertEqual(image.id in ids, listed)
+
+    def test_journal(self):
+        self.assertEqual(self.ingest(), (3, 300))
+        image = Image.objects.get()
+        self.assertEqual(image.ingest_state, Image.COMPLETE)
+        self.assertEqual((image.roi_count, image.nucleus_count), (3, 300))
+        self.assertEqual(
+            dict(image.rois.values_list('name', 'digest')),
+            roi_digests(self.data_dir),
+        )
+        self.assertEqual(list(image.rois.values_list('ingested', 'nucleus_count')), [(True, 100)] * 3)
+        self.assertListed(image, True)
+
+    def test_resume(self):
+        # Each ROI is committed by default; the second one fails in its second batch.
+        with self.assertRaisesMessage(RuntimeError, 'killed'):
+            self.ingest(fail_at=5)
+        image = Image.objects.get()
+        first_roi = image.rois.get()
+        self.assertEqual(image.ingest_state, Image.LOADING)
+        self.assertTrue(first_roi.ingested)
+        self.assertEqual((image.roi_count, image.nucleus_count), (1, 100))
+        self.assertListed(image, False)
+
+        self.assertEqual(self.ingest(resume=True), (2, 200))
+        image.refresh_from_db()
+        self.assertEqual(image.ingest_state, Image.COMPLETE)
+        self.assertEqual((image.roi_count, image.nucleus_count), (3, 300))
+        self.assertEqual(image.rois.order_by('id').first(), first_roi)
+        self.assertEqual(Nucleus.objects.count(), 300)
+        self.assertListed(image, True)
+
+    def test_resume_half_written_roi(self):
+        with self.assertRaisesMessage(RuntimeError, 'killed'):
+            self.ingest(fail_at=5, commit='batch')
+        image = Image.objects.get()
+        half_written = image.rois.get(ingested=False)
+        self.assertEqual(half_written.nuclei.count(), 40)
+        self.assertEqual((image.roi_count, image.nucleus_count), (1, 100))
+
+        self.assertEqual(self.ingest(resume=True, commit='batch'), (2, 200))
+        image.refresh_from_db()
+        self.assertFalse(ROI.objects.filter(pk=half_written.pk).exists())
+        self.assertEqual(list(image.rois.values_list('ingested', 'nucleus_count')), [(True, 100)] * 3)
+        self.assertEqual((image.roi_count, image.nucleus_count), (3, 300))
+        self.assertEqual(Nucleus.objects.count(), 300)
+        self.assertEqual(count_rows(spatial.table), 300)
+
+    def test_image_commit(self):
+        # Nothing of the image is kept, so there is nothing to resume.
+        with self.assertRaisesMessage(RuntimeError, 'killed'):
+            self.ingest(fail_at=5, commit='image')
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(ROI.objects.exists())
+
+
+class IngestReportTests(TestCase):
+    """Each ingest run is recorded with its counts and phase timings."""
+
+    def test_report(self):
+        with (
+            synthetic_dir(rois=2, nuclei=100, name='good') as good,
+            synthetic_dir(rois=2, nuclei=100, seed=1, name='bad') as bad,
+            redirect_stdout(io.StringIO()),
+        ):
+            # The first ROI of the bad image fails validation, so none of its nuclei are written.
+            meta_file = sorted((bad / 'nucleiMeta').iterdir())[0]
+            meta_file.write_text(meta_file.read_text().replace('\n1,1,', '\n1,abc,', 1))
+
+            report_file = good.parent / 'report.json'
+            with self.assertRaises(SystemExit) as exit:
+                call_command('ingest', str(good), str(bad), '--profile-report', str(report_file))
+            written = json.loads(report_file.read_text())
+        self.assertEqual(exit.exception.code, 1)
+
+        report = IngestReport.objects.get()
+        self.assertEqual((report.images, report.failed_images, report.rois, report.nuclei), (2, 1, 2, 200))
+        self.assertTrue(report.version)
+        self.assertGreater(report.seconds, 0)
+        phases = {phase['phase']: phase for phase in report.phases}
+        self.assertLessEqual({'validation', 'csv_read', 'type_convert', 'db_write', 'spatial_index'}, phases.keys())
+        self.assertEqual(phases['db_write']['rows'], 200)
+        self.assertEqual(phases['spatial_index']['rows'], 200)
+
+        self.assertEqual(written['phases'], report.phases)
+        self.assertEqual(written['nuclei_per_second'], 200 / report.seconds)
+        self.assertEqual(
+            [(result['name'], result['nuclei'], result['error'] is None) for result in written['results']],
+            [('good', 200, True), ('bad', 0, False)],
+        )
+
+
+class BenchmarkTests(TestCase):
+    """Benchmark results are measured, and compared with a baseline."""
+
+    baseline = {
+        'read_csv[1000]': {'seconds': 1.0, 'peak_mib': 100.0, 'queries': 0},
+        'ingest[1000]': {'seconds': 0.001, 'peak_mib': 10.0, 'queries': 5},
+    }
+
+    def test_regressions(self):
+        results = {
+            # Slower by more than the threshold, and more memory within it.
+            'read_csv[1000]': {'seconds': 1.3, 'peak_mib': 119.0, 'queries': 0},
+            # Four times as slow, but within the slack of small times; more
+            # memory beyond both the threshold and the slack, and a query more.
+            'ingest[1000]': {'seconds': 0.004, 'peak_mib': 27.0, 'queries': 6},
+            # Not in the baseline.
+            'validate_hips_dir[1000]': {'seconds': 100.0, 'peak_mib': None, 'queries': 0},
+        }
+        self.assertEqual(benchmark.find_regressions(results, self.baseline, threshold=0.2), [
+            'read_csv[1000]: seconds 1.300 exceeds 1.200 (baseline 1.000)',
+            'ingest[1000]: peak_mib 27.000 exceeds 26.000 (baseline 10.000)',
+            'ingest[1000]: 6 queries instead of 5',
+        ])
+
+    def test_no_regressions(self):
+        results = {
+            'read_csv[1000]': {'seconds': 1.19, 'peak_mib': None, 'queries': 0},
+            'ingest[1000]': {'seconds': 0.0059, 'peak_mib': 26.0, 'queries': 4},
+        }
+        self.assertEqual(benchmark.find_regressions(results, self.baseline, threshold=0.2), [])
+        # Without a threshold, only the slack is allowed.
+        self.assertEqual(
+            benchmark.find_regressions(results, self.baseline, threshold=0),
+            ['read_csv[1000]: seconds 1.190 exceeds 1.005 (baseline 1.000)'],
+        )
+
+    def test_measure(self):
+        calls = []
+
+        def func():
+            calls.append(Image.objects.count() + ROI.objects.count())
+
+        result = benchmark.measure(func, repeat=3)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(result['queries'], 2)
+        self.assertGreaterEqual(result['seconds'], 0)
+        # Only measured on Linux.
+        self.assertIsInstance(result['peak_mib'], (float, type(None)))
+
+
+class ImageWorkerTests(TransactionTestCase):
+    """Images are ingested at once by worker processes, which take turns writing to the database."""
+
+    def test_image_workers(self):
+        for commit, seeds in (('image', (0, 1)), ('roi', (2, 3))):
+            with ExitStack() as stack, redirect_stdout(io.StringIO()):
+                data_dirs = [
+                    str(stack.enter_context(synthetic_dir(rois=3, nuclei=200, seed=seed, name=f'image{seed}')))
+                    for seed in seeds
+                ]
+                with self.assertRaises(SystemExit) as exit:
+                    call_command('ingest', *data_dirs, '--image-workers', '2', '--commit', commit)
+                self.assertEqual(exit.exception.code, 0)
+
+        self.assertEqual(
+            list(Image.objects.complete().order_by('name').values_list('name', 'roi_count', 'nucleus_count')),
+            [(f'image{seed}', 3, 600) for seed in range(4)],
+        )
+        self.assertFalse(ROI.objects.filter(ingested=False).exists())
+        self.assertEqual(Nucleus.objects.count(), 4 * 600)
@@ -1,10 +1,14 @@
 from typing import List, Optional
+from django.db.models import F, QuerySet
 from django.forms import model_to_dict
 from ninja import ModelSchema, NinjaAPI, Query, Schema
+from ninja.orm import create_schema
 from ninja.pagination import paginate
 from pydantic import ConfigDict, create_model
 
-from hipsdb.models import ROI, Image, Nucleus
+from hipsdb.models import ROI, Image, Nucleus, nucleus_feature_models, nucleus_field_models, nucleus_field_path
+from hipsdb.spatial import nuclei_in_rect
+from hips_etl.utils import get_json_value
 
 
 api = NinjaAPI(
@@ -21,19 +25,19 @@ class ErrorSchema(Schema):
 class ImageSchema(ModelSchema):
     class Meta:
         model = Image
-        fields = "__all__"
+        exclude = ["ingest_state", "source"]
 
 
 @api.get("/images", response=List[ImageSchema])
 def get_images(request):
-    images = Image.objects.all()
+    images = Image.objects.complete()
     return images
 
 
 @api.get("/images/{image_id}", response={200: ImageSchema, 404: ErrorSchema})
 def get_image(request, image_id: int):
     try:
-        image = Image.objects.get(pk=image_id)
+        image = Image.objects.complete().get(pk=image_id)
     except Image.DoesNotExist:
         return 404, {"detail": f"Image {image_id} not found"}
 
@@ -43,24 +47,41 @@ def get_image(request, image_id: int):
 class ROISchema(ModelSchema):
     class Meta:
         model = ROI
-        exclude = ["image"]
+        exclude = ["image", "ingested", "digest"]
 
 
 @api.get("/images/{image_id}/rois", response=List[ROISchema])
 @paginate
 def get_image_rois(request, image_id: int):
     try:
-        image = Image.objects.get(pk=image_id)
+        image = Image.objects.complete().get(pk=image_id)
     except Image.DoesNotExist:
         return 404, {"detail": f"Image {image_id} not found"}
 
-    return image.rois.all()
+    return image.rois.filter(ingested=True)
 
 
-class NucleusSchema(ModelSchema):
-    class Meta:
-        model = Nucleus
-        exclude = ["id", "roi"]
+def make_nucleus_schema() -> type[Schema]:
+    """
+    Combine the schemas of `Nucleus` and its feature models into one.
+
+    The fields are in the order of nucleus_fields.json, as they were when all
+    of them were stored in the nucleus table.
+    """
+    model_fields = {}
+    for model in (Nucleus, *nucleus_feature_models):
+        exclude = ["id", "roi"] if model is Nucleus else ["nucleus"]
+        model_fields.update(create_schema(model, exclude=exclude).model_fields)
+
+    fields = {}
+    for field in get_json_value("nucleus_fields.json"):
+        name = field["django_name"]
+        fields[name] = (model_fields[name].annotation, model_fields[name])
+
+    return create_model("NucleusSchema", __base__=Schema, **fields)
+
+
+NucleusSchema = make_nucleus_schema()
 
 
 def make_optional_schema(schema: ModelSchema):
@@ -77,26 +98,108 @@ def make_optional_schema(schema: ModelSchema):
 OptionalNucleusSchema = make_optional_schema(NucleusSchema)
 
 
+def select_fields(fields: Optional[List[str]]) -> List[str]:
+    """Return the requested nucleus fields that exist, or all of them if none are requested."""
+    nucleus_fields = NucleusSchema.model_fields.keys()
+    if fields:
+        return [f for f in fields if f in nucleus_fields]
+    return list(nucleus_fields)
+
+
+def nucleus_values(nuclei: QuerySet[Nucleus], selected: List[str], *extra: str) -> QuerySet:
+    """
+    Return the selected nucleus fields (and `extra` fields of the nucleus table) as dicts.
+
+    Only the feature tables that store selected fields are joined.
+    """
+    fields = [*(name for name in selected if nucleus_field_models[name] is Nucleus), *extra]
+    features = {name: F(nucleus_field_path(name)) for name in selected if nucleus_field_models[name] is not Nucleus}
+    return nuclei.values(*fields, **features)
+
+
 @api.get("/images/{image_id}/rois/{roi_id}/nuclei", response={200: List[OptionalNucleusSchema], 404: ErrorSchema}, exclude_none=True)
 @paginate
-def get_roi_nuclei(request, image_id: int, roi_id: int, fields: Optional[List[str]] = Query(None)):
+def get_roi_nuclei(
+    request,
+    image_id: int,
+    roi_id: int,
+    fields: Optional[List[str]] = Query(None),
+    standard_class: Optional[str] = None,
+    super_class: Optional[str] = None,
+):
     try:
-        image = Image.objects.get(pk=image_id)
+        image = Image.objects.complete().get(pk=image_id)
     except Image.DoesNotExist:
         return 404, {"detail": f"Image {image_id} not found"}
 
     try:
-        roi = image.rois.get(pk=roi_id)
+        roi = image.rois.filter(ingested=True).get(pk=roi_id)
     except ROI.DoesNotExist:
         return 404, {"detail": f"ROI {roi_id} not found"}
 
     if roi.image != image:
         return 404, {"detail": f"ROI {roi_id} does not belong to Image {image_id}"}
 
-    nucleus_fields = NucleusSchema.model_fields.keys()
-    if fields:
-        selected = [f for f in fields if f in nucleus_fields]
-    else:
-        selected = nucleus_fields
+    selected = select_fields(fields)
+    nuclei = roi.nuclei.all()
+    if standard_class is not None:
+        nuclei = nuclei.filter(Classif_StandardClass=standard_class)
+    if super_class is not None:
+        nuclei = nuclei.filter(Classif_SuperClass=super_class)
+
+    return nucleus_values(nuclei, selected)
+
+
+# Largest number of nuclei a bounding box request may ask for.
+max_bbox_results = 100000
+
+
+class BoxNucleusSchema(OptionalNucleusSchema):
+    roi: int
+
+
+class BoxNucleiSchema(Schema):
+    rois: List[ROISchema]
+    items: List[BoxNucleusSchema]
+    truncated: bool
+
+
+@api.get("/images/{image_id}/nuclei", response={200: BoxNucleiSchema, 400: ErrorSchema, 404: ErrorSchema}, exclude_none=True)
+def get_image_nuclei(
+    request,
+    image_id: int,
+    bbox: str,
+    fields: Optional[List[str]] = Query(None),
+    max_results: int = Query(10000, ge=1, le=max_bbox_results),
+):
+    """
+    Get the nuclei of an image whose bounding box intersects `bbox`.
+
+    `bbox` is `x0,y0,x1,y1` in image coordinates (inclusive). Each nucleus
+    has the ID of its ROI, and the ROIs of the nuclei are included, since
+    nucleus coordinates are relative to their ROI. At most `max_results`
+    nuclei are returned, the first ones by ID; `truncated` tells whether there
+    were more.
+    """
+    try:
+        x0, y0, x1, y1 = (int(value) for value in bbox.split(","))
+    except ValueError:
+        return 400, {"detail": f"bbox must be four integers x0,y0,x1,y1, not {bbox!r}"}
+    if x0 > x1 or y0 > y1:
+        return 400, {"detail": f"bbox {bbox} is empty"}
+
+    try:
+        image = Image.objects.complete().get(pk=image_id)
+    except Image.DoesNotExist:
+        return 404, {"detail": f"Image {image_id} not found"}
+
+    selected = select_fields(fields)
+    # Ordered by ID, so that a truncated result is always the same; the IDs
+    # from the spatial index come sorted, so this adds no sort.
+    nuclei = nuclei_in_rect(image.pk, x0, y0, x1, y1).order_by("id")
+    nuclei = list(nucleus_values(nuclei, selected, "roi")[:max_results + 1])
+    truncated = len(nuclei) > max_results
+    del nuclei[max_results:]
 
-    return roi.nuclei.values(*selected)
+    rois = ROI.objects.filter(pk__in={nucleus["roi"] for nucleus in nuclei}).order_by("id")
+    return {"rois": rois, "items": nuclei, "truncated": truncated}